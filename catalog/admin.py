@@ -1,8 +1,17 @@
-from django.contrib import admin
+import datetime
+
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
+from django.core.paginator import Paginator
+from django.forms.models import BaseInlineFormSet
+from django.template.response import TemplateResponse
 
 # Register your models here.
 
-from .models import Author, Genre, Book, BookInstance, Language
+from .forms import RenewBookForm
+from . import loans
+from .models import Author, Genre, Book, BookInstance, Hold, Language
+from .pagination import EstimatedCountPaginator
 
 """Minimal registration of Models.
 admin.site.register(Book)
@@ -12,13 +21,69 @@ admin.site.register(Genre)
 admin.site.register(Language)
 """
 
-admin.site.register(Genre)
-admin.site.register(Language)
 
 
-class BooksInline(admin.TabularInline):
+@admin.register(Genre)
+class GenreAdmin(admin.ModelAdmin):
+    """Administration object for Genre models (searchable, for the autocomplete widgets of books)."""
+    search_fields = ('name',)
+
+
+@admin.register(Language)
+class LanguageAdmin(admin.ModelAdmin):
+    """Administration object for Language models (searchable, for the autocomplete widgets of books)."""
+    search_fields = ('name',)
+
+
+class PaginatedInlineFormSet(BaseInlineFormSet):
+    """Inline formset showing one page of the related objects (chosen by a '<prefix>-page' GET parameter)."""
+    per_page = 20
+    page_number = None
+
+    @classmethod
+    def page_parameter(cls):
+        return '{0}-page'.format(cls.get_default_prefix())
+
+    def get_queryset(self):
+        if not hasattr(self, '_queryset'):
+            queryset = super().get_queryset()
+            # Add the primary key to the ordering, so that objects ordered alike (e.g. books with the
+            # same title) keep their place from one page to the next.
+            ordering = queryset.query.order_by
+            if not ordering and queryset.query.default_ordering:
+                ordering = queryset.model._meta.ordering
+            self.paginator = Paginator(queryset.order_by(*ordering, 'pk'), self.per_page)
+            self.page = self.paginator.get_page(self.page_number)
+            self._queryset = list(self.page.object_list)
+            # The objects all belong to the parent object, so don't query it again for each one.
+            for obj in self._queryset:
+                self.fk.set_cached_value(obj, self.instance)
+        return self._queryset
+
+
+class PaginatedInlineMixin:
+    """Shows inline objects a page at a time, with a pager below them, so that the change page stays
+    the same size however many related objects there are. Edits are saved for the page shown."""
+    formset = PaginatedInlineFormSet
+    template = 'admin/catalog/edit_inline/paginated_tabular.html'
+    per_page = 20
+
+    def get_formset(self, request, obj=None, **kwargs):
+        formset = super().get_formset(request, obj, **kwargs)
+        # The class is created for this request, so the page can be set on it.
+        formset.per_page = self.per_page
+        formset.page_number = request.GET.get(formset.page_parameter())
+        return formset
+
+
+class BooksInline(PaginatedInlineMixin, admin.TabularInline):
     """Defines format of inline book insertion (used in AuthorAdmin)"""
     model = Book
+    autocomplete_fields = ('language', 'genre')
+
+    def get_queryset(self, request):
+        # The genres of the books shown are loaded in one query (for the genre widgets).
+        return super().get_queryset(request).prefetch_related('genre')
 
 
 @admin.register(Author)
@@ -29,16 +94,21 @@ class AuthorAdmin(admin.ModelAdmin):
      - orders fields in detail view (fields),
        grouping the date fields horizontally
      - adds inline addition of books in author view (inlines)
+     - estimated row counts for large lists (paginator)
     """
     list_display = ('last_name',
                     'first_name', 'date_of_birth', 'date_of_death')
     fields = ['first_name', 'last_name', ('date_of_birth', 'date_of_death')]
+    search_fields = ('last_name', 'first_name')
     inlines = [BooksInline]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
-class BooksInstanceInline(admin.TabularInline):
+class BooksInstanceInline(PaginatedInlineMixin, admin.TabularInline):
     """Defines format of inline book instance insertion (used in BookAdmin)"""
     model = BookInstance
+    autocomplete_fields = ('borrower',)
 
 
 class BookAdmin(admin.ModelAdmin):
@@ -46,9 +116,20 @@ class BookAdmin(admin.ModelAdmin):
     Defines:
      - fields to be displayed in list view (list_display)
      - adds inline addition of book instances in book view (inlines)
+     - estimated row counts for large lists (paginator)
+    The authors and genres of the listed books are loaded in two queries (not one per row).
     """
     list_display = ('title', 'author', 'display_genre')
+    list_select_related = ('author',)
+    search_fields = ('title', 'isbn')
+    autocomplete_fields = ('author', 'language', 'genre')
     inlines = [BooksInstanceInline]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        # display_genre() uses the prefetched genres.
+        return super().get_queryset(request).prefetch_related('genre')
 
 
 admin.site.register(Book, BookAdmin)
@@ -61,9 +142,16 @@ class BookInstanceAdmin(admin.ModelAdmin):
      - fields to be displayed in list view (list_display)
      - filters that will be displayed in sidebar (list_filter)
      - grouping of fields into sections (fieldsets)
+     - renewing or returning many loans at once (actions)
+     - estimated row counts for large lists (paginator)
     """
     list_display = ('book', 'status', 'borrower', 'due_back', 'id')
+    list_select_related = ('book', 'borrower')
     list_filter = ('status', 'due_back')
+    autocomplete_fields = ('book', 'borrower')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ['renew_loans', 'return_loans']
 
     fieldsets = (
         (None, {
@@ -73,3 +161,62 @@ class BookInstanceAdmin(admin.ModelAdmin):
             'fields': ('status', 'due_back', 'borrower')
         }),
     )
+
+    def has_mark_returned_permission(self, request):
+        return request.user.has_perm('catalog.can_mark_returned')
+
+    @admin.action(description='Renew selected loans', permissions=['mark_returned'])
+    def renew_loans(self, request, queryset):
+        """Asks for a renewal date on an intermediate page, then renews the selected loans in one UPDATE."""
+        if 'apply' in request.POST:
+            form = RenewBookForm(request.POST)
+            if form.is_valid():
+                renewed, rejected = BookInstance.objects.renew(queryset.values_list('pk', flat=True),
+                                                               form.cleaned_data['renewal_date'])
+                self.message_user(request, 'Renewed {0} loan{1}.'.format(renewed, '' if renewed == 1 else 's'))
+                if rejected:
+                    self.message_user(request, '{0} selected cop{1} not on loan, so not renewed.'.format(
+                        rejected, 'y was' if rejected == 1 else 'ies were'), messages.WARNING)
+                return None
+        else:
+            form = RenewBookForm(initial={'renewal_date': datetime.date.today() + datetime.timedelta(weeks=3)})
+
+        context = {
+            **self.admin_site.each_context(request),
+            'title': 'Renew loans',
+            'opts': self.model._meta,
+            'form': form,
+            'queryset': queryset,
+            'action_checkbox_name': helpers.ACTION_CHECKBOX_NAME,
+        }
+        return TemplateResponse(request, 'admin/catalog/bookinstance/renew_loans.html', context)
+
+    @admin.action(description='Mark selected loans returned', permissions=['mark_returned'])
+    def return_loans(self, request, queryset):
+        """Returns the selected copies on loan, reserving each for the next hold on its book (see catalog.loans)."""
+        returned = reserved = 0
+        for copy in queryset.on_loan():
+            try:
+                hold = loans.return_copy(copy)
+            except loans.LoanError:
+                # Returned at the same time by someone else.
+                continue
+            returned += 1
+            reserved += hold is not None
+        self.message_user(request, 'Returned {0} loan{1} ({2} reserved for holds).'.format(
+            returned, '' if returned == 1 else 's', reserved))
+
+
+@admin.register(Hold)
+class HoldAdmin(admin.ModelAdmin):
+    """Administration object for Hold models.
+    Defines:
+     - fields to be displayed in list view (list_display)
+     - estimated row counts for large lists (paginator)
+    """
+    list_display = ('book', 'borrower', 'placed_at', 'copy')
+    list_select_related = ('book', 'borrower', 'copy')
+    autocomplete_fields = ('book', 'borrower')
+    raw_id_fields = ('copy',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
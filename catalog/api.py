@@ -0,0 +1,283 @@
+"""A read-only JSON API for the catalog: books (with the availability of their copies), authors and genres.
+
+Rows are read with values(), so no model instances are made, and only the fields a client
+asks for with ?fields= are selected. Related objects are embedded without a query per row:
+to-one relations (a book's author) are joined into the same query, and to-many relations (a
+book's genres or copies, an author's books) are read for the whole page in one more query
+each. Lists are paginated with keyset cursors (see catalog.pagination), and the views add
+ETags (see catalog.conditional), so clients can poll cheaply.
+
+A book embeds at most EMBEDDED_COPIES of its copies (the first due back), so that a book with
+many copies doesn't make a large response: the copies_* counts tell whether there are more,
+and `copies_url` pages through all of them.
+"""
+from collections import defaultdict
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import OuterRef, Subquery
+from django.http import JsonResponse
+from django.urls import reverse
+
+from .models import Author, Book, BookInstance, Genre
+from .pagination import InvalidCursor, KeysetPaginator
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+# How many copies of each book are embedded in it.
+EMBEDDED_COPIES = 20
+
+STATUS_NAMES = dict(BookInstance.LOAN_STATUS)
+
+
+class ToOne:
+    """A related object joined into the rows' query, embedded as an object with the given fields."""
+
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = fields
+
+    def lookups(self):
+        return ['{0}__{1}'.format(self.name, field) for field in self.fields]
+
+    def value(self, row):
+        if row['{0}__id'.format(self.name)] is None:
+            return None
+        return {field: row['{0}__{1}'.format(self.name, field)] for field in self.fields}
+
+
+class Display:
+    """A field with choices, shown by the name of its value."""
+
+    def __init__(self, lookup, names):
+        self.lookup = lookup
+        self.names = names
+
+    def lookups(self):
+        return [self.lookup]
+
+    def value(self, row):
+        return self.names.get(row[self.lookup])
+
+
+class Link:
+    """The URL of a view of the object (given its id)."""
+
+    def __init__(self, url_name):
+        self.url_name = url_name
+
+    def lookups(self):
+        return []
+
+    def value(self, row):
+        return reverse(self.url_name, args=[row['id']])
+
+
+class ToMany:
+    """Related objects read for a page of rows in one query, embedded as a list.
+
+    `pairs(ids)` returns (row id, value) pairs for the rows with the given ids.
+    """
+
+    def __init__(self, pairs):
+        self.pairs = pairs
+
+    def lookups(self):
+        return []
+
+    def values(self, ids):
+        """Returns a dict of the list of values for each of the given row ids."""
+        values = defaultdict(list)
+        for pk, value in self.pairs(ids):
+            values[pk].append(value)
+        return values
+
+
+class Resource:
+    """How the objects of a model are represented in the API.
+
+    `fields` maps each field name to a values() lookup, a ToOne, a ToMany, a Display or a Link. Lists show
+    `list_fields` and single objects `detail_fields` unless ?fields= chooses others.
+    `ordering` is the (unique) ordering of lists, used for their keyset cursors.
+    """
+
+    def __init__(self, queryset, fields, list_fields, detail_fields, ordering):
+        self.queryset = queryset
+        self.fields = fields
+        self.list_fields = list_fields
+        self.detail_fields = detail_fields
+        self.ordering = ordering
+
+    def get_queryset(self):
+        return self.queryset.all()
+
+    def project(self, queryset, names):
+        """Returns `queryset` as values(), selecting just what the named fields (and the ordering) need."""
+        opts = self.queryset.model._meta
+        lookups = {'id'}.union(opts.get_field(name).attname for name in self.ordering)
+        for name in names:
+            field = self.fields[name]
+            lookups.update([field] if isinstance(field, str) else field.lookups())
+        return queryset.values(*lookups)
+
+    def serialize(self, rows, names):
+        """Returns the named fields of `rows` (from project()) as dicts, with their related objects."""
+        related = {name: self.fields[name].values([row['id'] for row in rows])
+                   for name in names if isinstance(self.fields[name], ToMany)}
+        objects = []
+        for row in rows:
+            obj = {}
+            for name in names:
+                field = self.fields[name]
+                if isinstance(field, str):
+                    obj[name] = row[field]
+                elif isinstance(field, ToMany):
+                    obj[name] = related[name].get(row['id'], [])
+                else:
+                    obj[name] = field.value(row)
+            objects.append(obj)
+        return objects
+
+
+def first_per_row(queryset, field, ordering, limit):
+    """Returns the first `limit` objects of `queryset` (in `ordering`) for each value of `field`."""
+    firsts = queryset.filter(**{field: OuterRef(field)}).order_by(*ordering).values('pk')[:limit]
+    return queryset.filter(pk__in=Subquery(firsts))
+
+
+BOOKS = Resource(
+    queryset=Book.objects.all(),
+    fields={
+        'id': 'id',
+        'title': 'title',
+        'summary': 'summary',
+        'isbn': 'isbn',
+        'author': ToOne('author', ('id', 'first_name', 'last_name')),
+        'language': 'language__name',
+        'genre': ToMany(lambda ids: Book.genre.through.objects.filter(book_id__in=ids)
+                        .order_by('genre__name').values_list('book_id', 'genre__name')),
+        'copies_total': 'copies_total',
+        'copies_available': 'copies_available',
+        'copies_on_loan': 'copies_on_loan',
+        'copies': ToMany(lambda ids: (
+            (book_id, {'id': pk, 'status': STATUS_NAMES.get(status), 'due_back': due_back, 'imprint': imprint})
+            for book_id, pk, status, due_back, imprint
+            in first_per_row(BookInstance.objects.filter(book_id__in=ids), 'book_id', ('due_back', 'id'),
+                             EMBEDDED_COPIES)
+            .order_by('due_back', 'id').values_list('book_id', 'id', 'status', 'due_back', 'imprint'))),
+        'copies_url': Link('api-book-copies'),
+        'updated_at': 'updated_at',
+    },
+    list_fields=('id', 'title', 'author', 'language', 'genre', 'isbn', 'copies_total', 'copies_available'),
+    detail_fields=('id', 'title', 'summary', 'isbn', 'author', 'language', 'genre', 'copies_total',
+                   'copies_available', 'copies_on_loan', 'copies', 'copies_url', 'updated_at'),
+    ordering=('title', 'author', 'id'),
+)
+
+AUTHORS = Resource(
+    queryset=Author.objects.all(),
+    fields={
+        'id': 'id',
+        'first_name': 'first_name',
+        'last_name': 'last_name',
+        'date_of_birth': 'date_of_birth',
+        'date_of_death': 'date_of_death',
+        'books': ToMany(lambda ids: (
+            (author_id, {'id': pk, 'title': title})
+            for author_id, pk, title in Book.objects.filter(author_id__in=ids)
+            .order_by('title', 'id').values_list('author_id', 'id', 'title'))),
+        'updated_at': 'updated_at',
+    },
+    list_fields=('id', 'first_name', 'last_name', 'date_of_birth', 'date_of_death'),
+    detail_fields=('id', 'first_name', 'last_name', 'date_of_birth', 'date_of_death', 'books', 'updated_at'),
+    ordering=('last_name', 'first_name', 'id'),
+)
+
+COPIES = Resource(
+    queryset=BookInstance.objects.all(),
+    fields={
+        'id': 'id',
+        'status': Display('status', STATUS_NAMES),
+        'due_back': 'due_back',
+        'imprint': 'imprint',
+    },
+    list_fields=('id', 'status', 'due_back', 'imprint'),
+    detail_fields=('id', 'status', 'due_back', 'imprint'),
+    ordering=('due_back', 'id'),
+)
+
+GENRES = Resource(
+    queryset=Genre.objects.all(),
+    fields={'id': 'id', 'name': 'name'},
+    list_fields=('id', 'name'),
+    detail_fields=('id', 'name'),
+    ordering=('name', 'id'),
+)
+
+
+class BadRequest(Exception):
+    """Raised for invalid query parameters (with the message for the client)."""
+
+
+def json_response(data, status=200):
+    return JsonResponse(data, status=status, encoder=DjangoJSONEncoder,
+                        json_dumps_params={'separators': (',', ':')})
+
+
+def requested_fields(request, resource, default):
+    """Returns the field names in the ?fields= parameter (or `default`), raising BadRequest for unknown ones."""
+    if not request.GET.get('fields'):
+        return default
+    names = [name for name in request.GET['fields'].split(',') if name]
+    unknown = [name for name in names if name not in resource.fields]
+    if unknown:
+        raise BadRequest('Unknown fields: {0}.'.format(', '.join(unknown)))
+    return names
+
+
+def requested_limit(request):
+    try:
+        limit = int(request.GET.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise BadRequest('The limit must be a number.')
+    if not 1 <= limit <= MAX_LIMIT:
+        raise BadRequest('The limit must be between 1 and {0}.'.format(MAX_LIMIT))
+    return limit
+
+
+def page_url(request, cursor):
+    """Returns the URL of the page with the given cursor (None if there is none), keeping the other parameters."""
+    if cursor is None:
+        return None
+    query = request.GET.copy()
+    query['cursor'] = cursor
+    return '{0}?{1}'.format(request.path, query.urlencode())
+
+
+def list_response(request, resource, queryset):
+    """Returns the JSON response for a page of `queryset` (the resource's objects)."""
+    try:
+        names = requested_fields(request, resource, resource.list_fields)
+        paginator = KeysetPaginator(resource.project(queryset, names), requested_limit(request), resource.ordering)
+        page = paginator.page(request.GET.get('cursor', ''))
+    except BadRequest as error:
+        return json_response({'error': str(error)}, status=400)
+    except InvalidCursor:
+        return json_response({'error': 'Invalid cursor.'}, status=400)
+    return json_response({
+        'results': resource.serialize(page.object_list, names),
+        'next': page_url(request, page.next_cursor),
+        'previous': page_url(request, page.previous_cursor),
+    })
+
+
+def detail_response(request, resource, queryset, pk):
+    """Returns the JSON response for the object of `queryset` with primary key `pk`."""
+    try:
+        names = requested_fields(request, resource, resource.detail_fields)
+    except BadRequest as error:
+        return json_response({'error': str(error)}, status=400)
+    rows = list(resource.project(queryset.filter(pk=pk), names))
+    if not rows:
+        return json_response({'error': 'Not found.'}, status=404)
+    return json_response(resource.serialize(rows, names)[0])
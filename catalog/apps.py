@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class CatalogConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'catalog'
+
+    def ready(self):
+        # Connect the signal handlers that maintain denormalized data (and tune SQLite connections).
+        from . import cache, conditional, search, sqlite, stats  # noqa: F401
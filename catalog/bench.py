@@ -0,0 +1,321 @@
+"""Helpers shared by the benchmark management commands (the bench_* commands).
+
+Benchmarks run against a throwaway test database, created and destroyed in
+the same way as by `manage.py test`, so they never touch real data.
+
+The view benchmark (bench_views) and the query budget tests also use the
+helpers at the end of this module, which request every URL of the catalog as
+each kind of user and compare the numbers of queries with stored budgets.
+"""
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from contextlib import ExitStack, contextmanager
+from unittest import mock
+
+from django.db import connection
+from django.test.utils import (
+    CaptureQueriesContext, setup_databases, setup_test_environment, teardown_databases,
+    teardown_test_environment,
+)
+
+
+@contextmanager
+def test_database(verbosity=0, in_file=False):
+    """Runs the enclosed code against a newly created test database.
+
+    With `in_file`, a SQLite test database is created in a temporary file rather than in memory,
+    so that other processes can share it.
+    """
+    with ExitStack() as stack:
+        if in_file and connection.vendor == 'sqlite':
+            directory = stack.enter_context(tempfile.TemporaryDirectory())
+            stack.enter_context(mock.patch.dict(connection.settings_dict['TEST'],
+                                                {'NAME': os.path.join(directory, 'bench.sqlite3')}))
+        setup_test_environment()
+        old_config = setup_databases(verbosity=verbosity, interactive=False, aliases={'default'})
+        try:
+            yield
+        finally:
+            teardown_databases(old_config, verbosity=verbosity)
+            teardown_test_environment()
+
+
+@contextmanager
+def measure():
+    """Measures the enclosed code, yielding a dict filled with its 'seconds' and executed 'queries' on exit."""
+    result = {}
+    with CaptureQueriesContext(connection) as queries:
+        start = time.perf_counter()
+        yield result
+        result['seconds'] = time.perf_counter() - start
+    result['queries'] = [query['sql'] for query in queries.captured_queries]
+
+
+def count_writes(queries):
+    """Returns how many of the given SQL statements write to the database."""
+    return sum(sql.lstrip().split(None, 1)[0].upper() in ('INSERT', 'UPDATE', 'DELETE') for sql in queries)
+
+
+def seed_books(number_of_books, books_per_author=10, batch_size=5000, first=0):
+    """Bulk creates `number_of_books` books (with an author for every `books_per_author`) and returns the ids of all books.
+
+    Books are numbered from `first`, so that more can be added later without clashing ISBNs.
+    """
+    from .models import Author, Book
+
+    authors = Author.objects.bulk_create(
+        [Author(first_name='First {0}'.format(number), last_name='Last {0:07}'.format(number))
+         for number in range(first // books_per_author, first // books_per_author
+                             + max(1, number_of_books // books_per_author))], batch_size=batch_size)
+    author_ids = list(Author.objects.order_by('-id').values_list('id', flat=True)[:len(authors)])
+    for start in range(first, first + number_of_books, batch_size):
+        Book.objects.bulk_create(
+            [Book(title='Book {0:08}'.format(number), summary='Summary of book {0}'.format(number),
+                  isbn='{0:013}'.format(number), author_id=author_ids[number % len(author_ids)])
+             for number in range(start, min(start + batch_size, first + number_of_books))], batch_size=batch_size)
+    return list(Book.objects.values_list('id', flat=True))
+
+
+def seed_users(number_of_users, prefix='reader'):
+    """Bulk creates `number_of_users` users (who can't log in) and returns their ids."""
+    from django.contrib.auth.models import User
+
+    User.objects.bulk_create([User(username='{0}{1}'.format(prefix, number), password='!')
+                              for number in range(number_of_users)], batch_size=5000)
+    return list(User.objects.filter(username__startswith=prefix).values_list('id', flat=True))
+
+
+def seed_copies(number_of_copies, book_ids, borrower_ids, batch_size=10000, seed=0):
+    """Bulk creates `number_of_copies` copies of the given books.
+
+    About a third of the copies are on loan to one of `borrower_ids`, due within a couple of
+    months of today (some of them overdue); the rest are available, reserved or in maintenance.
+    """
+    import datetime
+    import random
+
+    from .models import BookInstance
+
+    rng = random.Random(seed)
+    today = datetime.date.today()
+    for start in range(0, number_of_copies, batch_size):
+        copies = []
+        for number in range(start, min(start + batch_size, number_of_copies)):
+            status = rng.choice('oooaaaard')
+            copies.append(BookInstance(
+                book_id=book_ids[number % len(book_ids)], imprint='Imprint {0}'.format(number % 100),
+                status=status,
+                due_back=today + datetime.timedelta(days=rng.randint(-30, 60)) if status in 'or' else None,
+                borrower_id=rng.choice(borrower_ids) if status in 'or' else None))
+        BookInstance.objects.bulk_create(copies, batch_size=batch_size)
+
+
+# Requesting pages from the WSGI and ASGI applications directly (for bench_asgi, bench_startup and bench_api).
+
+def wsgi_request(application, path, host='testserver'):
+    """Requests `path` (which may include a query string) from a WSGI application, returning the status code and body."""
+    path, _, query_string = path.partition('?')
+    environ = {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query_string, 'SCRIPT_NAME': '',
+        'SERVER_NAME': host, 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+        'wsgi.url_scheme': 'http', 'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr,
+    }
+    statuses = []
+    response = application(environ, lambda status, headers: statuses.append(status))
+    try:
+        body = b''.join(response)
+    finally:
+        response.close()
+    return int(statuses[0].split()[0]), body
+
+
+def wsgi_get(application, path, host='testserver'):
+    """Requests `path` from a WSGI application, returning the status code."""
+    return wsgi_request(application, path, host)[0]
+
+
+async def asgi_get(application, path):
+    """Requests `path` from an ASGI application, returning the status code."""
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+        'headers': [(b'host', b'testserver')], 'server': ('testserver', 80), 'client': ('127.0.0.1', 1234),
+    }
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    await application(scope, receive, send)
+    return messages[0]['status']
+
+
+# Requesting every catalog URL as each kind of user (for bench_views and the query budget tests).
+
+ROLES = ('anonymous', 'borrower', 'librarian')
+
+# The object whose primary key is passed to each URL that takes one.
+URL_OBJECTS = {
+    'book-detail': 'book', 'book-update': 'book', 'book-delete': 'book',
+    'author-detail': 'author', 'author-update': 'author', 'author-delete': 'author',
+    'renew-book-librarian': 'copy', 'return-book-librarian': 'copy',
+    'checkout-book-librarian': 'book', 'reserve-book': 'book',
+    'api-book-detail': 'book', 'api-book-copies': 'book', 'api-author-detail': 'author',
+}
+QUERY_STRINGS = {'search': 'q=Book', 'renew-books-librarian': 'copies={copy.pk}'}
+
+# Views whose number of queries is expected to grow with the data (exports read the rows in chunks).
+SCALES_WITH_DATA = ('export',)
+
+BUDGETS_FILE = os.path.join(os.path.dirname(__file__), 'tests', 'query_budgets.json')
+
+
+def seed_library(number_of_books, first=0):
+    """Adds `number_of_books` books to the library, with three copies each, and returns the users for each role.
+
+    The borrower gets two more loans each time (one of them overdue), and the librarian can
+    mark books returned. Call again with `first` past the books already added to grow the library.
+    """
+    import datetime
+
+    from django.contrib.auth.models import Permission, User
+
+    from .models import BookInstance
+
+    book_ids = seed_books(number_of_books, first=first)
+    borrower_ids = seed_users(max(1, number_of_books // 10), prefix='reader{0}-'.format(first))
+    seed_copies(number_of_books * 3, book_ids, borrower_ids, seed=first)
+
+    borrower, created = User.objects.get_or_create(username='borrower')
+    librarian, created = User.objects.get_or_create(username='librarian', defaults={'is_staff': True})
+    if created:
+        librarian.user_permissions.add(Permission.objects.get(codename='can_mark_returned'))
+    today = datetime.date.today()
+    for days in (-3, 14):
+        BookInstance.objects.create(book_id=book_ids[0], imprint='Imprint', status='o', borrower=borrower,
+                                    due_back=today + datetime.timedelta(days=days))
+    return {'anonymous': None, 'borrower': borrower, 'librarian': librarian}
+
+
+def catalog_requests():
+    """Returns (label, path) pairs for a GET request to each URL in catalog.urls.
+
+    URLs that take arguments are given those of objects in the seeded library (see URL_OBJECTS);
+    a URL this doesn't know how to request raises LookupError, so new URLs can't be missed.
+    """
+    from django.urls import reverse
+
+    from . import urls
+    from .exports import EXPORTS, FORMATS
+    from .models import Book, BookInstance
+
+    copy = BookInstance.objects.on_loan().filter(borrower__username='borrower').order_by('due_back').first()
+    book = Book.objects.select_related('author').get(pk=copy.book_id)
+    objects = {'book': book, 'author': book.author, 'copy': copy}
+
+    requests = []
+    for pattern in urls.urlpatterns:
+        name = pattern.name
+        if name == 'export':
+            for export in EXPORTS:
+                for format in FORMATS:
+                    requests.append(('export:{0}.{1}'.format(export, format),
+                                     reverse(name, kwargs={'name': export, 'format': format})))
+            continue
+        if name in URL_OBJECTS:
+            path = reverse(name, kwargs={'pk': objects[URL_OBJECTS[name]].pk})
+        elif not pattern.pattern.converters:
+            path = reverse(name)
+        else:
+            raise LookupError("Don't know the arguments for URL '{0}' (add it to URL_OBJECTS).".format(name))
+        if name in QUERY_STRINGS:
+            path += '?' + QUERY_STRINGS[name].format(**objects)
+        requests.append((name, path))
+    return requests
+
+
+def measure_requests(users, repeat=1):
+    """Requests each catalog URL as each of the given users (a dict of role to user, or None for anonymous).
+
+    Returns a dict of role to a dict of request label to the response's status code, number
+    of queries, and fastest time in seconds. Caches are cleared before each request, so that
+    the database queries are always counted.
+    """
+    import logging
+
+    from django.core.cache import cache
+    from django.test import Client
+
+    from . import visits
+
+    requests = catalog_requests()
+    results = {}
+    # Don't log the expected "403 Forbidden" responses.
+    logger = logging.getLogger('django.request')
+    level = logger.level
+    logger.setLevel(logging.ERROR)
+    for role, user in users.items():
+        client = Client()
+        if user is not None:
+            client.force_login(user)
+        results[role] = {}
+        for label, path in requests:
+            timings = []
+            for attempt in range(repeat):
+                cache.clear()
+                visits.counter.flush()
+                with measure() as result:
+                    response = client.get(path)
+                    if response.streaming:
+                        b''.join(response.streaming_content)
+                timings.append(result['seconds'])
+            results[role][label] = {'status': response.status_code, 'queries': len(result['queries']),
+                                    'seconds': min(timings)}
+    logger.setLevel(level)
+    return results
+
+
+def load_budgets(path=BUDGETS_FILE):
+    """Returns the stored query budgets: a dict of role to a dict of request label to the most queries allowed."""
+    with open(path) as budgets_file:
+        return json.load(budgets_file)
+
+
+def save_budgets(results, path=BUDGETS_FILE):
+    """Stores the numbers of queries in `results` (from measure_requests) as the query budgets."""
+    budgets = {role: {label: result['queries'] for label, result in sorted(role_results.items())}
+               for role, role_results in results.items()}
+    with open(path, 'w') as budgets_file:
+        json.dump(budgets, budgets_file, indent=2)
+        budgets_file.write('\n')
+
+
+def check_results(results, budgets, larger_results=None):
+    """Returns a list of problems with `results`: requests that failed, exceeded their budget, or have no budget.
+
+    With `larger_results` (the results for a larger library), also requests whose number of
+    queries grew with the data (other than SCALES_WITH_DATA).
+    """
+    problems = []
+    for role, role_results in results.items():
+        for label, result in role_results.items():
+            if result['status'] not in (200, 302, 403):
+                problems.append('{0} {1}: status {2}'.format(role, label, result['status']))
+            budget = budgets.get(role, {}).get(label)
+            if budget is None:
+                problems.append('{0} {1}: no query budget'.format(role, label))
+            elif result['queries'] > budget:
+                problems.append('{0} {1}: {2} queries (budget {3})'.format(role, label, result['queries'], budget))
+            if larger_results is not None and label.split(':')[0] not in SCALES_WITH_DATA:
+                larger = larger_results[role][label]['queries']
+                if larger > result['queries']:
+                    problems.append('{0} {1}: {2} queries, but {3} with more data'.format(
+                        role, label, result['queries'], larger))
+    return problems
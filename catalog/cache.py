@@ -0,0 +1,198 @@
+"""Cache the rendered content of book and author detail pages.
+
+Each book and author has a version number in the cache, and its pages are
+cached under keys that include that version. Any change that affects what a
+page shows (to the object itself, or to its author, genres, language or copies)
+bumps the version from model signals, so the old pages are simply never
+looked up again and expire on their own. Bulk writes are followed using the
+signals sent by CatalogQuerySet.
+
+The cache hit rate is counted in the cache too, and reported by
+`manage.py cache_stats`.
+
+This needs a cache shared by all processes (such as Redis) when the site runs
+in more than one process, or other processes would not see version bumps: so
+pages are only cached when the CATALOG_PAGE_CACHE setting is on, which it is by
+default only when REDIS_URL is set.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, models, transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .models import Author, Book, BookInstance, Genre, Language
+from .signals import bulk_created, bulk_updated, copy_counts_rebuilt
+
+KEY_PREFIX = 'catalog:'
+HITS_KEY = KEY_PREFIX + 'stats:hits'
+MISSES_KEY = KEY_PREFIX + 'stats:misses'
+
+
+def version_key(model, pk):
+    return '{0}version:{1}:{2}'.format(KEY_PREFIX, model._meta.model_name, pk)
+
+
+def get_version(model, pk):
+    """Returns the current cache version of the object of `model` with primary key `pk`."""
+    key = version_key(model, pk)
+    version = cache.get(key)
+    if version is None:
+        # Start from the current time, so that a version lost from the cache is never reused.
+        cache.add(key, time.time_ns() // 1000, timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_versions(model, pks):
+    """Gives the objects of `model` with the given primary keys new cache versions."""
+    pks = {pk for pk in map(primary_key, pks) if pk is not None}
+    if pks:
+        _bump(model, pks)
+        if connection.in_atomic_block:
+            # Bump again once the change is committed: until then other requests still see the
+            # old data, and may have cached it under the new version.
+            transaction.on_commit(lambda: _bump(model, pks))
+
+
+def _bump(model, pks):
+    for pk in pks:
+        try:
+            cache.incr(version_key(model, pk))
+        except ValueError:
+            # No version yet, so nothing cached for this object.
+            pass
+
+
+def primary_key(value):
+    """Returns the primary key given either a primary key or a model instance (or None for anything else)."""
+    if isinstance(value, models.Model):
+        return value.pk
+    if isinstance(value, models.expressions.Combinable):
+        return None
+    return value
+
+
+def page_key(model, pk, *parts):
+    """Returns the cache key for a page of object `pk` of `model`, varying on `parts` (e.g. the page number)."""
+    return '{0}page:{1}:{2}:{3}:{4}'.format(
+        KEY_PREFIX, model._meta.model_name, pk, get_version(model, pk), ':'.join(str(part) for part in parts))
+
+
+def get_page(key):
+    """Returns the content cached under `key` (or None), counting the hit or miss."""
+    content = cache.get(key)
+    count(HITS_KEY if content is not None else MISSES_KEY)
+    return content
+
+
+def set_page(key, content):
+    cache.set(key, content, getattr(settings, 'CATALOG_CACHE_TIMEOUT', 3600))
+
+
+def count(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def cache_stats():
+    """Returns the number of page cache hits and misses, and the hit rate."""
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    return {'hits': hits, 'misses': misses, 'hit_rate': hits / (hits + misses) if hits + misses else None}
+
+
+def reset_cache_stats():
+    cache.delete_many([HITS_KEY, MISSES_KEY])
+
+
+def bump_books(book_ids):
+    """Bumps the versions of the given books and of their authors (whose pages list the books)."""
+    book_ids = {pk for pk in map(primary_key, book_ids) if pk is not None}
+    if book_ids:
+        bump_versions(Book, book_ids)
+        bump_versions(Author, Book.objects.filter(pk__in=book_ids).values_list('author_id', flat=True))
+
+
+def bump_authors(author_ids):
+    """Bumps the versions of the given authors and of their books (whose pages show the author)."""
+    author_ids = {pk for pk in map(primary_key, author_ids) if pk is not None}
+    if author_ids:
+        bump_versions(Author, author_ids)
+        bump_versions(Book, Book.objects.filter(author__in=author_ids).values_list('pk', flat=True))
+
+
+# Signal handlers bumping the versions of the pages affected by each change.
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def book_changed(sender, instance, **kwargs):
+    bump_versions(Book, [instance.pk])
+    bump_versions(Author, [instance.author_id, instance.loaded_value('author_id')])
+
+
+@receiver(m2m_changed, sender=Book.genre.through)
+def book_genres_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove', 'pre_clear'):
+        if not reverse:
+            bump_versions(Book, [instance.pk])
+        elif pk_set:
+            bump_versions(Book, pk_set)
+        else:
+            bump_versions(Book, instance.book_set.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Author)
+@receiver(pre_delete, sender=Author)
+def author_changed(sender, instance, **kwargs):
+    bump_authors([instance.pk])
+
+
+@receiver(post_save, sender=Genre)
+@receiver(pre_delete, sender=Genre)
+@receiver(post_save, sender=Language)
+@receiver(pre_delete, sender=Language)
+def book_names_changed(sender, instance, **kwargs):
+    bump_versions(Book, instance.book_set.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=BookInstance)
+@receiver(post_delete, sender=BookInstance)
+def bookinstance_changed(sender, instance, **kwargs):
+    bump_books([instance.book_id, instance.loaded_value('book_id')])
+
+
+@receiver(bulk_created, sender=Book)
+def books_bulk_created(sender, objs, **kwargs):
+    bump_versions(Author, [obj.author_id for obj in objs])
+
+
+@receiver(bulk_created, sender=BookInstance)
+def bookinstances_bulk_created(sender, objs, **kwargs):
+    bump_books([obj.book_id for obj in objs])
+
+
+@receiver(copy_counts_rebuilt, sender=Book)
+def copy_counts_changed(sender, book_ids, **kwargs):
+    bump_books(book_ids)
+
+
+@receiver(bulk_updated)
+def bulk_updated_changed(sender, values, rows, **kwargs):
+    if rows is None:
+        return
+    pks = [row['pk'] for row in rows]
+    if sender is Book:
+        bump_versions(Book, pks)
+        bump_versions(Author, [row.get('author') for row in rows] + [values.get('author')])
+        bump_versions(Author, Book.objects.filter(pk__in=pks).values_list('author_id', flat=True))
+    elif sender is Author:
+        bump_authors(pks)
+    elif sender is BookInstance:
+        bump_books([row.get('book') for row in rows] + [values.get('book')]
+                   + list(BookInstance.objects.filter(pk__in=pks).values_list('book_id', flat=True)))
@@ -0,0 +1,174 @@
+"""HTTP conditional GET (ETag and Last-Modified) for the catalog pages.
+
+Books and authors have an `updated_at` time, which is moved on whenever anything
+shown on their pages changes: a change to a copy touches its book and the book's
+author, a change to an author, genre or language touches the books that show it,
+and a change to a book touches its author. So a book or author page only needs its
+own `updated_at` to check whether a client's copy is still fresh, and the list
+pages need the latest `updated_at` and the number of rows (to notice deletions).
+
+Pages include the sidebar of the logged-in user, so the ETag includes the user and
+responses vary on the cookie.
+"""
+import datetime
+import hashlib
+
+from django.db.models import Max
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from django.views.decorators.vary import vary_on_cookie
+
+from .cache import primary_key
+from .models import Author, Book, BookInstance, Genre, Language, LibraryStats
+from .signals import bulk_created, bulk_updated, copy_counts_rebuilt
+
+
+def touch(model, pks):
+    """Sets the `updated_at` of the objects of `model` with the given primary keys to now."""
+    pks = {pk for pk in map(primary_key, pks) if pk is not None}
+    if pks:
+        model.objects.filter(pk__in=pks).update(updated_at=timezone.now())
+
+
+def touch_books(book_ids):
+    """Touches the given books and their authors (whose pages list the books).
+
+    The authors are touched first, in the same order as when an author changes (the author's
+    row, then its books' rows), so that concurrent transactions don't lock them in opposite orders.
+    """
+    book_ids = {pk for pk in map(primary_key, book_ids) if pk is not None}
+    if book_ids:
+        touch(Author, Book.objects.filter(pk__in=book_ids).values_list('author_id', flat=True))
+        touch(Book, book_ids)
+
+
+def touch_author_books(author_ids):
+    """Touches the books of the given authors (whose pages show the author)."""
+    author_ids = {pk for pk in map(primary_key, author_ids) if pk is not None}
+    if author_ids:
+        touch(Book, Book.objects.filter(author__in=author_ids).values_list('pk', flat=True))
+
+
+# Functions returning the values a page depends on (or None if there is no such page).
+
+def book_detail_values(pk):
+    return Book.objects.filter(pk=pk).values_list('updated_at', flat=True).order_by()[:1] or None
+
+
+def author_detail_values(pk):
+    return Author.objects.filter(pk=pk).values_list('updated_at', flat=True).order_by()[:1] or None
+
+
+def book_list_values():
+    return [Book.objects.aggregate(Max('updated_at'))['updated_at__max'], LibraryStats.load().num_books]
+
+
+def author_list_values():
+    return [Author.objects.aggregate(Max('updated_at'))['updated_at__max'], LibraryStats.load().num_authors]
+
+
+def genre_list_values():
+    # Genres have no `updated_at`, but there are few of them.
+    return list(Genre.objects.order_by('pk').values_list('pk', 'name'))
+
+
+def conditional_page(page_values):
+    """Returns a decorator for the `dispatch` method of a class-based view, adding an ETag and
+    Last-Modified to its responses and answering conditional requests with "304 Not Modified".
+
+    `page_values(**kwargs)` is called with the view's URL keyword arguments, and returns the
+    values the page depends on: their latest datetime is the Last-Modified time, and the ETag is
+    a hash of them, the full path (including the page) and the user.
+    """
+    def validators(request, **kwargs):
+        if not hasattr(request, '_catalog_validators'):
+            values = page_values(**kwargs)
+            if values is None:
+                request._catalog_validators = (None, None)
+            else:
+                values = list(values)
+                key = repr((request.get_full_path(), values, request.user.pk))
+                times = [value for value in values if isinstance(value, datetime.datetime)]
+                request._catalog_validators = (hashlib.sha1(key.encode()).hexdigest(),
+                                               max(times) if times else None)
+        return request._catalog_validators
+
+    return method_decorator([
+        vary_on_cookie,
+        condition(etag_func=lambda request, *args, **kwargs: validators(request, **kwargs)[0],
+                  last_modified_func=lambda request, *args, **kwargs: validators(request, **kwargs)[1]),
+    ], name='dispatch')
+
+
+# Signal handlers touching the books and authors whose pages show each change.
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def book_changed(sender, instance, **kwargs):
+    touch(Author, [instance.author_id, instance.loaded_value('author_id')])
+
+
+@receiver(m2m_changed, sender=Book.genre.through)
+def book_genres_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove', 'pre_clear'):
+        if not reverse:
+            touch(Book, [instance.pk])
+        elif pk_set:
+            touch(Book, pk_set)
+        else:
+            touch(Book, instance.book_set.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Author)
+@receiver(pre_delete, sender=Author)
+def author_changed(sender, instance, **kwargs):
+    touch_author_books([instance.pk])
+
+
+@receiver(post_save, sender=Genre)
+@receiver(pre_delete, sender=Genre)
+@receiver(post_save, sender=Language)
+@receiver(pre_delete, sender=Language)
+def book_names_changed(sender, instance, **kwargs):
+    touch(Book, instance.book_set.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=BookInstance)
+@receiver(post_delete, sender=BookInstance)
+def bookinstance_changed(sender, instance, **kwargs):
+    touch_books([instance.book_id, instance.loaded_value('book_id')])
+
+
+@receiver(bulk_created, sender=Book)
+def books_bulk_created(sender, objs, **kwargs):
+    touch(Author, [obj.author_id for obj in objs])
+
+
+@receiver(bulk_created, sender=BookInstance)
+def bookinstances_bulk_created(sender, objs, **kwargs):
+    touch_books([obj.book_id for obj in objs])
+
+
+@receiver(copy_counts_rebuilt, sender=Book)
+def copy_counts_changed(sender, book_ids, **kwargs):
+    # The books themselves were touched by the update() correcting their counts.
+    touch(Author, Book.objects.filter(pk__in=book_ids).values_list('author_id', flat=True))
+
+
+@receiver(bulk_updated)
+def bulk_updated_changed(sender, values, rows, **kwargs):
+    if rows is None:
+        # Only untracked fields changed (such as `updated_at`, when touching).
+        return
+    pks = [row['pk'] for row in rows]
+    if sender is Book:
+        touch(Author, [row.get('author') for row in rows] + [values.get('author')]
+              + list(Book.objects.filter(pk__in=pks).values_list('author_id', flat=True)))
+    elif sender is Author:
+        touch_author_books(pks)
+    elif sender is BookInstance:
+        touch_books([row.get('book') for row in rows] + [values.get('book')]
+                    + list(BookInstance.objects.filter(pk__in=pks).values_list('book_id', flat=True)))
@@ -0,0 +1,56 @@
+"""Streaming exports of the catalog and of loans, as CSV or JSON Lines.
+
+Rows are read with values() (no model instances) through QuerySet.iterator(),
+which fetches them from the database a chunk at a time, and are written out one
+line at a time. Memory use therefore stays flat however large the table is.
+"""
+import csv
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Book, BookInstance
+
+# The querysets and fields of each export.
+EXPORTS = {
+    'books': (lambda: Book.objects.all(),
+              ('id', 'title', 'isbn', 'summary', 'author__first_name', 'author__last_name', 'language__name')),
+    'loans': (lambda: BookInstance.objects.on_loan(),
+              ('id', 'book__isbn', 'book__title', 'imprint', 'status', 'due_back', 'borrower__username')),
+}
+
+FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+CHUNK_SIZE = 2000
+
+
+class Echo:
+    """A file-like object that returns what is written to it (so csv.writer can produce single lines)."""
+
+    def write(self, value):
+        return value
+
+
+def export_rows(name, chunk_size=CHUNK_SIZE):
+    """Yields the rows of export `name` as dicts."""
+    get_queryset, fields = EXPORTS[name]
+    return get_queryset().order_by('pk').values(*fields).iterator(chunk_size=chunk_size)
+
+
+def export_lines(name, format, chunk_size=CHUNK_SIZE):
+    """Yields the lines of export `name` in `format` ('csv' or 'jsonl')."""
+    fields = EXPORTS[name][1]
+    rows = export_rows(name, chunk_size)
+    if format == 'csv':
+        writer = csv.writer(Echo())
+        yield writer.writerow(fields)
+        for row in rows:
+            yield writer.writerow([row[field] for field in fields])
+    elif format == 'jsonl':
+        encoder = DjangoJSONEncoder(separators=(',', ':'))
+        for row in rows:
+            yield encoder.encode(row) + '\n'
+    else:
+        raise ValueError('Unknown export format: {0}'.format(format))
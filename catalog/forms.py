@@ -23,3 +23,28 @@ class RenewBookForm(forms.Form):
 
         # Remember to always return the cleaned data.
         return data
+
+
+from django.contrib.auth.models import User
+
+
+class CheckoutForm(forms.Form):
+    """Form for a librarian to lend a copy of a book."""
+    borrower = forms.CharField(help_text="Enter the borrower's username.")
+    due_back = forms.DateField(help_text="Enter a date between now and 4 weeks (default 3).")
+
+    def clean_borrower(self):
+        try:
+            return User.objects.get(username=self.cleaned_data['borrower'])
+        except User.DoesNotExist:
+            raise ValidationError(_('Invalid borrower - no such user'))
+
+    def clean_due_back(self):
+        data = self.cleaned_data['due_back']
+
+        # The same range as for renewals.
+        if data < datetime.date.today():
+            raise ValidationError(_('Invalid date - due date in past'))
+        if data > datetime.date.today() + datetime.timedelta(weeks=4):
+            raise ValidationError(_('Invalid date - due date more than 4 weeks ahead'))
+        return data
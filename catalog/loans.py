@@ -0,0 +1,151 @@
+"""Checking copies out, returning them, and the queue of holds for each book.
+
+Several librarians may lend copies of the same book at once, so a copy is claimed
+with a conditional UPDATE ("lend it if it's still available"): of two desks
+claiming the same copy, the second changes no rows and tries the next copy. On
+databases with row locks (PostgreSQL), the candidate copies are first locked with
+SELECT ... FOR UPDATE SKIP LOCKED, so that desks lending copies of the same book
+at the same time each take a different copy rather than queueing for the same one.
+The change to the copy still updates rows shared by all the desks in the same
+transaction (the book's copy counts and `updated_at`, its author's `updated_at`
+and the LibraryStats counters, from model signals), so concurrent checkouts do
+wait for one another's commit there. (SQLite has no row locks and ignores FOR
+UPDATE, but a transaction that writes locks the whole database, and the
+conditional UPDATE keeps it correct anyway.)
+
+Borrowers can place a hold on a book (see Hold). Holds are served first come,
+first served: a returned copy is reserved for the first waiting hold, and is
+only lent to that borrower. A reserved copy that isn't collected within
+COLLECTION_PERIOD is passed on to the next hold by expire_reservations() (run
+daily with `manage.py expire_reservations`).
+"""
+import datetime
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import BookInstance, Hold
+
+# How long a copy is lent for, and how long a reserved copy is kept for its borrower to collect.
+LOAN_PERIOD = datetime.timedelta(weeks=3)
+COLLECTION_PERIOD = datetime.timedelta(weeks=1)
+
+# How many copies (or holds) to try to claim before giving up.
+CLAIM_ATTEMPTS = 10
+
+
+class LoanError(Exception):
+    """Raised when a copy can't be checked out or returned, or a hold placed (with the reason, for the user)."""
+
+
+def claim_copy(copies, **changes):
+    """Makes the `changes` to one of `copies` (a queryset of the copies that can be claimed), and returns it.
+
+    Returns None if no copy could be claimed. Must be called in a transaction.
+    """
+    candidates = copies.select_for_update(skip_locked=True).order_by('pk')[:CLAIM_ATTEMPTS]
+    for copy in candidates:
+        # Only changes the copy if it can still be claimed (another desk may have claimed it meanwhile).
+        if copies.filter(pk=copy.pk).update(**changes):
+            for name, value in changes.items():
+                setattr(copy, copy._meta.get_field(name).attname, value)
+            return copy
+    return None
+
+
+def checkout(book, borrower, due_back=None):
+    """Lends `borrower` a copy of `book`: the one reserved for them if there is one, otherwise an available one.
+
+    Returns the copy, due back on `due_back` (by default after LOAN_PERIOD). Raises LoanError
+    if no copy is available, or if other borrowers are waiting for the book ahead of `borrower`
+    (an available copy goes to the first of them).
+    """
+    due_back = due_back or timezone.localdate() + LOAN_PERIOD
+    copies = BookInstance.objects.filter(book=book)
+    with transaction.atomic():
+        copy = claim_copy(copies.filter(status__exact='r', borrower=borrower), status='o', due_back=due_back)
+        if copy is None:
+            first = Hold.objects.waiting().filter(book=book).values_list('borrower_id', flat=True).first()
+            if first is not None and first != borrower.pk:
+                raise LoanError('Other borrowers are waiting for "{0}".'.format(book))
+            copy = claim_copy(copies.filter(status__exact='a'), status='o', borrower=borrower.pk, due_back=due_back)
+        if copy is None:
+            raise LoanError('No copy of "{0}" is available.'.format(book))
+        # The borrower's hold on the book (if any) is done with.
+        Hold.objects.filter(book=book, borrower=borrower).delete()
+    return copy
+
+
+def return_copy(copy):
+    """Marks `copy` as returned, and reserves it for the first waiting hold on its book, if any.
+
+    Returns the hold the copy is now reserved for, or None if the copy is available. Raises
+    LoanError if the copy is not on loan.
+    """
+    with transaction.atomic():
+        return pass_on(copy, BookInstance.objects.on_loan(), 'Copy {0} is not on loan.'.format(copy.pk))
+
+
+def pass_on(copy, copies, error):
+    """Reserves `copy` for the first waiting hold on its book, or makes it available if nobody is waiting.
+
+    Returns the hold the copy is now reserved for, or None. The copy is only changed if it is
+    still one of `copies`: otherwise LoanError(`error`) is raised, rolling back the hold's claim
+    on the copy. Must be called in a transaction.
+    """
+    hold = None
+    holds = Hold.objects.waiting().filter(book_id=copy.book_id)
+    for candidate in holds.select_for_update(skip_locked=True)[:CLAIM_ATTEMPTS]:
+        if holds.filter(pk=candidate.pk).update(copy=copy):
+            hold = candidate
+            hold.copy = copy
+            break
+    if hold is None:
+        changes = {'status': 'a', 'borrower': None, 'due_back': None}
+    else:
+        changes = {'status': 'r', 'borrower': hold.borrower_id,
+                   'due_back': timezone.localdate() + COLLECTION_PERIOD}
+    if not copies.filter(pk=copy.pk).update(**changes):
+        raise LoanError(error)
+    return hold
+
+
+def expire_reservations(today=None):
+    """Passes on the reserved copies that weren't collected in time (due back before `today`).
+
+    Each copy's hold is deleted, and the copy is reserved for the next waiting hold on its book
+    (or made available). Returns the number of reservations expired.
+    """
+    expired = BookInstance.objects.filter(status__exact='r', due_back__lt=today or timezone.localdate())
+    num_expired = 0
+    for copy in expired.order_by('pk'):
+        try:
+            with transaction.atomic():
+                Hold.objects.filter(copy=copy).delete()
+                pass_on(copy, expired, 'Copy {0} is no longer reserved.'.format(copy.pk))
+        except LoanError:
+            # The copy was collected (or changed otherwise) meanwhile.
+            continue
+        num_expired += 1
+    return num_expired
+
+
+def place_hold(book, borrower):
+    """Puts `borrower` in the queue for `book`, and returns their hold.
+
+    If nobody else is waiting for the book and a copy is available, the copy is reserved for
+    the borrower at once. Raises LoanError if the borrower already has a hold on the book.
+    """
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                hold = Hold.objects.create(book=book, borrower=borrower)
+        except IntegrityError:
+            raise LoanError('You already have a hold on "{0}".'.format(book))
+        if not Hold.objects.waiting().filter(book=book).exclude(pk=hold.pk).exists():
+            copy = claim_copy(BookInstance.objects.filter(book=book, status__exact='a'), status='r',
+                              borrower=borrower.pk, due_back=timezone.localdate() + COLLECTION_PERIOD)
+            if copy is not None:
+                hold.copy = copy
+                hold.save(update_fields=['copy'])
+    return hold
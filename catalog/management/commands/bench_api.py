@@ -0,0 +1,43 @@
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.urls import reverse
+
+from catalog.bench import seed_library, test_database, wsgi_request
+from catalog.models import Book
+
+
+class Command(BaseCommand):
+    help = ('Compares the requests per second and response sizes of the HTML book pages with those of '
+            'the JSON API (see catalog/api.py) for the same books, as the mobile and kiosk clients use them.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Number of requests to each page.')
+        parser.add_argument('--books', type=int, default=1000, help='Number of books in the library.')
+
+    def handle(self, *args, **options):
+        with test_database():
+            seed_library(options['books'])
+            book = Book.objects.order_by('title', 'author', 'id').first()
+            pages = (
+                ('book list (HTML)', reverse('books')),
+                ('book list (JSON)', reverse('api-books') + '?limit=10'),
+                ('book list, titles only (JSON)', reverse('api-books') + '?limit=10&fields=id,title,copies_available'),
+                ('book detail (HTML)', reverse('book-detail', args=[book.pk])),
+                ('book detail (JSON)', reverse('api-book-detail', args=[book.pk])),
+            )
+            application = get_wsgi_application()
+            cache.clear()
+            for name, path in pages:
+                # The first request fills the caches (of templates, and of the book page).
+                status, body = wsgi_request(application, path)
+                if status != 200:
+                    raise CommandError('{0} returned status {1}.'.format(path, status))
+                start = time.perf_counter()
+                for number in range(options['requests']):
+                    wsgi_request(application, path)
+                seconds = time.perf_counter() - start
+                self.stdout.write('{0:<30}: {1:.0f} requests/s, {2:.1f} KB'.format(
+                    name, options['requests'] / seconds, len(body) / 1024))
@@ -0,0 +1,76 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.asgi import get_asgi_application
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.core.wsgi import get_wsgi_application
+from django.urls import reverse
+
+from catalog import visits
+from catalog.bench import asgi_get, seed_library, test_database, wsgi_get
+from catalog.models import Book
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Command(BaseCommand):
+    help = ('Compares the requests per second and latency of the catalog pages served through '
+            'locallibrary/wsgi.py (by a pool of threads) and locallibrary/asgi.py (by an event loop), '
+            'with the same number of requests in progress at once.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=400, help='Number of requests to each server.')
+        parser.add_argument('--concurrency', type=int, default=8, help='Number of requests in progress at once.')
+        parser.add_argument('--books', type=int, default=1000, help='Number of books in the library.')
+
+    def handle(self, *args, **options):
+        # Requests are handled in several threads, each with its own connection to the database file.
+        with test_database(in_file=True):
+            seed_library(options['books'])
+            book = Book.objects.first()
+            paths = [reverse('index'), reverse('books'), reverse('book-detail', args=[book.pk]),
+                     reverse('authors'), reverse('author-detail', args=[book.author_id])]
+            requests = [paths[number % len(paths)] for number in range(options['requests'])]
+            for name, run in (('wsgi', self.run_wsgi), ('asgi', self.run_asgi)):
+                cache.clear()
+                start = time.perf_counter()
+                results = run(requests, options['concurrency'])
+                seconds = time.perf_counter() - start
+                visits.counter.flush()
+                latencies = [latency for status, latency in results]
+                errors = sum(status != 200 for status, latency in results)
+                self.stdout.write('{0}: {1:.0f} requests/s, p50 {2:.1f} ms, p99 {3:.1f} ms, {4} errors'.format(
+                    name, len(results) / seconds, percentile(latencies, 0.5) * 1000,
+                    percentile(latencies, 0.99) * 1000, errors))
+
+    def run_wsgi(self, requests, concurrency):
+        application = get_wsgi_application()
+
+        def timed_get(path):
+            start = time.perf_counter()
+            status = wsgi_get(application, path)
+            return status, time.perf_counter() - start
+
+        with ThreadPoolExecutor(concurrency) as executor:
+            return list(executor.map(timed_get, requests))
+
+    def run_asgi(self, requests, concurrency):
+        application = get_asgi_application()
+
+        async def run():
+            slots = asyncio.Semaphore(concurrency)
+
+            async def timed_get(path):
+                async with slots:
+                    start = time.perf_counter()
+                    status = await asgi_get(application, path)
+                    return status, time.perf_counter() - start
+
+            return await asyncio.gather(*(timed_get(path) for path in requests))
+
+        return asyncio.run(run())
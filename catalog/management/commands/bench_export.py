@@ -0,0 +1,42 @@
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from catalog import exports
+from catalog.bench import seed_books, seed_copies, seed_users, test_database
+from catalog.models import BookInstance
+
+
+class Command(BaseCommand):
+    help = 'Measures the throughput and peak memory of the streaming exports as the number of rows grows.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', default='200000,2000000',
+                            help='Comma-separated numbers of copies to export (each is created in turn).')
+        parser.add_argument('--chunk-size', type=int, default=exports.CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(size) for size in options['rows'].split(','))
+        with test_database():
+            book_ids = seed_books(max(1, sizes[-1] // 10))
+            borrower_ids = seed_users(1000)
+            self.stdout.write('{0:>10} {1:>6} {2:>6} {3:>10} {4:>12} {5:>14}'.format(
+                'copies', 'export', 'format', 'rows', 'rows/s', 'peak memory'))
+            for size in sizes:
+                seed_copies(size - BookInstance.objects.count(), book_ids, borrower_ids, seed=size)
+                for name in ('loans', 'books'):
+                    for format in ('csv', 'jsonl'):
+                        rows, seconds, peak = self.run_export(name, format, options['chunk_size'])
+                        self.stdout.write('{0:>10} {1:>6} {2:>6} {3:>10} {4:>12.0f} {5:>11.1f} MB'.format(
+                            size, name, format, rows, rows / seconds, peak / 1e6))
+
+    def run_export(self, name, format, chunk_size):
+        """Exports to nowhere, returning the number of lines, the time taken and the peak memory allocated."""
+        tracemalloc.start()
+        start = time.perf_counter()
+        lines = sum(1 for line in exports.export_lines(name, format, chunk_size))
+        seconds = time.perf_counter() - start
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return lines, seconds, peak
@@ -0,0 +1,93 @@
+import statistics
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, RequestFactory
+from django.urls import reverse
+
+from catalog import views
+from catalog.bench import measure, seed_books, seed_copies, seed_users, test_database
+from catalog.models import BookInstance
+
+
+class Command(BaseCommand):
+    help = ('Times the loaned-book views and the available-copies count with and without the BookInstance '
+            'indexes, and shows the query plans.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--copies', type=int, default=1000000, help='Number of book copies to create.')
+        parser.add_argument('--repeat', type=int, default=5, help='Number of times to time each query.')
+
+    def handle(self, *args, **options):
+        with test_database():
+            self.stdout.write('Creating {0} copies...'.format(options['copies']))
+            borrower_ids = seed_users(max(1, options['copies'] // 100))
+            seed_copies(options['copies'], seed_books(max(1, options['copies'] // 10)), borrower_ids)
+            librarian = User.objects.create_superuser('librarian', password='!')
+            borrower = User.objects.get(pk=borrower_ids[0])
+
+            checks = [
+                ('my-borrowed', borrower, views.LoanedBooksByUserListView),
+                ('all-borrowed', librarian, views.LoanedBooksAllListView),
+            ]
+            results = {}
+            for indexed in (False, True):
+                self.set_indexes(indexed)
+                label = 'with indexes' if indexed else 'without indexes'
+                self.stdout.write('\n=== {0} ==='.format(label))
+                for url_name, user, view_class in checks:
+                    results[url_name, indexed] = self.time_view(url_name, user, options['repeat'])
+                    self.show_plan(url_name, self.view_queryset(view_class, user)[:10])
+                available = BookInstance.objects.filter(status__exact='a')
+                results['available count', indexed] = self.time_query(lambda: available.count(), options['repeat'])
+                self.show_plan('available count', available.order_by().values('pk'), count=True)
+
+            self.stdout.write('\n{0:<16} {1:>18} {2:>18}'.format('', 'without (ms)', 'with indexes (ms)'))
+            for name in ('my-borrowed', 'all-borrowed', 'available count'):
+                self.stdout.write('{0:<16} {1:>18.2f} {2:>18.2f}'.format(
+                    name, results[name, False], results[name, True]))
+
+    def set_indexes(self, create):
+        """Creates (or drops) the indexes defined in BookInstance.Meta.indexes."""
+        with connection.schema_editor() as schema_editor:
+            for index in BookInstance._meta.indexes:
+                if create:
+                    schema_editor.add_index(BookInstance, index)
+                else:
+                    schema_editor.remove_index(BookInstance, index)
+        if connection.vendor in ('sqlite', 'postgresql'):
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+    def view_queryset(self, view_class, user):
+        request = RequestFactory().get('/')
+        request.user = user
+        view = view_class()
+        view.setup(request)
+        return view.get_queryset()
+
+    def time_view(self, url_name, user, repeat):
+        client = Client()
+        client.force_login(user)
+        url = reverse(url_name)
+        return self.time_query(lambda: client.get(url), repeat)
+
+    def time_query(self, function, repeat):
+        """Returns the median time in milliseconds taken by function()."""
+        timings = []
+        for attempt in range(repeat):
+            with measure() as result:
+                function()
+            timings.append(result['seconds'] * 1000)
+        return statistics.median(timings)
+
+    def show_plan(self, name, queryset, count=False):
+        sql, params = queryset.query.sql_with_params()
+        if count:
+            sql = 'SELECT COUNT(*) FROM ({0}) subquery'.format(sql)
+        explain = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+        with connection.cursor() as cursor:
+            cursor.execute(explain + sql, params)
+            plan = '\n'.join('    ' + ' '.join(str(column) for column in row) for row in cursor.fetchall())
+        self.stdout.write('{0}:\n{1}'.format(name, plan))
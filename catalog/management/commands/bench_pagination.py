@@ -0,0 +1,51 @@
+import statistics
+
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.urls import reverse
+
+from catalog.bench import measure, seed_books, test_database
+from catalog.models import Book
+from catalog.pagination import KeysetPaginator
+from catalog.views import BookListView
+
+
+class Command(BaseCommand):
+    help = 'Compares the cost of offset (?page=) and keyset (?cursor=) pagination of the book list at increasing depth.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=100000, help='Number of books to create.')
+        parser.add_argument('--repeat', type=int, default=5, help='Number of times to time each request.')
+
+    def handle(self, *args, **options):
+        per_page = BookListView.paginate_by
+        pages = [page for page in (1, 10, 100, 1000, 10000, 100000) if page * per_page <= options['books']]
+        with test_database():
+            self.stdout.write('Creating {0} books...'.format(options['books']))
+            seed_books(options['books'])
+            client = Client()
+            url = reverse('books')
+            paginator = KeysetPaginator(Book.objects.all(), per_page, BookListView.keyset_ordering)
+            books = Book.objects.order_by(*paginator.order_by(Book, BookListView.keyset_ordering))
+
+            self.stdout.write('{0:>8}  {1:>12}  {2:>12}'.format('page', 'offset (ms)', 'keyset (ms)'))
+            for page in pages:
+                if page == 1:
+                    cursor = ''
+                else:
+                    # The cursor for a page is made from the last book on the page before it.
+                    last_book = books[(page - 1) * per_page - 1]
+                    cursor = paginator.encode_cursor(last_book, 'next')
+                offset_ms = self.time_request(client, url, {'page': page}, options['repeat'])
+                keyset_ms = self.time_request(client, url, {'cursor': cursor}, options['repeat'])
+                self.stdout.write('{0:>8}  {1:>12.2f}  {2:>12.2f}'.format(page, offset_ms, keyset_ms))
+
+    def time_request(self, client, url, params, repeat):
+        """Returns the median time in milliseconds to get `url` with the given query parameters."""
+        timings = []
+        for attempt in range(repeat):
+            with measure() as result:
+                response = client.get(url, params)
+            assert response.status_code == 200, response.status_code
+            timings.append(result['seconds'] * 1000)
+        return statistics.median(timings)
@@ -0,0 +1,106 @@
+import datetime
+import multiprocessing
+import random
+import time
+
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections
+from django.test import override_settings
+
+from catalog.bench import seed_library, test_database
+from catalog.models import Book, BookInstance
+
+# SQLite's own defaults (set explicitly, as write-ahead logging stays on in a database file).
+DEFAULT_PRAGMAS = {'journal_mode': 'delete', 'synchronous': 'full', 'mmap_size': 0, 'cache_size': -2000}
+
+
+def read(rng, book_ids):
+    """Reads a page of the book list and the copies of a book."""
+    offset = rng.randrange(0, max(1, len(book_ids) - 10))
+    list(Book.objects.select_related('author').order_by('title')[offset:offset + 10])
+    list(BookInstance.objects.filter(book_id=rng.choice(book_ids)))
+
+
+def write(rng, copy_ids):
+    """Saves a new session (as a login does) or renews a loan (which also touches its book and author)."""
+    if rng.random() < 0.5:
+        session = SessionStore()
+        session['num_visits'] = 1
+        session.create()
+    else:
+        BookInstance.objects.renew([rng.choice(copy_ids)],
+                                   datetime.date.today() + datetime.timedelta(weeks=rng.randint(1, 4)))
+
+
+def work(seconds, write_fraction, seed, book_ids, copy_ids, results):
+    """Reads and writes for `seconds` (in a new process), putting the numbers of each and of errors in `results`."""
+    rng = random.Random(seed)
+    counts = {'reads': 0, 'writes': 0, 'errors': 0, 'slowest': 0}
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            if rng.random() < write_fraction:
+                write(rng, copy_ids)
+                counts['writes'] += 1
+            else:
+                read(rng, book_ids)
+                counts['reads'] += 1
+        except OperationalError:
+            counts['errors'] += 1
+        counts['slowest'] = max(counts['slowest'], time.perf_counter() - start)
+    connections.close_all()
+    results.put(counts)
+
+
+class Command(BaseCommand):
+    help = ('Compares the throughput of several processes reading and writing a SQLite database with '
+            "SQLite's default settings and with the tuned settings (SQLITE_PRAGMAS and SQLITE_TRANSACTION_MODE).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=4, help='Number of processes.')
+        parser.add_argument('--seconds', type=float, default=5, help='How long each process runs.')
+        parser.add_argument('--writes', type=float, default=0.2, help='Fraction of operations that write.')
+        parser.add_argument('--books', type=int, default=1000, help='Number of books in the library.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('The database is not SQLite.')
+        if not settings.SQLITE_PRAGMAS:
+            raise CommandError('SQLite tuning is turned off (SQLITE_TUNING=False).')
+        profiles = (
+            ('default', DEFAULT_PRAGMAS, None),
+            ('tuned', settings.SQLITE_PRAGMAS, settings.SQLITE_TRANSACTION_MODE),
+        )
+        # The processes need a database file to share (the test database is otherwise in memory).
+        with test_database(in_file=True):
+            seed_library(options['books'])
+            book_ids = list(Book.objects.values_list('pk', flat=True))
+            copy_ids = list(BookInstance.objects.on_loan().values_list('pk', flat=True))
+            for name, pragmas, transaction_mode in profiles:
+                with override_settings(SQLITE_PRAGMAS=pragmas, SQLITE_TRANSACTION_MODE=transaction_mode):
+                    counts = self.run_processes(options, book_ids, copy_ids)
+                operations = counts['reads'] + counts['writes']
+                self.stdout.write(
+                    '{0:>8}: {1} reads, {2} writes, {3:.0f} operations/s, {4} errors, slowest {5:.0f} ms'.format(
+                        name, counts['reads'], counts['writes'], operations / options['seconds'],
+                        counts['errors'], counts['slowest'] * 1000))
+
+    def run_processes(self, options, book_ids, copy_ids):
+        """Runs `work` in each process at once, and returns the total counts."""
+        # Processes are forked, so they must not share the connections of this one.
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        processes = [context.Process(target=work, args=(options['seconds'], options['writes'], seed,
+                                                        book_ids, copy_ids, results))
+                     for seed in range(options['processes'])]
+        for process in processes:
+            process.start()
+        all_counts = [results.get() for process in processes]
+        for process in processes:
+            process.join()
+        return {key: (max if key == 'slowest' else sum)(counts[key] for counts in all_counts)
+                for key in all_counts[0]}
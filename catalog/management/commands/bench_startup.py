@@ -0,0 +1,90 @@
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Run in a new Python process as a stand-in for gunicorn: with "preload", loads the application
+# and prepares it (see catalog/startup.py) before forking the workers, otherwise each worker
+# loads it itself. Each worker then requests two pages and prints the time it's done.
+SERVER = '''
+import os, sys, time
+from catalog.bench import wsgi_get
+
+preload, workers = sys.argv[1] == 'preload', int(sys.argv[2])
+
+def load():
+    from locallibrary.wsgi import application
+    return application
+
+if preload:
+    application = load()
+    from catalog import startup
+    startup.prepare()
+pids = []
+for worker in range(workers):
+    pid = os.fork()
+    if pid == 0:
+        if not preload:
+            application = load()
+        statuses = [wsgi_get(application, path, host='127.0.0.1') for path in ('/catalog/', '/catalog/books/')]
+        # One write per line, so that the workers' lines don't mix.
+        os.write(1, ' '.join(map(str, [time.time()] + statuses)).encode() + b'\\n')
+        os._exit(0)
+    pids.append(pid)
+for pid in pids:
+    os.waitpid(pid, 0)
+'''
+
+
+class Command(BaseCommand):
+    help = ('Measures how long a new server takes to answer its first requests, when it migrates the '
+            'database as it starts (as the Procfile used to) and when migrations run in the release phase '
+            'and the application is checked, warmed up and loaded before the workers are forked.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help='Number of worker processes.')
+        parser.add_argument('--repeat', type=int, default=3, help='Number of times to start each server.')
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            env = dict(os.environ, DATABASE_URL='sqlite:///{0}/startup.sqlite3'.format(directory),
+                       DJANGO_SETTINGS_MODULE='locallibrary.settings', DJANGO_DEBUG='False',
+                       PYTHONPATH=str(settings.BASE_DIR))
+            self.migrate(env)
+            modes = (
+                ('migrate on boot', True, 'load'),
+                ('release phase, no preload', False, 'load'),
+                ('release phase, preload', False, 'preload'),
+            )
+            for name, migrate, preload in modes:
+                firsts, lasts = [], []
+                for attempt in range(options['repeat']):
+                    first, last = self.start_server(env, migrate, preload, options['workers'])
+                    firsts.append(first)
+                    lasts.append(last)
+                self.stdout.write('{0:<26}: first response after {1:.0f} ms, all workers after {2:.0f} ms'.format(
+                    name, statistics.median(firsts) * 1000, statistics.median(lasts) * 1000))
+
+    def migrate(self, env):
+        subprocess.run([sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), 'migrate', '-v0'],
+                       env=env, check=True)
+
+    def start_server(self, env, migrate, preload, workers):
+        """Starts a server and returns the seconds until its first and last workers had answered."""
+        start = time.time()
+        if migrate:
+            self.migrate(env)
+        output = subprocess.run([sys.executable, '-c', SERVER, preload, str(workers)], env=env, check=True,
+                                capture_output=True, text=True, cwd=settings.BASE_DIR).stdout
+        times = []
+        for line in output.splitlines():
+            done, *statuses = line.split()
+            if statuses != ['200', '200']:
+                raise CommandError('Requests failed with statuses {0}.'.format(', '.join(statuses)))
+            times.append(float(done) - start)
+        return min(times), max(times)
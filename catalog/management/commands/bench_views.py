@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.bench import (
+    ROLES, check_results, load_budgets, measure_requests, save_budgets, seed_library, test_database,
+)
+
+
+class Command(BaseCommand):
+    help = ('Requests every catalog URL as an anonymous user, a borrower and a librarian in libraries of '
+            'increasing size, and reports the number of queries and time of each. With --check, fails if a '
+            'view exceeds its query budget (catalog/tests/query_budgets.json) or its queries grow with the data.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', default='100,1000,10000',
+                            help='Comma-separated numbers of books in the library (each is created in turn).')
+        parser.add_argument('--repeat', type=int, default=3, help='Number of times to time each request.')
+        parser.add_argument('--check', action='store_true', help='Fail on queries over budget or growing with data.')
+        parser.add_argument('--save-budgets', action='store_true',
+                            help='Store the numbers of queries for the smallest library as the new budgets.')
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(size) for size in options['books'].split(','))
+        all_results = []
+        with test_database():
+            seeded = 0
+            for size in sizes:
+                self.stdout.write('Growing the library to {0} books...'.format(size))
+                users = seed_library(size - seeded, first=seeded)
+                seeded = size
+                all_results.append(measure_requests(users, options['repeat']))
+
+        self.stdout.write('{0:<10} {1:<30}'.format('role', 'view') + ''.join(
+            '{0:>20}'.format('{0} books'.format(size)) for size in sizes))
+        for role in ROLES:
+            for label in all_results[0][role]:
+                self.stdout.write('{0:<10} {1:<30}'.format(role, label) + ''.join(
+                    '{0:>8} q {1:>8.1f} ms'.format(results[role][label]['queries'],
+                                                   results[role][label]['seconds'] * 1000)
+                    for results in all_results))
+
+        if options['save_budgets']:
+            save_budgets(all_results[0])
+            self.stdout.write('Saved the query budgets.')
+        if options['check']:
+            problems = check_results(all_results[0], load_budgets(),
+                                     all_results[-1] if len(all_results) > 1 else None)
+            if problems:
+                raise CommandError('\n'.join(problems))
+            self.stdout.write('All views are within their query budgets.')
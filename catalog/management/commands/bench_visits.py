@@ -0,0 +1,44 @@
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+
+from catalog import views
+from catalog.bench import count_writes, measure, test_database
+
+
+def session_index(request):
+    """The old visit counting from the index view, which stored the count in the session."""
+    num_visits = request.session.get('num_visits', 1)
+    request.session['num_visits'] = num_visits + 1
+    return views.render(request, 'index.html', context={'num_visits': num_visits})
+
+
+class Command(BaseCommand):
+    help = 'Compares the database writes made by session-based and buffered home page visit counting.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--visitors', type=int, default=100, help='Number of distinct visitors.')
+        parser.add_argument('--visits', type=int, default=10, help='Number of visits by each visitor.')
+
+    def handle(self, *args, **options):
+        with test_database():
+            for name, view in (('session', session_index), ('buffered', views.index)):
+                result = self.run_visits(SessionMiddleware(view), options['visitors'], options['visits'])
+                requests = options['visitors'] * options['visits']
+                self.stdout.write('{0:>9}: {1} requests, {2} writes ({3:.2f} per request), {4:.3f}s'.format(
+                    name, requests, result['writes'], result['writes'] / requests, result['seconds']))
+
+    def run_visits(self, handler, visitors, visits):
+        """Sends each visitor's requests through `handler`, replaying the cookies it sets like a browser."""
+        factory = RequestFactory()
+        cookies = [{} for visitor in range(visitors)]
+        with measure() as result:
+            for visit in range(visits):
+                for visitor_cookies in cookies:
+                    request = factory.get('/catalog/')
+                    request.COOKIES.update(visitor_cookies)
+                    response = handler(request)
+                    visitor_cookies.update({key: morsel.value for key, morsel in response.cookies.items()})
+            views.visits.counter.flush()
+        result['writes'] = count_writes(result['queries'])
+        return result
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from catalog.cache import cache_stats, reset_cache_stats
+
+
+class Command(BaseCommand):
+    help = 'Shows the hit rate of the book and author page cache.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Reset the counts after showing them.')
+
+    def handle(self, *args, **options):
+        stats = cache_stats()
+        hit_rate = '-' if stats['hit_rate'] is None else '{0:.1%}'.format(stats['hit_rate'])
+        self.stdout.write('hits: {0}\nmisses: {1}\nhit rate: {2}'.format(stats['hits'], stats['misses'], hit_rate))
+        if options['reset']:
+            reset_cache_stats()
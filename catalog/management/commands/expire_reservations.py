@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from catalog.loans import COLLECTION_PERIOD, expire_reservations
+
+
+class Command(BaseCommand):
+    help = ('Passes on the copies reserved for a hold that were not collected within {0} days, to the next '
+            'hold on their book (or back to available). Run it daily.'.format(COLLECTION_PERIOD.days))
+
+    def handle(self, *args, **options):
+        expired = expire_reservations()
+        self.stdout.write(self.style.SUCCESS(
+            'Expired {0} reservation{1}.'.format(expired, 's' if expired != 1 else '')))
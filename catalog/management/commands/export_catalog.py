@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from catalog import exports
+
+
+class Command(BaseCommand):
+    help = 'Writes a streaming export of the books or loans as CSV or JSON Lines.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=sorted(exports.EXPORTS), help='What to export.')
+        parser.add_argument('--format', choices=sorted(exports.FORMATS), default='csv')
+        parser.add_argument('--output', help='File to write to (default: standard output).')
+        parser.add_argument('--chunk-size', type=int, default=exports.CHUNK_SIZE,
+                            help='Number of rows fetched from the database at a time.')
+
+    def handle(self, *args, **options):
+        lines = exports.export_lines(options['name'], options['format'], options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as f:
+                f.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
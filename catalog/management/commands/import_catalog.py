@@ -0,0 +1,233 @@
+import csv
+import json
+import os
+import time
+import uuid
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.dateparse import parse_date
+
+from catalog import search
+from catalog.models import Author, Book, BookInstance, Genre, Language
+
+RECORD_TYPES = ('author', 'genre', 'language', 'book', 'copy')
+REQUIRED_FIELDS = {'author': ('last_name',), 'genre': ('name',), 'language': ('name',),
+                   'book': ('title', 'isbn'), 'copy': ('isbn',)}
+
+# Namespace of the ids given to copies without one (see copy_id()).
+COPY_ID_NAMESPACE = uuid.UUID('2b0e3c59-5c4c-4c38-9a55-1f1d2e0a6c11')
+
+
+class Command(BaseCommand):
+    help = """Imports authors, genres, languages, books and copies from CSV or JSON Lines files.
+
+Each record has a "type" (author, genre, language, book or copy; default book) and the fields:
+  author:   first_name, last_name, date_of_birth, date_of_death
+  genre, language: name
+  book:     title, isbn, summary, author ("Last, First"), genres (separated by ";"), language
+  copy:     isbn (of the book), imprint, status, due_back, id (optional UUID)
+Copies without an id are given one made from the file name, the record's number and its
+fields, so importing the same records again (e.g. with --resume after a crash) doesn't
+duplicate them.
+Authors, genres and languages named by a book are created if needed. Books whose ISBN already
+exists are skipped. Records are read as a stream and written in batches, and progress is saved
+to a checkpoint file after each batch so that an interrupted import can be continued with --resume."""
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='+', help='CSV (.csv) or JSON Lines (.jsonl) files to import.')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of records written per batch.')
+        parser.add_argument('--resume', action='store_true',
+                            help='Skip the records imported by a previous run (as recorded in the checkpoint files).')
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        self.created = dict.fromkeys(RECORD_TYPES, 0)
+        self.skipped = 0
+        # Lookup maps from names to ids, so each author, genre and language is only fetched once.
+        self.author_ids = {(first, last): pk for pk, first, last
+                           in Author.objects.values_list('pk', 'first_name', 'last_name').iterator()}
+        self.genre_ids = dict(Genre.objects.values_list('name', 'pk'))
+        self.language_ids = dict(Language.objects.values_list('name', 'pk'))
+
+        start = time.perf_counter()
+        total = 0
+        for path in options['files']:
+            total += self.import_file(path, options['resume'])
+        seconds = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            'Imported {0} records in {1:.1f}s ({2:.0f} records/s): {3}; skipped {4} duplicate books.'.format(
+                total, seconds, total / seconds if seconds else 0,
+                ', '.join('{0} {1}'.format(count, plural(kind)) for kind, count in self.created.items()),
+                self.skipped)))
+
+    def import_file(self, path, resume):
+        """Imports the records in `path` (after any already imported) and returns how many were imported."""
+        checkpoint = path + '.checkpoint'
+        done = 0
+        if resume and os.path.exists(checkpoint):
+            with open(checkpoint) as f:
+                done = json.load(f)['records']
+            self.stdout.write('{0}: resuming after record {1}'.format(path, done))
+
+        start = time.perf_counter()
+        imported = 0
+        with open(path, newline='', encoding='utf-8') as f:
+            records = islice(self.read_records(path, f), done, None)
+            while True:
+                batch = list(islice(records, self.batch_size))
+                if not batch:
+                    break
+                with transaction.atomic():
+                    self.import_batch(batch, path, done + imported)
+                imported += len(batch)
+                with open(checkpoint, 'w') as checkpoint_file:
+                    json.dump({'records': done + imported}, checkpoint_file)
+                seconds = time.perf_counter() - start
+                self.stdout.write('{0}: {1} records ({2:.0f} records/s)'.format(
+                    path, done + imported, imported / seconds if seconds else 0))
+        return imported
+
+    def read_records(self, path, f):
+        if path.endswith('.csv'):
+            return csv.DictReader(f)
+        if path.endswith(('.jsonl', '.ndjson')):
+            return (json.loads(line) for line in f if line.strip())
+        raise CommandError('{0}: unknown file type (expected .csv or .jsonl)'.format(path))
+
+    def import_batch(self, batch, path, first_number):
+        by_type = {kind: [] for kind in RECORD_TYPES}
+        copies = []
+        for number, record in enumerate(batch, start=first_number + 1):
+            kind = (record.get('type') or 'book').strip().lower()
+            if kind not in by_type:
+                raise CommandError('{0}: record {1} has unknown type {2!r}'.format(path, number, kind))
+            missing = [name for name in REQUIRED_FIELDS[kind] if not (record.get(name) or '').strip()]
+            if missing:
+                raise CommandError('{0}: {1} record {2} has no {3}'.format(path, kind, number, ', '.join(missing)))
+            if kind == 'copy':
+                copies.append((copy_id(path, number, record), record))
+            by_type[kind].append(record)
+
+        self.resolve_authors([(record.get('first_name', ''), record.get('last_name', ''), record)
+                              for record in by_type['author']])
+        self.resolve_names(Genre, self.genre_ids, [record['name'] for record in by_type['genre']], 'genre')
+        self.resolve_names(Language, self.language_ids, [record['name'] for record in by_type['language']],
+                           'language')
+        self.import_books(by_type['book'])
+        self.import_copies(copies)
+
+    def resolve_authors(self, names):
+        """Creates the authors (first name, last name, record) not already known."""
+        new = {}
+        for first, last, record in names:
+            key = (first.strip(), last.strip())
+            if key not in self.author_ids and key not in new:
+                record = record or {}
+                new[key] = Author(first_name=key[0], last_name=key[1],
+                                  date_of_birth=parse_date(record.get('date_of_birth') or '') or None,
+                                  date_of_death=parse_date(record.get('date_of_death') or '') or None)
+        if new:
+            Author.objects.bulk_create(new.values())
+            for pk, first, last in (Author.objects.filter(last_name__in={last for first, last in new})
+                                    .values_list('pk', 'first_name', 'last_name')):
+                self.author_ids.setdefault((first, last), pk)
+            self.created['author'] += len(new)
+
+    def resolve_names(self, model, ids, names, kind):
+        """Creates the genres or languages in `names` not already in `ids`."""
+        new = {name.strip() for name in names if name.strip()} - ids.keys()
+        if new:
+            model.objects.bulk_create([model(name=name) for name in new])
+            ids.update(model.objects.filter(name__in=new).values_list('name', 'pk'))
+            self.created[kind] += len(new)
+
+    def import_books(self, records):
+        # Skip books whose ISBN is already in the database, or earlier in this batch.
+        isbns = [record['isbn'].strip() for record in records]
+        existing = set(Book.objects.filter(isbn__in=isbns).values_list('isbn', flat=True))
+        unique = {}
+        for isbn, record in zip(isbns, records):
+            if isbn in existing or isbn in unique:
+                self.skipped += 1
+            else:
+                unique[isbn] = record
+        if not unique:
+            return
+
+        authors = {isbn: split_author(record.get('author', '')) for isbn, record in unique.items()}
+        self.resolve_authors([(first, last, None) for first, last in authors.values() if first or last])
+        genres = {isbn: [name.strip() for name in split_list(record.get('genres')) if name.strip()]
+                  for isbn, record in unique.items()}
+        self.resolve_names(Genre, self.genre_ids, [name for names in genres.values() for name in names], 'genre')
+        self.resolve_names(Language, self.language_ids, [record.get('language') or '' for record in unique.values()],
+                           'language')
+
+        Book.objects.bulk_create([
+            Book(title=record['title'], isbn=isbn, summary=record.get('summary', ''),
+                 author_id=self.author_ids.get(authors[isbn]),
+                 language_id=self.language_ids.get((record.get('language') or '').strip()))
+            for isbn, record in unique.items()])
+        book_ids = dict(Book.objects.filter(isbn__in=unique.keys()).values_list('isbn', 'pk'))
+        Book.genre.through.objects.bulk_create([
+            Book.genre.through(book_id=book_ids[isbn], genre_id=self.genre_ids[name])
+            for isbn, names in genres.items() for name in set(names)])
+        # The genre links were written directly, so update the search documents again.
+        search.index_books([book_ids[isbn] for isbn, names in genres.items() if names])
+        self.created['book'] += len(unique)
+
+    def import_copies(self, records):
+        """Creates the copies in `records` ((id, record) pairs) that don't already exist."""
+        if not records:
+            return
+        book_ids = dict(Book.objects.filter(isbn__in={record['isbn'].strip() for copy_id, record in records})
+                        .values_list('isbn', 'pk'))
+        # Skip copies that already exist (e.g. from an interrupted run).
+        existing = set(BookInstance.objects.filter(id__in=[copy_id for copy_id, record in records])
+                       .values_list('id', flat=True))
+        copies = []
+        for copy_id, record in records:
+            isbn = record['isbn'].strip()
+            if isbn not in book_ids:
+                raise CommandError('Copy of unknown book (ISBN {0})'.format(isbn))
+            if copy_id in existing:
+                continue
+            existing.add(copy_id)
+            copies.append(BookInstance(
+                id=copy_id, book_id=book_ids[isbn], imprint=record.get('imprint', ''),
+                status=record.get('status') or 'd', due_back=parse_date(record.get('due_back') or '') or None))
+        BookInstance.objects.bulk_create(copies)
+        self.created['copy'] += len(copies)
+
+
+def copy_id(path, number, record):
+    """Returns the id of the copy in `record` (number `number` of `path`): its own, or one made from the record."""
+    if record.get('id'):
+        try:
+            return uuid.UUID(str(record['id']))
+        except ValueError:
+            raise CommandError('{0}: copy record {1} has an invalid id {2!r}'.format(path, number, record['id']))
+    fields = json.dumps(record, sort_keys=True, default=str)
+    return uuid.uuid5(COPY_ID_NAMESPACE, '{0}:{1}:{2}'.format(os.path.basename(path), number, fields))
+
+
+def plural(kind):
+    return 'copies' if kind == 'copy' else kind + 's'
+
+
+def split_author(name):
+    """Returns (first name, last name) for an author given as "Last, First" (or "First Last")."""
+    name = (name or '').strip()
+    if ',' in name:
+        last, first = name.split(',', 1)
+    else:
+        first, _, last = name.rpartition(' ')
+    return first.strip(), last.strip()
+
+
+def split_list(value):
+    """Returns a list from a JSON list, or from a string separated by semicolons."""
+    if isinstance(value, list):
+        return value
+    return (value or '').split(';')
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from catalog.models import Book
+
+
+class Command(BaseCommand):
+    help = ('Recounts the copies of each book (the copies_total, copies_available and copies_on_loan '
+            'shown in the book lists), correcting any that are wrong.')
+
+    def handle(self, *args, **options):
+        corrected = Book.rebuild_copy_counts()
+        self.stdout.write(self.style.SUCCESS(
+            'Rebuilt copy counts: {0} book{1} corrected.'.format(corrected, 's' if corrected != 1 else '')))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from catalog.models import LibraryStats
+
+
+class Command(BaseCommand):
+    help = 'Recalculates the home page record counts (LibraryStats) from the catalog tables.'
+
+    def handle(self, *args, **options):
+        stats = LibraryStats.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            'Rebuilt library statistics: {0} books, {1} copies ({2} available), {3} authors.'.format(
+                stats.num_books, stats.num_instances, stats.num_instances_available, stats.num_authors)))
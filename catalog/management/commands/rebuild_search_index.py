@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from catalog import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the full-text search index of the book catalog.'
+
+    def handle(self, *args, **options):
+        backend = search.get_backend()
+        with transaction.atomic(), connection.cursor() as cursor:
+            backend.create_index(cursor)
+            backend.index_books(cursor)
+        self.stdout.write(self.style.SUCCESS('Rebuilt the search index ({0}).'.format(type(backend).__name__)))
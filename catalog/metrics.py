@@ -0,0 +1,168 @@
+"""Request metrics: where the time of each request goes.
+
+RequestMetricsMiddleware (in catalog.middleware) times each request, the SQL
+queries it runs and the templates it renders (through the DjangoTemplates
+backend below, which is set in the TEMPLATES setting), sends the timings back
+in a Server-Timing header, and adds them to latency histograms per URL name.
+The histograms are shown in the Prometheus text format by the staff-only
+metrics view.
+
+The histograms are kept in memory, so each process has its own: Prometheus
+should scrape every process (or the numbers are for the process that answers).
+"""
+import bisect
+import threading
+import time
+from contextvars import ContextVar
+
+from django.template.backends import django as django_backend
+
+# Upper bounds of the histogram buckets, for durations (in seconds) and numbers of queries.
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+# Names, descriptions and buckets of the histograms kept for each URL name.
+HISTOGRAMS = (
+    ('catalog_request_duration_seconds', 'Time to handle requests.', DURATION_BUCKETS),
+    ('catalog_request_db_duration_seconds', 'Time spent running SQL queries in requests.', DURATION_BUCKETS),
+    ('catalog_request_template_duration_seconds', 'Time spent rendering templates in requests.', DURATION_BUCKETS),
+    ('catalog_request_view_duration_seconds', 'Time spent in Python code other than queries and templates.',
+     DURATION_BUCKETS),
+    ('catalog_request_queries', 'Number of SQL queries run by requests.', QUERY_BUCKETS),
+)
+
+
+class Histogram:
+    """Counts of observed values in buckets (cumulative, as in Prometheus), with their sum."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self):
+        """Returns (upper bound, number of values up to it) for each bucket, ending with '+Inf'."""
+        total = 0
+        counts = []
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            counts.append((bound, total))
+        return counts
+
+
+class Registry:
+    """The histograms of each URL name."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+
+    def observe(self, view, timing):
+        values = (timing.total, timing.db_time, timing.template_time, timing.view_time, timing.queries)
+        with self.lock:
+            histograms = self.histograms.get(view)
+            if histograms is None:
+                histograms = self.histograms[view] = [Histogram(buckets) for name, help, buckets in HISTOGRAMS]
+            for histogram, value in zip(histograms, values):
+                histogram.observe(value)
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+
+    def render(self):
+        """Returns the histograms in the Prometheus text format."""
+        lines = []
+        with self.lock:
+            for index, (name, help, buckets) in enumerate(HISTOGRAMS):
+                lines.append('# HELP {0} {1}'.format(name, help))
+                lines.append('# TYPE {0} histogram'.format(name))
+                for view, histograms in sorted(self.histograms.items()):
+                    histogram = histograms[index]
+                    label = 'view="{0}"'.format(escape_label(view))
+                    for bound, count in histogram.cumulative_counts():
+                        lines.append('{0}_bucket{{{1},le="{2}"}} {3}'.format(name, label, bound, count))
+                    lines.append('{0}_sum{{{1}}} {2}'.format(name, label, histogram.sum))
+                    lines.append('{0}_count{{{1}}} {2}'.format(name, label, histogram.count))
+        return '\n'.join(lines) + '\n'
+
+
+def escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = Registry()
+
+
+class RequestTiming:
+    """The timings of one request (all in seconds)."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.total = 0
+        self.queries = 0
+        self.db_time = 0
+        self.template_time = 0
+        self.template_depth = 0
+
+    @property
+    def view_time(self):
+        return max(0, self.total - self.db_time - self.template_time)
+
+    def __call__(self, execute, sql, params, many, context):
+        """Times a query (installed with connection.execute_wrapper())."""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries += 1
+
+    def finish(self):
+        self.total = time.perf_counter() - self.start
+
+    def server_timing(self):
+        """Returns the value of the Server-Timing header for the request."""
+        return 'db;dur={0:.1f};desc="{1} queries", tpl;dur={2:.1f}, view;dur={3:.1f}, total;dur={4:.1f}'.format(
+            self.db_time * 1000, self.queries, self.template_time * 1000, self.view_time * 1000, self.total * 1000)
+
+
+# The timing of the request being handled (if any).
+current_timing = ContextVar('current_timing', default=None)
+
+
+class Template(django_backend.Template):
+    """Template that adds its rendering time to the current request's timing (templates rendered
+    while rendering another, e.g. by a template tag, are only counted as part of the outer one).
+    Queries made while rendering (e.g. by lazy querysets) count as database time, not template time."""
+
+    def render(self, context=None, request=None):
+        timing = current_timing.get()
+        if timing is None or timing.template_depth:
+            return super().render(context, request)
+        timing.template_depth += 1
+        start, db_start = time.perf_counter(), timing.db_time
+        try:
+            return super().render(context, request)
+        finally:
+            timing.template_time += time.perf_counter() - start - (timing.db_time - db_start)
+            timing.template_depth -= 1
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    """The Django template backend, timing the templates it renders (see Template)."""
+
+    def from_string(self, template_code):
+        return Template(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return Template(self.engine.get_template(template_name), self)
+        except django_backend.TemplateDoesNotExist as exc:
+            django_backend.reraise(exc, self)
@@ -0,0 +1,55 @@
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from . import routers
+from .metrics import RequestTiming, current_timing, registry
+
+
+class RequestMetricsMiddleware:
+    """Times each request's SQL queries, templates and other code (see catalog.metrics).
+
+    The timings are sent in a Server-Timing header (unless the CATALOG_SERVER_TIMING setting
+    is False) and added to the latency histograms of the request's URL name.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timing = RequestTiming()
+        token = current_timing.set(timing)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timing))
+                response = self.get_response(request)
+        finally:
+            current_timing.reset(token)
+        timing.finish()
+
+        match = request.resolver_match
+        registry.observe(match.view_name if match else '(unmatched)', timing)
+        if getattr(settings, 'CATALOG_SERVER_TIMING', True):
+            response['Server-Timing'] = timing.server_timing()
+        return response
+
+
+class ReplicaPinningMiddleware:
+    """Pins users to the primary database for a while after they write (see catalog.routers)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = routers.RequestState(pinned=routers.PIN_COOKIE in request.COOKIES)
+        token = routers.request_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            routers.request_state.reset(token)
+        if state.wrote:
+            response.set_cookie(routers.PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS,
+                                httponly=True, samesite='Lax')
+        return response
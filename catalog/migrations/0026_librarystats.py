@@ -0,0 +1,39 @@
+# Generated by Django 4.0.2 on 2026-10-18 01:31
+
+from django.db import migrations, models
+
+
+def count_records(apps, schema_editor):
+    """Creates the statistics record from the existing catalog."""
+    BookInstance = apps.get_model('catalog', 'BookInstance')
+    apps.get_model('catalog', 'LibraryStats').objects.create(
+        pk=1,
+        num_books=apps.get_model('catalog', 'Book').objects.count(),
+        num_instances=BookInstance.objects.count(),
+        num_instances_available=BookInstance.objects.filter(status='a').count(),
+        num_authors=apps.get_model('catalog', 'Author').objects.count(),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0025_auto_20220222_0623'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LibraryStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('num_books', models.PositiveIntegerField(default=0)),
+                ('num_instances', models.PositiveIntegerField(default=0)),
+                ('num_instances_available', models.PositiveIntegerField(default=0)),
+                ('num_authors', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'library stats',
+            },
+        ),
+        migrations.RunPython(count_records, migrations.RunPython.noop),
+    ]
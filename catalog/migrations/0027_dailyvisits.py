@@ -0,0 +1,25 @@
+# Generated by Django 4.0.2 on 2026-10-18 01:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0026_librarystats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyVisits',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'daily visits',
+                'ordering': ['-date'],
+            },
+        ),
+    ]
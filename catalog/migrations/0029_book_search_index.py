@@ -0,0 +1,65 @@
+from django.db import migrations
+
+# The search tables and documents as catalog/search.py defined them when this migration was
+# written (the SQL is kept here, so that later changes to that module don't change the migration).
+
+SQLITE_CREATE = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS catalog_book_fts USING fts5("
+    "title, summary, isbn, authors, genres, tokenize='unicode61 remove_diacritics 2')",
+)
+SQLITE_INDEX = (
+    'INSERT INTO catalog_book_fts(rowid, title, summary, isbn, authors, genres) '
+    "SELECT b.id, b.title, b.summary, b.isbn, COALESCE(a.first_name || ' ' || a.last_name, ''), "
+    "COALESCE((SELECT group_concat(g.name, ' ') FROM catalog_book_genre bg "
+    "JOIN catalog_genre g ON g.id = bg.genre_id WHERE bg.book_id = b.id), '') "
+    'FROM catalog_book b LEFT JOIN catalog_author a ON a.id = b.author_id'
+)
+SQLITE_DROP = 'DROP TABLE IF EXISTS catalog_book_fts'
+
+POSTGRESQL_CREATE = (
+    'CREATE TABLE IF NOT EXISTS catalog_book_search (book_id bigint PRIMARY KEY, document tsvector NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS catalog_book_search_document_idx ON catalog_book_search USING GIN (document)',
+)
+POSTGRESQL_INDEX = (
+    'INSERT INTO catalog_book_search(book_id, document) '
+    "SELECT b.id, setweight(to_tsvector('english', b.title), 'A') "
+    "|| setweight(to_tsvector('simple', COALESCE(a.first_name || ' ' || a.last_name, '')), 'B') "
+    "|| setweight(to_tsvector('simple', COALESCE((SELECT string_agg(g.name, ' ') FROM catalog_book_genre bg "
+    "JOIN catalog_genre g ON g.id = bg.genre_id WHERE bg.book_id = b.id), '')), 'B') "
+    "|| setweight(to_tsvector('simple', b.isbn), 'B') "
+    "|| setweight(to_tsvector('english', b.summary), 'D') "
+    'FROM catalog_book b LEFT JOIN catalog_author a ON a.id = b.author_id'
+)
+POSTGRESQL_DROP = 'DROP TABLE IF EXISTS catalog_book_search'
+
+
+def create_search_index(apps, schema_editor):
+    """Creates the full-text search table for this database, and indexes the existing books."""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        statements = SQLITE_CREATE + (SQLITE_INDEX,)
+    elif vendor == 'postgresql':
+        statements = POSTGRESQL_CREATE + (POSTGRESQL_INDEX,)
+    else:
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    drop = {'sqlite': SQLITE_DROP, 'postgresql': POSTGRESQL_DROP}.get(schema_editor.connection.vendor)
+    if drop:
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute(drop)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0028_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
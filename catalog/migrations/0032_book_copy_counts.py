@@ -0,0 +1,43 @@
+# Generated by Django 4.0.2 on 2026-10-18 02:23
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_copies(apps, schema_editor):
+    """Sets the copy counts of the existing books."""
+    BookInstance = apps.get_model('catalog', 'BookInstance')
+
+    def count(**filters):
+        copies = BookInstance.objects.filter(book=OuterRef('pk'), **filters).order_by()
+        return Coalesce(Subquery(copies.values('book').annotate(count=Count('pk')).values('count')), 0)
+
+    apps.get_model('catalog', 'Book').objects.update(
+        copies_total=count(), copies_available=count(status='a'), copies_on_loan=count(status='o'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0031_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='copies_available',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='copies_on_loan',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='copies_total',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_copies, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+from django.db import migrations
+
+# The book list is paginated by title, author and id with books without an author first (see
+# catalog.pagination). SQLite sorts nulls first already, but PostgreSQL sorts them last in an
+# ascending index, so there the index has to say NULLS FIRST for the author to be used for the
+# ordering (Django can't declare it: SQLite doesn't accept NULLS FIRST in CREATE INDEX).
+POSTGRESQL_NULLS_FIRST = (
+    'DROP INDEX IF EXISTS book_title_author_idx',
+    'CREATE INDEX book_title_author_idx ON catalog_book (title, author_id ASC NULLS FIRST, id)',
+)
+POSTGRESQL_NULLS_LAST = (
+    'DROP INDEX IF EXISTS book_title_author_idx',
+    'CREATE INDEX book_title_author_idx ON catalog_book (title, author_id, id)',
+)
+
+
+def run_on_postgresql(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor == 'postgresql':
+            with schema_editor.connection.cursor() as cursor:
+                for sql in statements:
+                    cursor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0033_hold'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_on_postgresql(POSTGRESQL_NULLS_FIRST), run_on_postgresql(POSTGRESQL_NULLS_LAST)),
+    ]
@@ -1,11 +1,81 @@
-from django.db import models
+from django.db import models, router, transaction
+from django.db.models import DEFERRED, Count, F, Q
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 
 # Create your models here.
 
 from django.urls import reverse  # To generate URLS by reversing URL patterns
 
+from . import signals
 
-class Genre(models.Model):
+
+class CatalogQuerySet(models.QuerySet):
+    """QuerySet that reports bulk writes (which skip the model save signals) using catalog.signals."""
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        signals.bulk_created.send(sender=self.model, objs=objs,
+                                  ignore_conflicts=kwargs.get('ignore_conflicts', False))
+        return objs
+
+    def update(self, **kwargs):
+        if any(field.name == 'updated_at' for field in self.model._meta.concrete_fields):
+            # update() doesn't apply auto_now, so set the modification time here.
+            kwargs.setdefault('updated_at', timezone.now())
+        tracked = [name for name in getattr(self.model, 'tracked_fields', ()) if name in kwargs]
+        with transaction.atomic(using=self.db, savepoint=False):
+            # Record the old values of tracked fields so receivers can work out what changed.
+            rows = list(self.values('pk', *tracked)) if tracked else None
+            num_rows = super().update(**kwargs)
+            signals.bulk_updated.send(sender=self.model, values=kwargs, rows=rows)
+        return num_rows
+
+
+class AtomicSaveMixin:
+    """Saves and deletes objects in a transaction together with the writes of the signal receivers
+    (the counts of catalog.stats, the `updated_at` touches of catalog.conditional, ...), so that
+    if any of them fails the change itself is rolled back too, rather than committed alone."""
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get('using') or router.db_for_write(type(self), instance=self)):
+            super().save(*args, **kwargs)
+
+    def delete(self, using=None, keep_parents=False):
+        with transaction.atomic(using=using or router.db_for_write(type(self), instance=self)):
+            return super().delete(using, keep_parents)
+
+
+class LoadedValuesMixin:
+    """Remembers the field values of a model instance as loaded from (or last saved to) the database,
+    so that signal handlers can see what a save changed."""
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def loaded_value(self, attname):
+        """Returns the value of field `attname` as last loaded or saved, or None if it is not known."""
+        value = getattr(self, '_loaded_values', {}).get(attname)
+        return None if value is DEFERRED else value
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            self._loaded_values = {field.attname: getattr(self, field.attname)
+                                   for field in self._meta.concrete_fields}
+        else:
+            # Only the fields written are now as saved: the others keep their loaded values.
+            self._loaded_values = dict(getattr(self, '_loaded_values', {}))
+            for name in update_fields:
+                attname = self._meta.get_field(name).attname
+                self._loaded_values[attname] = getattr(self, attname)
+
+
+class Genre(AtomicSaveMixin, models.Model):
     """Model representing a book genre (e.g. Science Fiction, Non Fiction)."""
     name = models.CharField(
         max_length=200,
@@ -17,7 +87,7 @@ class Genre(models.Model):
         return self.name
 
 
-class Language(models.Model):
+class Language(AtomicSaveMixin, models.Model):
     """Model representing a Language (e.g. English, French, Japanese, etc.)"""
     name = models.CharField(max_length=200,
                             help_text="Enter the book's natural language (e.g. English, French, Japanese etc.)")
@@ -27,7 +97,7 @@ class Language(models.Model):
         return self.name
 
 
-class Book(models.Model):
+class Book(LoadedValuesMixin, AtomicSaveMixin, models.Model):
     """Model representing a book (but not a specific copy of a book)."""
     title = models.CharField(max_length=200)
     author = models.ForeignKey('Author', on_delete=models.SET_NULL, null=True)
@@ -42,16 +112,69 @@ class Book(models.Model):
     # ManyToManyField used because a genre can contain many books and a Book can cover many genres.
     # Genre class has already been defined so we can specify the object above.
     language = models.ForeignKey('Language', on_delete=models.SET_NULL, null=True)
-    
+    # When the book, or anything shown with it (copies, author, genres), last changed (see catalog.conditional).
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    # Numbers of copies of the book: all of them, those available, and those on loan. These are
+    # kept up to date by catalog.stats (use `manage.py rebuild_copy_counts` to recount them).
+    copies_total = models.PositiveIntegerField(default=0, editable=False)
+    copies_available = models.PositiveIntegerField(default=0, editable=False)
+    copies_on_loan = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = CatalogQuerySet.as_manager()
+
+    # Fields whose old values are passed to catalog.signals.bulk_updated receivers.
+    tracked_fields = ('title', 'author', 'summary', 'isbn', 'language')
+    # Fields only changed by catalog.stats, with F() expressions.
+    copy_count_fields = ('copies_total', 'copies_available', 'copies_on_loan')
+
     class Meta:
         ordering = ['title', 'author']
+        indexes = [
+            # Supports keyset pagination of the book list (see catalog.pagination). On PostgreSQL the
+            # author is indexed NULLS FIRST, like the book list orders it (see migration 0034).
+            models.Index(fields=['title', 'author', 'id'], name='book_title_author_idx'),
+        ]
 
     def display_genre(self):
-        """Creates a string for the Genre. This is required to display genre in Admin."""
+        """Creates a string for the Genre. This is required to display genre in Admin.
+
+        Slicing uses the prefetched genres when there are any (see BookAdmin)."""
         return ', '.join([genre.name for genre in self.genre.all()[:3]])
 
     display_genre.short_description = 'Genre'
 
+    def save(self, *args, **kwargs):
+        """Saves the book, except for the copy counts when updating (which may have changed since it was loaded)."""
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name not in self.copy_count_fields]
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def rebuild_copy_counts(cls, book_ids=None):
+        """Recounts the copies of the given books (or of all books, if book_ids is None).
+
+        Only the books whose counts are wrong are updated (in one UPDATE), so the others keep their
+        `updated_at` and cached pages. Returns the number of books updated.
+        """
+        def count(**filters):
+            copies = BookInstance.objects.filter(book=models.OuterRef('pk'), **filters).order_by()
+            return Coalesce(models.Subquery(copies.values('book').annotate(count=Count('pk')).values('count')), 0)
+
+        if book_ids is not None and not book_ids:
+            return 0
+        counts = {'copies_total': count(), 'copies_available': count(status__exact='a'),
+                  'copies_on_loan': count(status__exact='o')}
+        books = cls.objects.all() if book_ids is None else cls.objects.filter(pk__in=book_ids)
+        wrong = list(books.alias(**{'new_' + name: value for name, value in counts.items()})
+                     .filter(~Q(**{name: F('new_' + name) for name in counts}))
+                     .order_by().values_list('pk', flat=True))
+        if not wrong:
+            return 0
+        num_books = cls.objects.filter(pk__in=wrong).update(**counts)
+        signals.copy_counts_rebuilt.send(sender=cls, book_ids=wrong)
+        return num_books
+
     def get_absolute_url(self):
         """Returns the url to access a particular book instance."""
         return reverse('book-detail', args=[str(self.id)])
@@ -61,13 +184,46 @@ class Book(models.Model):
         return self.title
 
 
+import datetime
 import uuid  # Required for unique book instances
 from datetime import date
 
+
+class BookInstanceQuerySet(CatalogQuerySet):
+    """QuerySet with loan queries for BookInstance (the filters can use the (status, due_back) index)."""
+
+    def on_loan(self):
+        """Returns the copies that are on loan."""
+        return self.filter(status__exact='o')
+
+    def overdue(self):
+        """Returns the copies on loan that were due back before today."""
+        return self.on_loan().filter(due_back__lt=timezone.localdate())
+
+    def due_within(self, days):
+        """Returns the copies on loan that are due back between today and `days` days from now."""
+        today = timezone.localdate()
+        return self.on_loan().filter(due_back__range=(today, today + datetime.timedelta(days=days)))
+
+    def renew(self, pks, due_back):
+        """Sets the due date of the copies with the given ids that are on loan, in a single UPDATE.
+
+        Returns the number of copies renewed and the number rejected (not on loan, or no such copy).
+        """
+        ids = set()
+        rejected = 0
+        for pk in set(map(str, pks)):
+            try:
+                ids.add(uuid.UUID(pk))
+            except ValueError:
+                rejected += 1
+        renewed = self.on_loan().filter(pk__in=ids).update(due_back=due_back) if ids else 0
+        return renewed, rejected + len(ids) - renewed
+
 from django.contrib.auth.models import User  # Required to assign User as a borrower
 
 
-class BookInstance(models.Model):
+class BookInstance(LoadedValuesMixin, AtomicSaveMixin, models.Model):
     """Model representing a specific copy of a book (i.e. that can be borrowed from the library)."""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4,
                           help_text="Unique ID for this particular book across whole library")
@@ -94,25 +250,87 @@ class BookInstance(models.Model):
         blank=True,
         default='d',
         help_text='Book availability')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = BookInstanceQuerySet.as_manager()
+
+    # Fields whose old values are passed to catalog.signals.bulk_updated receivers.
+    tracked_fields = ('status', 'book', 'imprint', 'due_back', 'borrower')
 
     class Meta:
         ordering = ['due_back']
         permissions = (("can_mark_returned", "Set book as returned"),)
+        indexes = [
+            # Copies with a given status, by due date (e.g. all books on loan, and the available count).
+            models.Index(fields=['status', 'due_back'], name='bookinstance_status_due_idx'),
+            # A user's books on loan, by due date.
+            models.Index(fields=['borrower', 'due_back'], condition=models.Q(status='o'),
+                         name='bookinstance_borrowed_idx'),
+        ]
 
     def __str__(self):
         """String for representing the Model object."""
         return '{0} ({1})'.format(self.id, self.book.title)
 
 
-class Author(models.Model):
+class HoldQuerySet(models.QuerySet):
+
+    def waiting(self):
+        """Returns the holds still waiting for a copy, first placed first."""
+        return self.filter(copy__isnull=True).order_by('placed_at', 'id')
+
+
+class Hold(models.Model):
+    """Model representing a borrower's place in the queue for a book (see catalog.loans).
+
+    When a copy of the book is returned it's reserved for the first waiting hold, which then
+    points at the copy until the borrower checks it out (and the hold is deleted).
+    """
+    book = models.ForeignKey('Book', on_delete=models.CASCADE)
+    borrower = models.ForeignKey(User, on_delete=models.CASCADE)
+    placed_at = models.DateTimeField(default=timezone.now)
+    # The copy reserved for the borrower, once there is one.
+    copy = models.OneToOneField(BookInstance, on_delete=models.SET_NULL, null=True, blank=True)
+
+    objects = HoldQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['placed_at', 'id']
+        constraints = [
+            # A borrower is only in the queue for a book once.
+            models.UniqueConstraint(fields=['book', 'borrower'], name='hold_book_borrower_unique'),
+        ]
+        indexes = [
+            # The queue for a book.
+            models.Index(fields=['book', 'placed_at', 'id'], condition=models.Q(copy__isnull=True),
+                         name='hold_queue_idx'),
+        ]
+
+    def __str__(self):
+        """String for representing the Model object."""
+        return '{0} for {1}'.format(self.book, self.borrower)
+
+
+class Author(AtomicSaveMixin, models.Model):
     """Model representing an author."""
     first_name = models.CharField(max_length=100)
     last_name = models.CharField(max_length=100)
     date_of_birth = models.DateField(null=True, blank=True)
     date_of_death = models.DateField('died', null=True, blank=True)
+    # When the author, or anything shown with them (their books and copies), last changed.
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = CatalogQuerySet.as_manager()
+
+    # Fields whose old values are passed to catalog.signals.bulk_updated receivers.
+    tracked_fields = ('first_name', 'last_name')
 
     class Meta:
         ordering = ['last_name', 'first_name']
+        indexes = [
+            # Supports keyset pagination of the author list (see catalog.pagination).
+            models.Index(fields=['last_name', 'first_name', 'id'], name='author_name_idx'),
+        ]
 
     def get_absolute_url(self):
         """Returns the url to access a particular author instance."""
@@ -121,3 +339,53 @@ class Author(models.Model):
     def __str__(self):
         """String for representing the Model object."""
         return '{0}, {1}'.format(self.last_name, self.first_name)
+
+
+class LibraryStats(models.Model):
+    """Model holding the record counts shown on the home page (there is only ever one row).
+
+    The counts are kept up to date from model signals by catalog.stats, so that the
+    home page does not have to count whole tables. Use `manage.py rebuild_library_stats`
+    to recalculate them from scratch.
+    """
+    num_books = models.PositiveIntegerField(default=0)
+    num_instances = models.PositiveIntegerField(default=0)
+    num_instances_available = models.PositiveIntegerField(default=0)
+    num_authors = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = 'library stats'
+
+    @classmethod
+    def load(cls):
+        """Returns the statistics record, creating it if needed."""
+        return cls.objects.filter(pk=1).first() or cls.rebuild()
+
+    @classmethod
+    def rebuild(cls):
+        """Recounts all the statistics from the catalog tables and returns the updated record."""
+        stats, created = cls.objects.update_or_create(pk=1, defaults={
+            'num_books': Book.objects.count(),
+            'num_instances': BookInstance.objects.count(),
+            'num_instances_available': BookInstance.objects.filter(status__exact='a').count(),
+            'num_authors': Author.objects.count(),
+        })
+        return stats
+
+    def __str__(self):
+        """String for representing the Model object."""
+        return 'Library statistics'
+
+
+class DailyVisits(models.Model):
+    """Model representing the total number of home page visits on one day."""
+    date = models.DateField(unique=True)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-date']
+        verbose_name_plural = 'daily visits'
+
+    def __str__(self):
+        """String for representing the Model object."""
+        return '{0}: {1}'.format(self.date, self.count)
@@ -0,0 +1,282 @@
+"""Keyset (or "cursor") pagination, and offset pagination with estimated counts.
+
+Offset pagination (Django's Paginator) counts the whole result and then skips
+OFFSET rows to reach a page, so later pages get slower. Keyset pagination
+instead remembers the ordering values of the last row on a page (encoded in an
+opaque cursor) and asks for the rows that sort after them, which an index on
+the ordering columns can answer directly however deep the page is.
+
+Where page numbers are still wanted, EstimatedCountPaginator avoids the exact
+count of large results by using the database's own estimate of the number of
+rows (from its table statistics, or its query planner).
+"""
+import base64
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.paginator import EmptyPage, Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import F, Q, QuerySet
+from django.http import Http404
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class KeysetPage:
+    """A page of results from a KeysetPaginator (provides the parts of the Page interface that make sense)."""
+    cursor_based = True
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return '<Keyset page of {0} objects>'.format(len(self.object_list))
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    @property
+    def next_cursor(self):
+        """Cursor for the page after this one (None if there is no next page)."""
+        if self.has_next() and self.object_list:
+            return self.paginator.encode_cursor(self.object_list[-1], 'next')
+
+    @property
+    def previous_cursor(self):
+        """Cursor for the page before this one (None if there is no previous page)."""
+        if self.has_previous() and self.object_list:
+            return self.paginator.encode_cursor(self.object_list[0], 'previous')
+
+
+class KeysetPaginator:
+    """Paginates a queryset by seeking past the ordering values of the previous page.
+
+    `ordering` is a sequence of field names that together identify a row (so it should
+    end with the primary key). Null values sort first. The first page is requested with
+    an empty cursor; later pages with the page's `next_cursor` or `previous_cursor`.
+    """
+
+    def __init__(self, object_list, per_page, ordering):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        self.ordering = ordering
+        self.fields = self.ordering_fields(object_list.model, ordering)
+
+    @staticmethod
+    def ordering_fields(model, ordering):
+        return [model._meta.get_field(name) if name != 'pk' else model._meta.pk for name in ordering]
+
+    @classmethod
+    def order_by(cls, model, ordering, forwards=True):
+        """Returns the order_by() expressions of the keyset `ordering` of `model` (by the fields' own
+        columns, so a foreign key sorts by its id, not by the related model's ordering).
+
+        Nulls sort first, but the nulls position is only given for the nullable columns: an index
+        on the ordering columns must order them the same way to be used (on PostgreSQL, where nulls
+        sort last by default, declare the nullable ones with F(...).asc(nulls_first=True)).
+        """
+        fields = cls.ordering_fields(model, ordering)
+        if forwards:
+            return [F(field.attname).asc(nulls_first=True) if field.null else F(field.attname).asc()
+                    for field in fields]
+        return [F(field.attname).desc(nulls_last=True) if field.null else F(field.attname).desc()
+                for field in fields]
+
+    def page(self, cursor=''):
+        """Returns the KeysetPage for `cursor` (raising InvalidCursor if it can't be decoded)."""
+        values, direction = self.decode_cursor(cursor) if cursor else (None, 'next')
+        forwards = direction == 'next'
+        queryset = self.object_list.order_by(*self.order_by(self.object_list.model, self.ordering, forwards))
+        if values is not None:
+            queryset = queryset.filter(self.seek(values, forwards))
+
+        # Get one more row than needed, to find out whether there is another page.
+        object_list = list(queryset[:self.per_page + 1])
+        more = len(object_list) > self.per_page
+        object_list = object_list[:self.per_page]
+        if forwards:
+            return KeysetPage(object_list, self, has_next=more, has_previous=values is not None)
+        object_list.reverse()
+        return KeysetPage(object_list, self, has_next=True, has_previous=more)
+
+    def seek(self, values, forwards):
+        """Returns a filter matching the rows that sort after (or before) the given ordering values."""
+        condition = Q(pk__in=[])
+        equal = Q()
+        for field, value in zip(self.fields, values):
+            condition |= equal & self.beyond(field.attname, value, forwards)
+            equal &= Q(**{field.attname + '__isnull': True}) if value is None else Q(**{field.attname: value})
+        # Also bound the first ordering column on its own, so the database can start
+        # an index range scan there rather than testing the whole condition on each row.
+        name, value = self.fields[0].attname, values[0]
+        if value is not None:
+            if forwards:
+                condition &= Q(**{name + '__gte': value})
+            else:
+                condition &= Q(**{name + '__lte': value}) | Q(**{name + '__isnull': True})
+        return condition
+
+    @staticmethod
+    def beyond(name, value, forwards):
+        """Returns a filter matching values of field `name` after (or before) `value`, with nulls first."""
+        if forwards:
+            return Q(**{name + '__isnull': False}) if value is None else Q(**{name + '__gt': value})
+        if value is None:
+            return Q(pk__in=[])
+        return Q(**{name + '__lt': value}) | Q(**{name + '__isnull': True})
+
+    def encode_cursor(self, obj, direction):
+        # The objects may be model instances, or dicts from values().
+        values = [obj[field.attname] if isinstance(obj, dict) else getattr(obj, field.attname)
+                  for field in self.fields]
+        data = json.dumps({'v': values, 'd': direction}, cls=DjangoJSONEncoder, separators=(',', ':'))
+        return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            data = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+            values, direction = data['v'], data['d']
+            if direction not in ('next', 'previous') or len(values) != len(self.fields):
+                raise ValueError(direction)
+            return [None if value is None else field.to_python(value)
+                    for field, value in zip(self.fields, values)], direction
+        except (ValueError, TypeError, KeyError, ValidationError) as e:
+            raise InvalidCursor(cursor) from e
+
+
+class KeysetPaginationMixin:
+    """Adds an opt-in keyset pagination mode to a ListView.
+
+    Requests with a `cursor` query parameter (which may be empty, for the first page) are
+    paginated by seeking on `keyset_ordering`. Other requests use the normal ?page= pagination,
+    in the same order, so both list the objects alike.
+    """
+    keyset_ordering = None
+    cursor_kwarg = 'cursor'
+
+    def get_ordering(self):
+        return KeysetPaginator.order_by(self.model, self.keyset_ordering)
+
+    def paginate_queryset(self, queryset, page_size):
+        if self.cursor_kwarg not in self.request.GET:
+            return super().paginate_queryset(queryset, page_size)
+        paginator = KeysetPaginator(queryset, page_size, self.keyset_ordering)
+        try:
+            page = paginator.page(self.request.GET[self.cursor_kwarg])
+        except InvalidCursor:
+            raise Http404('Invalid cursor.')
+        return (paginator, page, page.object_list, page.has_other_pages())
+
+
+def estimate_count(queryset):
+    """Returns the database's estimate of the number of rows in `queryset`, or None if it has none.
+
+    PostgreSQL estimates the rows of a whole table from pg_class.reltuples, and those of other
+    queries from their plan. SQLite only estimates whole tables, from sqlite_stat1 (which is
+    filled in by ANALYZE).
+    """
+    if not isinstance(queryset, QuerySet):
+        return None
+    query = queryset.query
+    whole_table = not query.where and not query.distinct and not query.combinator and not query.is_sliced
+    connection = connections[queryset.db]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            if whole_table:
+                cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+                               [connection.ops.quote_name(queryset.model._meta.db_table)])
+                row = cursor.fetchone()
+                # reltuples is -1 (or 0, before PostgreSQL 14) for a table that hasn't been analyzed.
+                return int(row[0]) if row and row[0] > 0 else None
+            sql, params = queryset.order_by().query.sql_with_params()
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+            plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return int(plan[0]['Plan']['Plan Rows'])
+        if connection.vendor == 'sqlite' and whole_table:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+            if cursor.fetchone() is None:
+                return None
+            # The first number of each statistic is the number of rows in the table.
+            cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+            return int(row[0].split()[0]) if row else None
+    return None
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that uses the database's estimate of the number of rows when it's large.
+
+    Results estimated at fewer than `threshold` rows (by default the
+    CATALOG_ESTIMATED_COUNT_THRESHOLD setting) are counted exactly. Otherwise `count` is the
+    estimate and `estimated` is True, so templates can show "about" the number of pages. As the
+    estimate may be too low, pages past it can still be asked for, and whether a page has a next
+    one is found by fetching one more row than it shows.
+    """
+
+    def __init__(self, object_list, per_page, orphans=0, allow_empty_first_page=True, threshold=None):
+        super().__init__(object_list, per_page, orphans, allow_empty_first_page)
+        self.threshold = settings.CATALOG_ESTIMATED_COUNT_THRESHOLD if threshold is None else threshold
+        self.estimated = False
+
+    @cached_property
+    def count(self):
+        estimate = estimate_count(self.object_list)
+        if estimate is not None and estimate >= self.threshold:
+            self.estimated = True
+            return estimate
+        return super().count
+
+    def validate_number(self, number):
+        try:
+            return super().validate_number(number)
+        except EmptyPage:
+            # The estimate may be too low, so page() finds out whether pages past it exist.
+            if self.estimated and int(number) > 1:
+                return int(number)
+            raise
+
+    def page(self, number):
+        self.count  # Find out whether the count is an estimate.
+        if not self.estimated:
+            return super().page(number)
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        # Fetch one more row than fits on the page, to know whether there is a next page.
+        object_list = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not object_list and number > 1:
+            raise EmptyPage(_('That page contains no results'))
+        if len(object_list) <= self.per_page:
+            # This is the last page, so now the real count is known.
+            self.count = bottom + len(object_list)
+            self.estimated = False
+        elif self.count <= bottom + self.per_page:
+            # The estimate is too low: there is at least one more page.
+            self.count = bottom + len(object_list)
+        self.__dict__.pop('num_pages', None)
+        return self._get_page(object_list[:self.per_page], number, self)
@@ -0,0 +1,61 @@
+"""Running independent database queries at once from async views.
+
+Django 4.0 has no asynchronous ORM, so an async view has to run its queries in
+threads (with sync_to_async). gather_queries() runs each of several independent
+functions in a thread of its own, so that their queries run at the same time,
+each on its thread's own database connection.
+
+The threads are those of one executor kept for the life of the process (not the
+event loop's default executor: under WSGI each request to an async view gets an
+event loop of its own, whose threads would exit leaving their connections open).
+Their connections are then reused like the request threads' ones.
+"""
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections, connections
+
+from .metrics import current_timing
+
+# The threads running gather_queries() functions (so at most this many extra connections per process).
+executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='gather_queries')
+
+
+def in_transaction():
+    """Returns whether any database connection of this thread is in a transaction."""
+    return any(connection.in_atomic_block for connection in connections.all())
+
+
+def with_own_connections(function):
+    """Returns a function calling `function` that counts its queries in the request's timing (see
+    catalog.metrics), and then closes the thread's connections if they're too old to keep, as is
+    done at the end of a request (so connections are kept for CONN_MAX_AGE seconds)."""
+    def call():
+        timing = current_timing.get()
+        try:
+            with ExitStack() as stack:
+                if timing is not None:
+                    for connection in connections.all():
+                        stack.enter_context(connection.execute_wrapper(timing))
+                return function()
+        finally:
+            close_old_connections()
+    return call
+
+
+async def gather_queries(*functions):
+    """Calls the given functions (which query the database) at once, and returns their results in order.
+
+    If the request's connection is in a transaction (as in tests, or with ATOMIC_REQUESTS), the
+    functions are called one after the other in the request's thread instead, so that they see
+    the changes made in the transaction.
+    """
+    if await sync_to_async(in_transaction)():
+        return [await sync_to_async(function)() for function in functions]
+    loop = asyncio.get_running_loop()
+    return await asyncio.gather(*(loop.run_in_executor(executor, contextvars.copy_context().run,
+                                                       with_own_connections(function))
+                                  for function in functions))
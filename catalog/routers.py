@@ -0,0 +1,98 @@
+"""Routing reads of the catalog's book and author pages to read replicas.
+
+Views using ReplicaReadMixin (the book and author lists and detail pages) read
+the catalog's models from a replica chosen at random from the REPLICA_DATABASES
+setting; everything else, and all writes, use the primary ("default") database.
+
+A replica may be a little behind the primary, so a user who has just written
+something could miss their own change. ReplicaPinningMiddleware therefore sets a
+cookie whenever a request writes to the database, and for REPLICA_PIN_SECONDS
+after that the user's requests read only from the primary.
+"""
+import functools
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+PIN_COOKIE = 'db_pinned'
+
+
+class RequestState:
+    """Whether the current request is pinned to the primary, and whether it has written to the database."""
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+
+
+# The state of the request being handled (if any), and the replica its replica reads use.
+request_state = ContextVar('request_state', default=None)
+replica = ContextVar('replica', default=None)
+
+
+def choose_replica():
+    """Returns the alias of a replica for the current request to read from, or None to use the primary."""
+    state = request_state.get()
+    if not settings.REPLICA_DATABASES or (state is not None and state.pinned):
+        return None
+    return random.choice(settings.REPLICA_DATABASES)
+
+
+@contextmanager
+def reading_from(alias):
+    """Reads the catalog's models from the database `alias` (None for the usual routing) in the enclosed code."""
+    token = replica.set(alias)
+    try:
+        yield
+    finally:
+        replica.reset(token)
+
+
+class ReplicaRouter:
+    """Database router sending catalog reads to the current request's replica (if any), and writes to the primary."""
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == 'catalog':
+            return replica.get()
+        return None
+
+    def db_for_write(self, model, **hints):
+        state = request_state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their tables from the primary.
+        return db not in settings.REPLICA_DATABASES
+
+
+class ReplicaReadMixin:
+    """Makes a class-based view read the catalog from a replica, unless the user is pinned to the primary.
+
+    The replica is chosen around the whole view (including any decorators of its `dispatch`
+    method), and the view's queryset is bound to it, so results evaluated later (such as while
+    rendering the template) come from the same database.
+    """
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+
+        def replica_view(request, *args, **kwargs):
+            with reading_from(choose_replica()):
+                return view(request, *args, **kwargs)
+
+        return functools.update_wrapper(replica_view, view)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        alias = replica.get()
+        return queryset.using(alias) if alias else queryset
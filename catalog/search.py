@@ -0,0 +1,296 @@
+"""Full-text search of the book catalog.
+
+Each book has a search document made from its title, summary, ISBN, author's
+name and genre names. The documents are kept in a table next to the catalog:
+an FTS5 virtual table when using SQLite, and a tsvector column with a GIN index
+when using PostgreSQL (e.g. when DATABASE_URL points to Postgres). Other
+databases fall back to (unindexed) icontains matching.
+
+The documents are updated from model signals whenever a book, its author or its
+genres change. Use `manage.py rebuild_search_index` to rebuild them all.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .models import Author, Book, Genre
+from .signals import bulk_created, bulk_updated
+
+BOOK_TABLE = Book._meta.db_table
+AUTHOR_TABLE = Author._meta.db_table
+GENRE_TABLE = Genre._meta.db_table
+BOOK_GENRE_TABLE = Book.genre.through._meta.db_table
+
+# How many book ids to put in one "IN (...)" list.
+BATCH_SIZE = 500
+
+
+class SearchBackend:
+    """Fallback backend for databases without full-text search support: there is no index to maintain."""
+
+    def create_index(self, cursor):
+        pass
+
+    def drop_index(self, cursor):
+        pass
+
+    def index_books(self, cursor, book_ids=None):
+        pass
+
+    def remove_books(self, cursor, book_ids):
+        pass
+
+    def search(self, query):
+        """Returns the books containing every word of `query` in one of the indexed fields."""
+        words = re.findall(r'\w+', query)
+        if not words:
+            return Book.objects.none()
+        condition = Q()
+        for word in words:
+            condition &= (Q(title__icontains=word) | Q(summary__icontains=word) | Q(isbn__icontains=word)
+                          | Q(author__first_name__icontains=word) | Q(author__last_name__icontains=word)
+                          | Q(genre__name__icontains=word))
+        return Book.objects.filter(condition).select_related('author').distinct()
+
+
+class SQLiteSearchBackend(SearchBackend):
+    """Keeps the search documents in an FTS5 virtual table whose rowid is the book id."""
+    table = 'catalog_book_fts'
+    # Relative weights of the title, summary, isbn, authors and genres columns when ranking.
+    weights = (10.0, 1.0, 5.0, 5.0, 2.0)
+
+    def create_index(self, cursor):
+        cursor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS {0} USING fts5("
+            "title, summary, isbn, authors, genres, tokenize='unicode61 remove_diacritics 2')".format(self.table))
+
+    def drop_index(self, cursor):
+        cursor.execute('DROP TABLE IF EXISTS {0}'.format(self.table))
+
+    def index_books(self, cursor, book_ids=None):
+        """(Re)builds the documents for the given books (or all books, if book_ids is None)."""
+        sql = (
+            'INSERT INTO {fts}(rowid, title, summary, isbn, authors, genres) '
+            "SELECT b.id, b.title, b.summary, b.isbn, COALESCE(a.first_name || ' ' || a.last_name, ''), "
+            "COALESCE((SELECT group_concat(g.name, ' ') FROM {book_genre} bg "
+            "JOIN {genre} g ON g.id = bg.genre_id WHERE bg.book_id = b.id), '') "
+            'FROM {book} b LEFT JOIN {author} a ON a.id = b.author_id'
+        ).format(fts=self.table, book=BOOK_TABLE, author=AUTHOR_TABLE, genre=GENRE_TABLE,
+                 book_genre=BOOK_GENRE_TABLE)
+        if book_ids is None:
+            cursor.execute('DELETE FROM {0}'.format(self.table))
+            cursor.execute(sql)
+            return
+        for batch in batches(book_ids):
+            self.remove_books(cursor, batch)
+            cursor.execute('{0} WHERE b.id IN ({1})'.format(sql, placeholders(batch)), batch)
+
+    def remove_books(self, cursor, book_ids):
+        for batch in batches(book_ids):
+            cursor.execute('DELETE FROM {0} WHERE rowid IN ({1})'.format(self.table, placeholders(batch)), batch)
+
+    def search(self, query):
+        # Match every word in the query, allowing prefixes (so "harr pot" finds "Harry Potter").
+        words = re.findall(r'\w+', query)
+        match = ' '.join('"{0}"*'.format(word) for word in words)
+        where = 'FROM {0} WHERE {0} MATCH %s'.format(self.table)
+        return RankedSearchResults(
+            count_sql='SELECT COUNT(*) ' + where,
+            ids_sql='SELECT rowid {0} ORDER BY bm25({1}, {2}), rowid LIMIT %s OFFSET %s'.format(
+                where, self.table, ', '.join(str(weight) for weight in self.weights)),
+            params=[match] if words else None)
+
+
+class PostgreSQLSearchBackend(SearchBackend):
+    """Keeps the search documents in a weighted tsvector column with a GIN index."""
+    table = 'catalog_book_search'
+
+    def create_index(self, cursor):
+        cursor.execute(
+            'CREATE TABLE IF NOT EXISTS {0} ('
+            'book_id bigint PRIMARY KEY, document tsvector NOT NULL)'.format(self.table))
+        cursor.execute('CREATE INDEX IF NOT EXISTS {0}_document_idx ON {0} USING GIN (document)'.format(self.table))
+
+    def drop_index(self, cursor):
+        cursor.execute('DROP TABLE IF EXISTS {0}'.format(self.table))
+
+    def index_books(self, cursor, book_ids=None):
+        """(Re)builds the documents for the given books (or all books, if book_ids is None)."""
+        sql = (
+            'INSERT INTO {search}(book_id, document) '
+            "SELECT b.id, setweight(to_tsvector('english', b.title), 'A') "
+            "|| setweight(to_tsvector('simple', COALESCE(a.first_name || ' ' || a.last_name, '')), 'B') "
+            "|| setweight(to_tsvector('simple', COALESCE((SELECT string_agg(g.name, ' ') FROM {book_genre} bg "
+            "JOIN {genre} g ON g.id = bg.genre_id WHERE bg.book_id = b.id), '')), 'B') "
+            "|| setweight(to_tsvector('simple', b.isbn), 'B') "
+            "|| setweight(to_tsvector('english', b.summary), 'D') "
+            'FROM {book} b LEFT JOIN {author} a ON a.id = b.author_id'
+        ).format(search=self.table, book=BOOK_TABLE, author=AUTHOR_TABLE, genre=GENRE_TABLE,
+                 book_genre=BOOK_GENRE_TABLE)
+        if book_ids is None:
+            cursor.execute('TRUNCATE {0}'.format(self.table))
+            cursor.execute(sql)
+            return
+        for batch in batches(book_ids):
+            cursor.execute(
+                '{0} WHERE b.id IN ({1}) ON CONFLICT (book_id) DO UPDATE SET document = EXCLUDED.document'.format(
+                    sql, placeholders(batch)), batch)
+
+    def remove_books(self, cursor, book_ids):
+        for batch in batches(book_ids):
+            cursor.execute('DELETE FROM {0} WHERE book_id IN ({1})'.format(self.table, placeholders(batch)), batch)
+
+    def search(self, query):
+        # Match the query both stemmed (for the title and summary) and as-is (for names and the ISBN).
+        tsquery = "(websearch_to_tsquery('english', %s) || websearch_to_tsquery('simple', %s))"
+        where = 'FROM {0} WHERE document @@ {1}'.format(self.table, tsquery)
+        return RankedSearchResults(
+            count_sql='SELECT COUNT(*) ' + where,
+            ids_sql='SELECT book_id {0} ORDER BY ts_rank_cd(document, {1}) DESC, book_id LIMIT %s OFFSET %s'.format(
+                where, tsquery),
+            params=[query, query] if query.strip() else None,
+            rank_params=[query, query])
+
+
+class RankedSearchResults:
+    """The books matching a full-text query, best first, fetched a slice at a time (e.g. by a Paginator)."""
+
+    def __init__(self, count_sql, ids_sql, params, rank_params=()):
+        self.count_sql = count_sql
+        self.ids_sql = ids_sql
+        self.params = params
+        self.rank_params = list(rank_params)
+        self._count = None
+
+    def count(self):
+        if self.params is None:
+            return 0
+        if self._count is None:
+            with connection.cursor() as cursor:
+                cursor.execute(self.count_sql, self.params)
+                self._count = cursor.fetchone()[0]
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice) or index.step is not None:
+            raise TypeError('Search results only support slicing.')
+        if self.params is None:
+            return []
+        start = index.start or 0
+        limit = (index.stop if index.stop is not None else self.count()) - start
+        with connection.cursor() as cursor:
+            cursor.execute(self.ids_sql, self.params + self.rank_params + [max(limit, 0), start])
+            ids = [row[0] for row in cursor.fetchall()]
+        books = Book.objects.select_related('author').in_bulk(ids)
+        return [books[book_id] for book_id in ids if book_id in books]
+
+
+def batches(ids):
+    ids = list(ids)
+    for start in range(0, len(ids), BATCH_SIZE):
+        yield ids[start:start + BATCH_SIZE]
+
+
+def placeholders(values):
+    return ', '.join(['%s'] * len(values))
+
+
+def get_backend(vendor=None):
+    """Returns the search backend for the given database vendor (default: the default database's)."""
+    vendor = vendor or connection.vendor
+    if vendor == 'sqlite':
+        return SQLiteSearchBackend()
+    if vendor == 'postgresql':
+        return PostgreSQLSearchBackend()
+    return SearchBackend()
+
+
+def search_books(query):
+    """Returns the books matching `query`, best matches first, as a sliceable sequence with a count()."""
+    return get_backend().search(query)
+
+
+def index_books(book_ids=None):
+    """Updates the search documents of the given books (or rebuilds all of them, if book_ids is None)."""
+    with connection.cursor() as cursor:
+        get_backend().index_books(cursor, book_ids)
+
+
+def remove_books(book_ids):
+    """Removes the given books from the search index."""
+    with connection.cursor() as cursor:
+        get_backend().remove_books(cursor, book_ids)
+
+
+# Signal handlers keeping the index in step with the catalog.
+
+@receiver(post_save, sender=Book)
+def book_saved(sender, instance, **kwargs):
+    index_books([instance.pk])
+
+
+@receiver(m2m_changed, sender=Book.genre.through)
+def book_genres_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == 'pre_clear':
+        # genre.book_set.clear(): remember the books now, as the links are gone by post_clear.
+        instance._search_book_ids = list(instance.book_set.values_list('pk', flat=True))
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        index_books([instance.pk])
+    elif pk_set:
+        # genre.book_set.add()/remove(): pk_set holds the books.
+        index_books(pk_set)
+    else:
+        index_books(getattr(instance, '_search_book_ids', []))
+
+
+@receiver(post_delete, sender=Book)
+def book_deleted(sender, instance, **kwargs):
+    remove_books([instance.pk])
+
+
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=Genre)
+def book_names_saved(sender, instance, created, **kwargs):
+    if not created:
+        index_books(instance.book_set.values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=Author)
+@receiver(pre_delete, sender=Genre)
+def book_names_deleting(sender, instance, **kwargs):
+    # Remember the books now: the links to them are gone by the time of post_delete.
+    instance._search_book_ids = list(instance.book_set.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Author)
+@receiver(post_delete, sender=Genre)
+def book_names_deleted(sender, instance, **kwargs):
+    index_books(getattr(instance, '_search_book_ids', []))
+
+
+@receiver(bulk_created, sender=Book)
+def books_bulk_created(sender, objs, **kwargs):
+    book_ids = [obj.pk for obj in objs]
+    if None in book_ids:
+        # The database didn't return the new ids, so find the books by their (unique) ISBN.
+        book_ids = Book.objects.filter(isbn__in=[obj.isbn for obj in objs]).values_list('pk', flat=True)
+    index_books(book_ids)
+
+
+@receiver(bulk_updated, sender=Book)
+@receiver(bulk_updated, sender=Author)
+def books_bulk_updated(sender, values, rows, **kwargs):
+    if rows is None:
+        return
+    pks = [row['pk'] for row in rows]
+    if sender is Author:
+        pks = Book.objects.filter(author__in=pks).values_list('pk', flat=True)
+    index_books(pks)
@@ -0,0 +1,24 @@
+"""Custom signals sent by the catalog models.
+
+QuerySet.bulk_create() and QuerySet.update() write straight to the database and
+do not send the per-object pre_save/post_save signals. CatalogQuerySet sends the
+signals below instead, so that anything maintained from model signals can also
+follow bulk writes.
+"""
+from django.dispatch import Signal
+
+# Sent after QuerySet.bulk_create() with arguments: sender (the model class),
+# objs (the list of objects passed in) and ignore_conflicts (if True, some of
+# the objects may not have been inserted).
+bulk_created = Signal()
+
+# Sent after QuerySet.update() with arguments: sender (the model class),
+# values (the keyword arguments passed to update()) and rows (a list of dicts
+# holding the primary key and the values of the model's `tracked_fields` as they
+# were *before* the update, or None if no tracked field was updated).
+bulk_updated = Signal()
+
+# Sent by Book.rebuild_copy_counts() with arguments: sender (Book) and book_ids
+# (the books whose copy counts it corrected). Its update() only updates the
+# untracked copy count fields, so bulk_updated is sent with rows=None.
+copy_counts_rebuilt = Signal()
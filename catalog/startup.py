@@ -0,0 +1,96 @@
+"""Getting a server ready before it handles its first request.
+
+Migrations are applied in the release phase (see the Procfile) rather than each
+time the server starts, so a starting server only checks that none are missing,
+which unapplied_migrations() does without loading the migration graph.
+
+Gunicorn (see gunicorn.conf.py) loads the application in its master process and
+calls prepare() there before forking its workers, so the workers start with the
+URL patterns and templates already loaded by warm_up(), instead of each loading
+them while handling its first requests.
+"""
+import os
+import pkgutil
+from importlib import import_module
+
+from django.apps import apps
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.migrations.executor import MigrationExecutor
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.recorder import MigrationRecorder
+from django.template import engines
+from django.template.loader import get_template
+from django.urls import resolve, reverse
+
+
+def migration_files():
+    """Returns the (app label, migration name) of each migration file of the installed apps."""
+    files = []
+    for app_config in apps.get_app_configs():
+        module_name, explicit = MigrationLoader.migrations_module(app_config.label)
+        try:
+            module = import_module(module_name) if module_name else None
+        except ModuleNotFoundError:
+            continue
+        if module is None or not hasattr(module, '__path__'):
+            continue
+        # Files starting with "_" or "~" aren't migrations (as in MigrationLoader).
+        files.extend((app_config.label, info.name) for info in pkgutil.iter_modules(module.__path__)
+                     if not info.ispkg and info.name[0] not in '_~')
+    return files
+
+
+def unapplied_migrations(using=DEFAULT_DB_ALIAS):
+    """Returns the (app label, migration name) of the migrations not applied to the database, sorted.
+
+    This compares the migration files with the migrations recorded as applied, which needs
+    a single query. Only if some look unapplied is the migration graph loaded (which imports
+    every migration) to be sure, as a squashed migration isn't always recorded itself.
+    """
+    connection = connections[using]
+    applied = MigrationRecorder(connection).applied_migrations()
+    if not set(migration_files()) - set(applied):
+        return []
+    executor = MigrationExecutor(connection)
+    plan = executor.migration_plan(executor.loader.graph.leaf_nodes())
+    return sorted((migration.app_label, migration.name) for migration, backwards in plan)
+
+
+def template_names(directory):
+    """Returns the names of the templates in `directory` (relative to it)."""
+    names = []
+    for root, dirs, files in os.walk(directory):
+        names.extend(os.path.relpath(os.path.join(root, name), directory) for name in files
+                     if name.endswith(('.html', '.txt')))
+    return sorted(names)
+
+
+def warm_up():
+    """Loads the URL patterns and compiles the site's templates (those of the project and the catalog).
+
+    Templates are kept once compiled only by the cached template loader, which is used
+    when DEBUG is False.
+    """
+    resolve(reverse('index'))
+    directories = [os.path.join(apps.get_app_config('catalog').path, 'templates')]
+    for engine in engines.all():
+        directories.extend(getattr(engine, 'dirs', []))
+    for directory in directories:
+        for name in template_names(directory):
+            get_template(name)
+
+
+def prepare(using=DEFAULT_DB_ALIAS):
+    """Checks that all migrations are applied and warms up the application (see the module's docstring).
+
+    Raises RuntimeError naming the unapplied migrations, if any.
+    """
+    try:
+        unapplied = unapplied_migrations(using)
+    finally:
+        # Don't share the connection with the processes forked from this one.
+        connections[using].close()
+    if unapplied:
+        raise RuntimeError('The database is missing migrations (run "manage.py migrate"): {0}'.format(
+            ', '.join('{0}.{1}'.format(*migration) for migration in unapplied)))
+    warm_up()
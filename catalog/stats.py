@@ -0,0 +1,147 @@
+"""Keep the LibraryStats record counts, and the copy counts of each Book, in step with the catalog.
+
+Each change to a Book, Author or BookInstance adjusts the counts with an F()
+expression. The models save and delete in a transaction (see AtomicSaveMixin),
+so the counts, and the other receivers' writes, are committed with the change
+itself or not at all. Bulk writes are followed using the signals sent by
+CatalogQuerySet (the copy counts of the books they affect are recounted, in one
+UPDATE), in update()'s transaction.
+
+This isn't free: with the `updated_at` touches of catalog.conditional, saving a
+copy with a new status takes 8 queries rather than 1, and a loans.checkout() 20.
+"""
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Author, Book, BookInstance, LibraryStats
+from .signals import bulk_created, bulk_updated
+
+
+def adjust(**deltas):
+    """Adds the given (possibly negative) amounts to the named LibraryStats counts."""
+    deltas = {name: F(name) + delta for name, delta in deltas.items() if delta}
+    if deltas and not LibraryStats.objects.filter(pk=1).update(**deltas):
+        # No statistics record yet: count everything (including this change).
+        LibraryStats.rebuild()
+
+
+COUNT_FIELDS = {Book: 'num_books', Author: 'num_authors', BookInstance: 'num_instances'}
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_save, sender=Author)
+def record_created(sender, instance, created, **kwargs):
+    if created:
+        adjust(**{COUNT_FIELDS[sender]: 1})
+
+
+@receiver(post_delete, sender=Book)
+@receiver(post_delete, sender=Author)
+def record_deleted(sender, instance, **kwargs):
+    adjust(**{COUNT_FIELDS[sender]: -1})
+
+
+@receiver(post_save, sender=BookInstance)
+def bookinstance_saved(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        adjust(num_instances=1, num_instances_available=int(instance.status == 'a'))
+    elif update_fields is None or 'status' in update_fields:
+        old_status = instance.loaded_value('status')
+        if old_status is None:
+            # We don't know what the status was, so count from scratch.
+            LibraryStats.rebuild()
+        else:
+            adjust(num_instances_available=int(instance.status == 'a') - int(old_status == 'a'))
+
+
+@receiver(post_delete, sender=BookInstance)
+def bookinstance_deleted(sender, instance, **kwargs):
+    adjust(num_instances=-1, num_instances_available=-int(instance.status == 'a'))
+
+
+@receiver(bulk_created)
+def records_bulk_created(sender, objs, ignore_conflicts, **kwargs):
+    if sender not in COUNT_FIELDS:
+        return
+    if ignore_conflicts:
+        # Some of the objects may already have existed, so the number inserted is unknown.
+        LibraryStats.rebuild()
+        return
+    deltas = {COUNT_FIELDS[sender]: len(objs)}
+    if sender is BookInstance:
+        deltas['num_instances_available'] = sum(obj.status == 'a' for obj in objs)
+    adjust(**deltas)
+
+
+@receiver(bulk_updated, sender=BookInstance)
+def bookinstances_bulk_updated(sender, values, rows, **kwargs):
+    if 'status' not in values:
+        return
+    new_status = values['status']
+    if not isinstance(new_status, str):
+        # An expression such as F() or Case(): the new values can't be known here.
+        LibraryStats.rebuild()
+        return
+    was_available = sum(row['status'] == 'a' for row in rows)
+    now_available = len(rows) if new_status == 'a' else 0
+    adjust(num_instances_available=now_available - was_available)
+
+
+# The copy counts of each book.
+
+def copy_counts(status):
+    """Returns the deltas of the copy counts of a book for one copy with `status`."""
+    return {'copies_total': 1, 'copies_available': int(status == 'a'), 'copies_on_loan': int(status == 'o')}
+
+
+def adjust_copies(book_id, old_status=None, new_status=None):
+    """Adjusts the copy counts of a book for one of its copies going from `old_status` to `new_status`
+    (with None for a copy added to the book, or removed from it), in one UPDATE."""
+    deltas = dict.fromkeys(copy_counts(None), 0)
+    for status, sign in ((old_status, -1), (new_status, 1)):
+        if status is not None:
+            for name, delta in copy_counts(status).items():
+                deltas[name] += sign * delta
+    deltas = {name: F(name) + delta for name, delta in deltas.items() if delta}
+    if book_id is not None and deltas:
+        Book.objects.filter(pk=book_id).update(**deltas)
+
+
+@receiver(post_save, sender=BookInstance)
+def copy_saved(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        adjust_copies(instance.book_id, new_status=instance.status)
+        return
+    if update_fields is not None and 'status' not in update_fields and 'book' not in update_fields:
+        return
+    old_book_id, old_status = instance.loaded_value('book_id'), instance.loaded_value('status')
+    if old_status is None:
+        # We don't know what the copy was before, so recount its book(s).
+        Book.rebuild_copy_counts({instance.book_id, old_book_id} - {None})
+    elif old_book_id == instance.book_id:
+        adjust_copies(instance.book_id, old_status, instance.status)
+    else:
+        adjust_copies(old_book_id, old_status=old_status)
+        adjust_copies(instance.book_id, new_status=instance.status)
+
+
+@receiver(post_delete, sender=BookInstance)
+def copy_deleted(sender, instance, **kwargs):
+    adjust_copies(instance.book_id, old_status=instance.status)
+
+
+@receiver(bulk_created, sender=BookInstance)
+def copies_bulk_created(sender, objs, **kwargs):
+    Book.rebuild_copy_counts({obj.book_id for obj in objs} - {None})
+
+
+@receiver(bulk_updated, sender=BookInstance)
+def copies_bulk_updated(sender, values, rows, **kwargs):
+    if 'status' not in values and 'book' not in values:
+        return
+    # The books the copies belong to now and, if they were moved, before.
+    book_ids = set(BookInstance.objects.filter(pk__in=[row['pk'] for row in rows]).values_list('book_id', flat=True))
+    if 'book' in values:
+        book_ids.update(row['book'] for row in rows)
+    Book.rebuild_copy_counts(book_ids - {None})
@@ -0,0 +1,199 @@
+import datetime
+
+from django.contrib.admin import helpers
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from catalog.models import Author, Book, BookInstance, Genre, Hold, Language
+
+
+class BookInstanceAdminTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = User.objects.create_superuser(username='admin', password='1X<ISRUkw+tuK')
+        author = Author.objects.create(first_name='John', last_name='Smith')
+        book = Book.objects.create(title='Book Title', summary='My book summary', isbn='ABCDEFG', author=author)
+        due_back = datetime.date.today() + datetime.timedelta(days=5)
+        cls.loans = [BookInstance.objects.create(book=book, imprint='Unlikely Imprint, 2016', due_back=due_back,
+                                                 borrower=cls.admin_user, status='o') for copy in range(2)]
+        cls.available = BookInstance.objects.create(book=book, imprint='Unlikely Imprint, 2016', status='a')
+
+    def setUp(self):
+        self.client.login(username='admin', password='1X<ISRUkw+tuK')
+        self.url = reverse('admin:catalog_bookinstance_changelist')
+        self.selected = [copy.pk for copy in self.loans + [self.available]]
+
+    def test_renew_action_asks_for_date(self):
+        response = self.client.post(self.url, {'action': 'renew_loans', helpers.ACTION_CHECKBOX_NAME: self.selected})
+        self.assertTemplateUsed(response, 'admin/catalog/bookinstance/renew_loans.html')
+        self.assertContains(response, 'Renew the 3 selected loans')
+
+    def test_renew_action_renews_loans(self):
+        renewal_date = datetime.date.today() + datetime.timedelta(weeks=2)
+        response = self.client.post(self.url, {'action': 'renew_loans', helpers.ACTION_CHECKBOX_NAME: self.selected,
+                                               'renewal_date': renewal_date, 'apply': 'Renew'}, follow=True)
+        self.assertContains(response, 'Renewed 2 loans.')
+        self.assertContains(response, '1 selected copy was not on loan, so not renewed.')
+        self.assertEqual(BookInstance.objects.filter(due_back=renewal_date).count(), 2)
+
+    def test_renew_action_rejects_invalid_date(self):
+        renewal_date = datetime.date.today() + datetime.timedelta(weeks=5)
+        response = self.client.post(self.url, {'action': 'renew_loans', helpers.ACTION_CHECKBOX_NAME: self.selected,
+                                               'renewal_date': renewal_date, 'apply': 'Renew'})
+        self.assertContains(response, 'Invalid date - renewal more than 4 weeks ahead')
+        self.assertFalse(BookInstance.objects.filter(due_back=renewal_date).exists())
+
+    def test_return_action_serves_holds(self):
+        waiting = User.objects.create_user(username='reader', password='2HJ1vRV0Z&3iD')
+        hold = Hold.objects.create(book=self.available.book, borrower=waiting)
+        response = self.client.post(self.url, {'action': 'return_loans', helpers.ACTION_CHECKBOX_NAME: self.selected},
+                                    follow=True)
+        self.assertContains(response, 'Returned 2 loans (1 reserved for holds).')
+        self.assertEqual(BookInstance.objects.filter(status__exact='a').count(), 2)
+        hold.refresh_from_db()
+        self.assertEqual((hold.copy.status, hold.copy.borrower), ('r', waiting))
+
+
+class ChangelistQueryCountTest(TestCase):
+    """The admin changelists run the same number of queries for a page of 5 rows as for 100."""
+
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.create_superuser(username='admin', password='1X<ISRUkw+tuK')
+        cls.genres = [Genre.objects.create(name='Genre {0}'.format(number)) for number in range(4)]
+
+    def setUp(self):
+        self.client.login(username='admin', password='1X<ISRUkw+tuK')
+
+    def add_rows(self, number):
+        """Adds `number` books, each with its own author, all the genres and one copy on loan."""
+        borrower = User.objects.create_user(username='reader{0}'.format(Book.objects.count()), password='x')
+        for _ in range(number):
+            count = Book.objects.count()
+            author = Author.objects.create(first_name='John', last_name='Smith {0}'.format(count))
+            book = Book.objects.create(title='Book {0}'.format(count), summary='My book summary',
+                                       isbn='ISBN{0}'.format(count), author=author)
+            book.genre.set(self.genres)
+            BookInstance.objects.create(book=book, imprint='Unlikely Imprint, 2016', borrower=borrower,
+                                        due_back=datetime.date.today(), status='o')
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def assertConstantQueries(self, url):
+        self.add_rows(5)
+        few = self.count_queries(url)
+        self.add_rows(95)
+        response = self.client.get(url)
+        self.assertEqual(response.context['cl'].result_count, 100)
+        self.assertEqual(len(response.context['cl'].result_list), 100)
+        self.assertEqual(self.count_queries(url), few)
+
+    def test_book_changelist(self):
+        self.assertConstantQueries(reverse('admin:catalog_book_changelist'))
+
+    def test_bookinstance_changelist(self):
+        self.assertConstantQueries(reverse('admin:catalog_bookinstance_changelist'))
+
+    def test_author_changelist(self):
+        self.assertConstantQueries(reverse('admin:catalog_author_changelist'))
+
+
+class PaginatedInlineTest(TestCase):
+    """The book and author change pages show a page of copies or books, however many there are."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = User.objects.create_superuser(username='admin', password='1X<ISRUkw+tuK')
+        cls.author = Author.objects.create(first_name='John', last_name='Smith')
+        cls.book = Book.objects.create(title='Book Title', summary='My book summary', isbn='ABCDEFG',
+                                       author=cls.author)
+
+    def setUp(self):
+        self.client.login(username='admin', password='1X<ISRUkw+tuK')
+        self.book_url = reverse('admin:catalog_book_change', args=[self.book.pk])
+        self.author_url = reverse('admin:catalog_author_change', args=[self.author.pk])
+
+    def add_copies(self, number):
+        BookInstance.objects.bulk_create([
+            BookInstance(book=self.book, imprint='Imprint {0:03}'.format(n), borrower=self.admin_user, status='o',
+                         due_back=datetime.date.today()) for n in range(number)])
+
+    def add_books(self, number):
+        start = Book.objects.count()
+        for n in range(start, start + number):
+            Book.objects.create(title='Book {0:03}'.format(n), summary='My book summary', isbn='ISBN{0}'.format(n),
+                                author=self.author)
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_book_page_bounded(self):
+        self.add_copies(20)
+        self.client.get(self.book_url)  # Load content types into their cache.
+        response, queries = self.get(self.book_url)
+        self.add_copies(200)
+        large_response, large_queries = self.get(self.book_url)
+        self.assertEqual(large_queries, queries)
+        self.assertLess(abs(len(large_response.content) - len(response.content)), 1000)
+        formset = large_response.context['inline_admin_formsets'][0].formset
+        self.assertEqual(formset.initial_form_count(), 20)
+        self.assertContains(large_response, 'Book instances 1-20 of 220')
+
+    def test_author_page_bounded(self):
+        self.add_books(19)
+        self.client.get(self.author_url)  # Load content types into their cache.
+        response, queries = self.get(self.author_url)
+        self.add_books(100)
+        large_response, large_queries = self.get(self.author_url)
+        self.assertEqual(large_queries, queries)
+        self.assertLess(abs(len(large_response.content) - len(response.content)), 1000)
+
+    def test_other_pages(self):
+        self.add_copies(45)
+        response = self.client.get(self.book_url + '?bookinstance_set-page=3')
+        formset = response.context['inline_admin_formsets'][0].formset
+        self.assertEqual(formset.initial_form_count(), 5)
+        self.assertContains(response, 'Book instances 41-45 of 45')
+
+    def test_pages_of_alike_objects(self):
+        # Books with the same title (the inline's ordering) are each on one page.
+        Book.objects.bulk_create([Book(title='Book Title', summary='My book summary', isbn='ISBN{0}'.format(n),
+                                       author=self.author) for n in range(44)])
+        books = []
+        for page in (1, 2, 3):
+            response = self.client.get(self.author_url + '?book_set-page={0}'.format(page))
+            formset = response.context['inline_admin_formsets'][0].formset
+            books.extend(form.instance.pk for form in formset.initial_forms)
+        self.assertEqual(sorted(books), sorted(Book.objects.values_list('pk', flat=True)))
+
+    def test_save_page(self):
+        self.add_copies(25)
+        response = self.client.get(self.book_url + '?bookinstance_set-page=2')
+        formset = response.context['inline_admin_formsets'][0].formset
+        data = {'title': self.book.title, 'author': self.author.pk, 'summary': self.book.summary,
+                'isbn': self.book.isbn, 'genre': [Genre.objects.create(name='Fantasy').pk],
+                'language': Language.objects.create(name='English').pk}
+        management = formset.management_form
+        for name, field in management.fields.items():
+            data[management.add_prefix(name)] = management[name].value()
+        # Post only the forms of the copies on the page (not the extra empty forms).
+        data[management.add_prefix('TOTAL_FORMS')] = len(formset.initial_forms)
+        for form in formset.initial_forms:
+            for name in ('id', 'book', 'imprint', 'status', 'due_back', 'borrower'):
+                data[form.add_prefix(name)] = form[name].value()
+        data[formset.initial_forms[0].add_prefix('imprint')] = 'Renamed Imprint'
+        response = self.client.post(self.book_url + '?bookinstance_set-page=2', data)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(BookInstance.objects.filter(imprint='Renamed Imprint').count(), 1)
+        self.assertEqual(BookInstance.objects.count(), 25)
@@ -0,0 +1,128 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from catalog import api
+from catalog.models import Author, Book, BookInstance, Genre, Language
+
+
+class ApiTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(first_name='John', last_name='Smith')
+        cls.language = Language.objects.create(name='English')
+        cls.genres = [Genre.objects.create(name=name) for name in ('Fantasy', 'Adventure')]
+        cls.books = []
+        for number in range(5):
+            book = Book.objects.create(title='Book {0}'.format(number), summary='My book summary',
+                                       isbn='ISBN{0}'.format(number), author=cls.author, language=cls.language)
+            book.genre.set(cls.genres)
+            cls.books.append(book)
+        borrower = User.objects.create_user(username='borrower', password='1X<ISRUkw+tuK')
+        cls.loan = BookInstance.objects.create(book=cls.books[0], imprint='Unlikely Imprint, 2016', status='o',
+                                               borrower=borrower, due_back=datetime.date.today())
+        BookInstance.objects.create(book=cls.books[0], imprint='Unlikely Imprint, 2016', status='a')
+
+    def get(self, url, status=200):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status)
+        return response.json()
+
+    def test_book_list(self):
+        data = self.get(reverse('api-books'))
+        self.assertEqual([book['title'] for book in data['results']], ['Book {0}'.format(n) for n in range(5)])
+        self.assertEqual(data['results'][0], {
+            'id': self.books[0].pk, 'title': 'Book 0', 'isbn': 'ISBN0', 'language': 'English',
+            'author': {'id': self.author.pk, 'first_name': 'John', 'last_name': 'Smith'},
+            'genre': ['Adventure', 'Fantasy'], 'copies_total': 2, 'copies_available': 1,
+        })
+        self.assertIsNone(data['next'])
+
+    def test_sparse_fields(self):
+        data = self.get(reverse('api-books') + '?fields=id,title')
+        self.assertEqual(data['results'][0], {'id': self.books[0].pk, 'title': 'Book 0'})
+
+    def test_unknown_fields(self):
+        data = self.get(reverse('api-books') + '?fields=title,password', status=400)
+        self.assertEqual(data, {'error': 'Unknown fields: password.'})
+
+    def test_related_objects_read_per_page(self):
+        url = reverse('api-books') + '?fields=title,author,genre,copies'
+        with CaptureQueriesContext(connection) as few:
+            self.get(url + '&limit=1')
+        with CaptureQueriesContext(connection) as many:
+            self.get(url + '&limit=5')
+        self.assertEqual(len(many), len(few))
+
+    def test_cursor_pagination(self):
+        url, titles = reverse('api-books') + '?limit=2&fields=title', []
+        while url:
+            data = self.get(url)
+            titles.extend(book['title'] for book in data['results'])
+            url = data['next']
+        self.assertEqual(titles, ['Book {0}'.format(n) for n in range(5)])
+        self.assertIn('fields=title', data['previous'])
+
+    def test_invalid_cursor_and_limit(self):
+        self.assertEqual(self.get(reverse('api-books') + '?cursor=abc', status=400), {'error': 'Invalid cursor.'})
+        self.get(reverse('api-books') + '?limit=0', status=400)
+        self.get(reverse('api-books') + '?limit=many', status=400)
+
+    def test_book_detail_shows_copies(self):
+        data = self.get(reverse('api-book-detail', args=[self.books[0].pk]))
+        self.assertEqual(data['copies_on_loan'], 1)
+        self.assertEqual([(copy['status'], copy['due_back']) for copy in data['copies']],
+                         [('Available', None), ('On loan', datetime.date.today().isoformat())])
+
+    def test_embedded_copies_bounded(self):
+        urls = (reverse('api-book-detail', args=[self.books[1].pk]),
+                reverse('api-books') + '?limit=5&fields=id,copies')
+        sizes, queries = {}, {}
+        for copies, added in ((1, 1), (200, 199)):
+            BookInstance.objects.bulk_create(
+                [BookInstance(book=self.books[1], imprint='Imprint', status='a') for number in range(added)])
+            for url in urls:
+                with CaptureQueriesContext(connection) as captured:
+                    response = self.client.get(url)
+                sizes[url, copies], queries[url, copies] = len(response.content), len(captured)
+        for url in urls:
+            self.assertEqual(queries[url, 200], queries[url, 1])
+            self.assertLess(sizes[url, 200] - sizes[url, 1], 150 * api.EMBEDDED_COPIES)
+        data = self.get(urls[0])
+        self.assertEqual(len(data['copies']), api.EMBEDDED_COPIES)
+        self.assertEqual(data['copies_total'], 200)
+
+    def test_book_copies(self):
+        url, copies = self.get(reverse('api-book-detail', args=[self.books[0].pk]))['copies_url'] + '?limit=1', []
+        while url:
+            data = self.get(url)
+            copies.extend(data['results'])
+            url = data['next']
+        self.assertEqual([(copy['status'], copy['imprint']) for copy in copies],
+                         [('Available', 'Unlikely Imprint, 2016'), ('On loan', 'Unlikely Imprint, 2016')])
+        self.get(reverse('api-book-copies', args=[0]), status=404)
+
+    def test_book_detail_not_found(self):
+        self.get(reverse('api-book-detail', args=[0]), status=404)
+
+    def test_author_detail_embeds_books(self):
+        data = self.get(reverse('api-author-detail', args=[self.author.pk]) + '?fields=last_name,books')
+        self.assertEqual(data, {'last_name': 'Smith',
+                                'books': [{'id': book.pk, 'title': book.title} for book in self.books]})
+
+    def test_genres(self):
+        data = self.get(reverse('api-genres'))
+        self.assertEqual([genre['name'] for genre in data['results']], ['Adventure', 'Fantasy'])
+
+    def test_etag(self):
+        url = reverse('api-book-detail', args=[self.books[0].pk])
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # Returning the loan changes the book's copies, and so its ETag.
+        BookInstance.objects.filter(pk=self.loan.pk).update(status='a')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
@@ -0,0 +1,101 @@
+import datetime
+
+from django.contrib.auth.models import Permission, User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils.formats import date_format
+
+from catalog.cache import cache_stats
+from catalog.models import Author, Book, BookInstance, Genre
+
+
+@override_settings(CATALOG_PAGE_CACHE=True)
+class DetailPageCacheTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(first_name='John', last_name='Smith')
+        cls.book = Book.objects.create(title='Book Title', summary='My book summary', isbn='ABCDEFG',
+                                       author=cls.author)
+        cls.copy = BookInstance.objects.create(book=cls.book, imprint='Unlikely Imprint, 2016', status='a')
+
+    def setUp(self):
+        cache.clear()
+        self.book_url = reverse('book-detail', args=[self.book.pk])
+        self.author_url = reverse('author-detail', args=[self.author.pk])
+
+    def test_second_request_served_from_cache(self):
+        self.client.get(self.book_url)
+        # Only the query for the page's validators (see catalog.conditional).
+        with self.assertNumQueries(1):
+            response = self.client.get(self.book_url)
+        self.assertContains(response, 'Book Title')
+        self.assertEqual(cache_stats(), {'hits': 1, 'misses': 1, 'hit_rate': 0.5})
+
+    @override_settings(CATALOG_PAGE_CACHE=False)
+    def test_not_cached_when_turned_off(self):
+        # E.g. with the local memory cache, which other processes don't share.
+        self.client.get(self.book_url)
+        with self.assertNumQueries(5):
+            self.client.get(self.book_url)
+        self.assertEqual(cache_stats(), {'hits': 0, 'misses': 0, 'hit_rate': None})
+
+    def test_pages_cached_separately(self):
+        self.client.get(self.book_url)
+        with self.assertNumQueries(5):
+            self.client.get(self.book_url + '?page=2')
+
+    def test_user_specific_parts_not_cached(self):
+        self.client.get(self.book_url)
+        User.objects.create_user(username='testuser1', password='1X<ISRUkw+tuK')
+        self.client.login(username='testuser1', password='1X<ISRUkw+tuK')
+        response = self.client.get(self.book_url)
+        self.assertContains(response, 'User: testuser1')
+
+    def test_copy_status_change_invalidates_book_and_author(self):
+        self.assertContains(self.client.get(self.book_url), '1 available')
+        self.assertContains(self.client.get(self.author_url), '1 available')
+        self.copy.status = 'o'
+        self.copy.save()
+        self.assertContains(self.client.get(self.book_url), '1 on loan')
+        self.assertContains(self.client.get(self.author_url), '0 available')
+
+    def test_bulk_update_invalidates_book(self):
+        self.client.get(self.book_url)
+        BookInstance.objects.filter(book=self.book).update(status='d')
+        self.assertContains(self.client.get(self.book_url), '1 maintenance')
+
+    def test_author_change_invalidates_book(self):
+        self.client.get(self.book_url)
+        self.author.last_name = 'Jones'
+        self.author.save()
+        self.assertContains(self.client.get(self.book_url), 'Jones, John')
+
+    def test_genre_change_invalidates_book(self):
+        self.client.get(self.book_url)
+        genre = Genre.objects.create(name='Fantasy')
+        self.book.genre.add(genre)
+        self.assertContains(self.client.get(self.book_url), 'Fantasy')
+        genre.name = 'Science Fiction'
+        genre.save()
+        self.assertContains(self.client.get(self.book_url), 'Science Fiction')
+
+    def test_renewal_invalidates_book(self):
+        librarian = User.objects.create_user(username='librarian', password='2HJ1vRV0Z&3iD')
+        librarian.user_permissions.add(Permission.objects.get(name='Set book as returned'))
+        self.copy.status = 'o'
+        self.copy.due_back = datetime.date.today()
+        self.copy.save()
+        self.client.get(self.book_url)
+
+        self.client.login(username='librarian', password='2HJ1vRV0Z&3iD')
+        renewal_date = datetime.date.today() + datetime.timedelta(weeks=2)
+        self.client.post(reverse('renew-book-librarian', args=[self.copy.pk]), {'renewal_date': renewal_date})
+        self.assertContains(self.client.get(self.book_url), date_format(renewal_date))
+
+    def test_deleted_book_is_404(self):
+        self.client.get(self.book_url)
+        self.copy.delete()
+        self.book.delete()
+        self.assertEqual(self.client.get(self.book_url).status_code, 404)
@@ -0,0 +1,154 @@
+import datetime
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from catalog.models import Author, Book, BookInstance, Genre, Hold, Language, LibraryStats
+from catalog.search import search_books
+
+
+class ImportCatalogCommandTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write_file(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return path
+
+    def import_catalog(self, *args):
+        out = StringIO()
+        call_command('import_catalog', *args, stdout=out)
+        return out.getvalue()
+
+    def test_import_csv(self):
+        path = self.write_file('books.csv', (
+            'type,title,isbn,author,genres,language,imprint,status\n'
+            'book,A Wizard of Earthsea,9780547773742,"Le Guin, Ursula",Fantasy;Classics,English,,\n'
+            'book,The Dispossessed,9780061054884,"Le Guin, Ursula",Science Fiction,English,,\n'
+            'copy,,9780547773742,,,,Houghton Mifflin,a\n'
+            'copy,,9780547773742,,,,Houghton Mifflin,o\n'
+        ))
+        output = self.import_catalog(path, '--batch-size', '3')
+        self.assertIn('Imported 4 records', output)
+
+        self.assertEqual(Author.objects.get().last_name, 'Le Guin')
+        self.assertEqual(Language.objects.get().name, 'English')
+        book = Book.objects.get(isbn='9780547773742')
+        self.assertEqual(book.author.first_name, 'Ursula')
+        self.assertEqual(sorted(genre.name for genre in book.genre.all()), ['Classics', 'Fantasy'])
+        self.assertEqual(book.bookinstance_set.count(), 2)
+        # The denormalized data is kept up to date by the bulk writes.
+        self.assertEqual(LibraryStats.load().num_instances_available, 1)
+        self.assertEqual(search_books('classics').count(), 1)
+
+    def test_import_jsonl_skips_duplicate_isbns(self):
+        Book.objects.create(title='Existing', summary='Summary', isbn='1')
+        path = self.write_file('books.jsonl', '\n'.join(json.dumps(record) for record in [
+            {'type': 'author', 'first_name': 'Ursula', 'last_name': 'Le Guin', 'date_of_birth': '1929-10-21'},
+            {'type': 'genre', 'name': 'Fantasy'},
+            {'title': 'Existing again', 'isbn': '1'},
+            {'title': 'New', 'isbn': '2', 'author': 'Le Guin, Ursula', 'genres': ['Fantasy']},
+            {'title': 'New again', 'isbn': '2'},
+        ]))
+        output = self.import_catalog(path)
+        self.assertIn('skipped 2 duplicate books', output)
+        self.assertEqual(Book.objects.get(isbn='1').title, 'Existing')
+        self.assertEqual(Book.objects.get(isbn='2').title, 'New')
+        self.assertEqual(Author.objects.get().date_of_birth.year, 1929)
+        self.assertEqual(Genre.objects.count(), 1)
+
+    def test_resume_after_failure(self):
+        path = self.write_file('books.jsonl', '\n'.join(json.dumps(record) for record in [
+            {'title': 'One', 'isbn': '1'},
+            {'title': 'Two', 'isbn': '2'},
+            {'type': 'copy', 'isbn': '1', 'imprint': 'Imprint'},
+            {'type': 'copy', 'isbn': 'unknown', 'imprint': 'Imprint'},
+        ]))
+        with self.assertRaisesMessage(CommandError, 'Copy of unknown book (ISBN unknown)'):
+            self.import_catalog(path, '--batch-size', '2')
+        # The first batch was saved, the failed one rolled back.
+        self.assertEqual(Book.objects.count(), 2)
+        self.assertEqual(BookInstance.objects.count(), 0)
+
+        # Fix the file and continue from the checkpoint.
+        with open(path) as f:
+            content = f.read().replace('unknown', '2')
+        self.write_file('books.jsonl', content)
+        output = self.import_catalog(path, '--batch-size', '2', '--resume')
+        self.assertIn('resuming after record 2', output)
+        self.assertEqual(BookInstance.objects.count(), 2)
+
+    def test_reimport_does_not_duplicate_copies(self):
+        # As when a run dies after a batch is saved, but before its checkpoint is written.
+        path = self.write_file('books.jsonl', '\n'.join(json.dumps(record) for record in [
+            {'title': 'One', 'isbn': '1'},
+            {'type': 'copy', 'isbn': '1', 'imprint': 'Imprint'},
+            {'type': 'copy', 'isbn': '1', 'imprint': 'Imprint'},
+        ]))
+        self.import_catalog(path)
+        os.remove(path + '.checkpoint')
+        self.import_catalog(path, '--resume')
+        self.assertEqual(BookInstance.objects.count(), 2)
+
+    def test_invalid_copy_id(self):
+        path = self.write_file('books.jsonl', '\n'.join(json.dumps(record) for record in [
+            {'title': 'One', 'isbn': '1'},
+            {'type': 'copy', 'isbn': '1', 'id': 'not-a-uuid'},
+        ]))
+        with self.assertRaisesMessage(CommandError, "copy record 2 has an invalid id 'not-a-uuid'"):
+            self.import_catalog(path)
+
+    def test_invalid_record(self):
+        path = self.write_file('books.jsonl', json.dumps({'title': 'No ISBN'}))
+        with self.assertRaisesMessage(CommandError, 'book record 1 has no isbn'):
+            self.import_catalog(path)
+
+
+class ExportCatalogCommandTest(TestCase):
+
+    def test_export_jsonl(self):
+        for number in range(3):
+            Book.objects.create(title='Book {0}'.format(number), summary='Summary', isbn=str(number))
+        out = StringIO()
+        call_command('export_catalog', 'books', '--format', 'jsonl', '--chunk-size', '2', stdout=out)
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([row['isbn'] for row in rows], ['0', '1', '2'])
+
+
+class RebuildCopyCountsCommandTest(TestCase):
+
+    def test_corrects_wrong_counts(self):
+        book = Book.objects.create(title='Book Title', summary='Summary', isbn='ABCDEFG')
+        Book.objects.create(title='Other Title', summary='Summary', isbn='HIJKLMN')
+        BookInstance.objects.create(book=book, imprint='Imprint', status='o')
+        Book.objects.filter(pk=book.pk).update(copies_on_loan=0)
+        out = StringIO()
+        call_command('rebuild_copy_counts', stdout=out)
+        self.assertIn('1 book corrected', out.getvalue())
+        self.assertEqual(Book.objects.get(pk=book.pk).copies_on_loan, 1)
+
+
+class ExpireReservationsCommandTest(TestCase):
+
+    def test_expires_uncollected_reservations(self):
+        book = Book.objects.create(title='Book Title', summary='Summary', isbn='ABCDEFG')
+        borrower = User.objects.create_user(username='borrower', password='1X<ISRUkw+tuK')
+        copy = BookInstance.objects.create(book=book, imprint='Imprint', status='r', borrower=borrower,
+                                           due_back=datetime.date.today() - datetime.timedelta(days=1))
+        Hold.objects.create(book=book, borrower=borrower, copy=copy)
+        out = StringIO()
+        call_command('expire_reservations', stdout=out)
+        self.assertIn('Expired 1 reservation.', out.getvalue())
+        self.assertEqual(BookInstance.objects.get(pk=copy.pk).status, 'a')
+        self.assertFalse(Hold.objects.exists())
@@ -0,0 +1,113 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from catalog import conditional
+from catalog.models import Author, Book, BookInstance, Genre
+
+
+class ConditionalGetTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(first_name='John', last_name='Smith')
+        cls.book = Book.objects.create(title='Book Title', summary='My book summary', isbn='ABCDEFG',
+                                       author=cls.author)
+        cls.copy = BookInstance.objects.create(book=cls.book, imprint='Unlikely Imprint, 2016', status='a')
+
+    def setUp(self):
+        cache.clear()
+        self.book_url = reverse('book-detail', args=[self.book.pk])
+        self.author_url = reverse('author-detail', args=[self.author.pk])
+
+    def assertNotModified(self, url, response):
+        """Asserts that a request for `url` revalidating `response` gets a 304."""
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def assertModified(self, url, response):
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_validators_on_pages(self):
+        for url in (self.book_url, self.author_url, reverse('books'), reverse('authors')):
+            response = self.client.get(url)
+            self.assertTrue(response.has_header('ETag'))
+            self.assertTrue(response.has_header('Last-Modified'))
+            self.assertIn('Cookie', response['Vary'])
+            self.assertNotModified(url, response)
+
+    def test_if_modified_since(self):
+        response = self.client.get(self.book_url)
+        response = self.client.get(self.book_url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_not_modified_query_count(self):
+        response = self.client.get(self.book_url)
+        with self.assertNumQueries(1):
+            self.assertNotModified(self.book_url, response)
+
+    def test_missing_book(self):
+        response = self.client.get(reverse('book-detail', args=[self.book.pk + 100]))
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(response.has_header('ETag'))
+
+    def test_copy_status_change_invalidates_book_and_author(self):
+        book_response = self.client.get(self.book_url)
+        author_response = self.client.get(self.author_url)
+        self.copy.status = 'o'
+        self.copy.save()
+        self.assertModified(self.book_url, book_response)
+        self.assertModified(self.author_url, author_response)
+
+    def test_touches_authors_before_books(self):
+        # The order an author change touches them in (so concurrent changes lock rows in one order).
+        for change, name in ((lambda: conditional.touch_books([self.book.pk]), 'copy'),
+                             (lambda: self.author.save(), 'author')):
+            with self.subTest(name), CaptureQueriesContext(connection) as queries:
+                change()
+            tables = [query['sql'].split()[1].strip('"') for query in queries
+                      if query['sql'].startswith('UPDATE')]
+            self.assertEqual(tables, ['catalog_author', 'catalog_book'])
+
+    def test_bulk_update_invalidates_book(self):
+        response = self.client.get(self.book_url)
+        BookInstance.objects.filter(book=self.book).update(status='d')
+        self.assertModified(self.book_url, response)
+
+    def test_author_change_invalidates_book_and_book_list(self):
+        book_response = self.client.get(self.book_url)
+        list_response = self.client.get(reverse('books'))
+        self.author.last_name = 'Jones'
+        self.author.save()
+        self.assertModified(self.book_url, book_response)
+        self.assertModified(reverse('books'), list_response)
+
+    def test_genre_change_invalidates_book(self):
+        response = self.client.get(self.book_url)
+        self.book.genre.add(Genre.objects.create(name='Fantasy'))
+        self.assertModified(self.book_url, response)
+
+    def test_unrelated_change_keeps_book(self):
+        response = self.client.get(self.book_url)
+        other_author = Author.objects.create(first_name='Jane', last_name='Doe')
+        Book.objects.create(title='Other Book', summary='Other summary', isbn='HIJKLMN', author=other_author)
+        self.assertNotModified(self.book_url, response)
+
+    def test_book_deletion_invalidates_book_list(self):
+        other_book = Book.objects.create(title='Other Book', summary='Other summary', isbn='HIJKLMN',
+                                         author=self.author)
+        response = self.client.get(reverse('books'))
+        other_book.delete()
+        self.assertModified(reverse('books'), response)
+
+    def test_etag_depends_on_page(self):
+        response = self.client.get(self.book_url)
+        self.assertModified(self.book_url + '?page=2', response)
+
+    def test_etag_depends_on_user(self):
+        response = self.client.get(self.book_url)
+        User.objects.create_user(username='testuser1', password='1X<ISRUkw+tuK')
+        self.client.login(username='testuser1', password='1X<ISRUkw+tuK')
+        self.assertModified(self.book_url, response)
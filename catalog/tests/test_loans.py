@@ -0,0 +1,274 @@
+import datetime
+import os
+import sqlite3
+import tempfile
+import threading
+from contextlib import contextmanager
+from unittest import mock, skipUnless
+
+from django.contrib.auth.models import Permission, User
+from django.db import connection, connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from catalog import loans
+from catalog.models import Author, Book, BookInstance, Hold
+
+
+def create_book(copies=2):
+    author = Author.objects.create(first_name='John', last_name='Smith')
+    book = Book.objects.create(title='Book Title', summary='My book summary', isbn='ABCDEFG', author=author)
+    for number in range(copies):
+        BookInstance.objects.create(book=book, imprint='Imprint {0}'.format(number), status='a')
+    return book
+
+
+class LoansTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = create_book(copies=2)
+        cls.alice = User.objects.create_user(username='alice', password='1X<ISRUkw+tuK')
+        cls.bob = User.objects.create_user(username='bob', password='2HJ1vRV0Z&3iD')
+        cls.carol = User.objects.create_user(username='carol', password='3HJ1vRV0Z&3iD')
+
+    def test_checkout_lends_available_copy(self):
+        copy = loans.checkout(self.book, self.alice)
+        copy.refresh_from_db()
+        self.assertEqual(copy.status, 'o')
+        self.assertEqual(copy.borrower, self.alice)
+        self.assertEqual(copy.due_back, datetime.date.today() + loans.LOAN_PERIOD)
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.copies_available, self.book.copies_on_loan), (1, 1))
+
+    def test_checkout_without_available_copy(self):
+        loans.checkout(self.book, self.alice)
+        loans.checkout(self.book, self.bob)
+        with self.assertRaises(loans.LoanError):
+            loans.checkout(self.book, self.carol)
+
+    def test_checkout_takes_copy_reserved_for_borrower(self):
+        hold = loans.place_hold(self.book, self.alice)
+        copy = loans.checkout(self.book, self.alice)
+        self.assertEqual(copy.pk, hold.copy.pk)
+        self.assertFalse(Hold.objects.exists())
+
+    def test_checkout_skips_copy_reserved_for_someone_else(self):
+        hold = loans.place_hold(self.book, self.alice)
+        copy = loans.checkout(self.book, self.bob)
+        self.assertNotEqual(copy.pk, hold.copy.pk)
+        with self.assertRaises(loans.LoanError):
+            loans.checkout(self.book, self.carol)
+
+    def test_checkout_serves_waiting_holds_first(self):
+        loans.checkout(self.book, self.alice)
+        loans.checkout(self.book, self.alice)
+        loans.place_hold(self.book, self.bob)
+        loans.place_hold(self.book, self.carol)
+        # A copy made available other than by a return (e.g. added in the admin).
+        BookInstance.objects.create(book=self.book, imprint='New Imprint', status='a')
+        with self.assertRaises(loans.LoanError):
+            loans.checkout(self.book, User.objects.create_user(username='dave', password='4HJ1vRV0Z&3iD'))
+        with self.assertRaises(loans.LoanError):
+            loans.checkout(self.book, self.carol)
+        copy = loans.checkout(self.book, self.bob)
+        self.assertEqual(copy.imprint, 'New Imprint')
+        self.assertEqual([hold.borrower for hold in Hold.objects.waiting()], [self.carol])
+
+    def test_place_hold_waits_when_no_copy_available(self):
+        loans.checkout(self.book, self.alice)
+        loans.checkout(self.book, self.bob)
+        hold = loans.place_hold(self.book, self.carol)
+        self.assertIsNone(hold.copy)
+        self.assertEqual(list(Hold.objects.waiting()), [hold])
+
+    def test_place_hold_twice(self):
+        loans.place_hold(self.book, self.alice)
+        with self.assertRaises(loans.LoanError):
+            loans.place_hold(self.book, self.alice)
+
+    def test_return_makes_copy_available(self):
+        copy = loans.checkout(self.book, self.alice)
+        self.assertIsNone(loans.return_copy(copy))
+        copy.refresh_from_db()
+        self.assertEqual((copy.status, copy.borrower, copy.due_back), ('a', None, None))
+
+    def test_return_reserves_copy_for_first_hold(self):
+        copy = loans.checkout(self.book, self.alice)
+        loans.checkout(self.book, self.alice)
+        first = loans.place_hold(self.book, self.bob)
+        loans.place_hold(self.book, self.carol)
+        hold = loans.return_copy(copy)
+        self.assertEqual(hold, first)
+        copy.refresh_from_db()
+        self.assertEqual((copy.status, copy.borrower), ('r', self.bob))
+        self.assertEqual(copy.due_back, datetime.date.today() + loans.COLLECTION_PERIOD)
+        self.assertEqual(Hold.objects.get(copy=copy), first)
+        self.assertEqual(Hold.objects.waiting().get().borrower, self.carol)
+
+    def test_expired_reservation_passed_to_next_hold(self):
+        copy = loans.checkout(self.book, self.alice)
+        loans.checkout(self.book, self.alice)
+        loans.place_hold(self.book, self.bob)
+        second = loans.place_hold(self.book, self.carol)
+        loans.return_copy(copy)
+        self.assertEqual(loans.expire_reservations(), 0)
+        today = datetime.date.today() + loans.COLLECTION_PERIOD + datetime.timedelta(days=1)
+        with mock.patch('django.utils.timezone.localdate', return_value=today):
+            self.assertEqual(loans.expire_reservations(), 1)
+        copy.refresh_from_db()
+        self.assertEqual((copy.status, copy.borrower), ('r', self.carol))
+        self.assertEqual(copy.due_back, today + loans.COLLECTION_PERIOD)
+        self.assertEqual(list(Hold.objects.all()), [second])
+        # Nobody else is waiting, so when the second reservation expires the copy is available.
+        with mock.patch('django.utils.timezone.localdate', return_value=today + loans.COLLECTION_PERIOD * 2):
+            self.assertEqual(loans.expire_reservations(), 1)
+        copy.refresh_from_db()
+        self.assertEqual((copy.status, copy.borrower, copy.due_back), ('a', None, None))
+        self.assertFalse(Hold.objects.exists())
+
+    def test_return_copy_not_on_loan(self):
+        copy = loans.checkout(self.book, self.alice)
+        loans.checkout(self.book, self.alice)
+        loans.place_hold(self.book, self.bob)
+        loans.return_copy(copy)
+        with self.assertRaises(loans.LoanError):
+            loans.return_copy(copy)
+        # Only the first return served the hold.
+        self.assertEqual(Hold.objects.filter(copy__isnull=False).count(), 1)
+
+
+class LoanViewsTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = create_book(copies=1)
+        cls.borrower = User.objects.create_user(username='borrower', password='1X<ISRUkw+tuK')
+        cls.librarian = User.objects.create_user(username='librarian', password='2HJ1vRV0Z&3iD')
+        cls.librarian.user_permissions.add(Permission.objects.get(name='Set book as returned'))
+
+    def test_checkout_requires_permission(self):
+        self.client.login(username='borrower', password='1X<ISRUkw+tuK')
+        response = self.client.get(reverse('checkout-book-librarian', args=[self.book.pk]))
+        self.assertEqual(response.status_code, 403)
+
+    def test_checkout_and_return(self):
+        self.client.login(username='librarian', password='2HJ1vRV0Z&3iD')
+        due_back = datetime.date.today() + datetime.timedelta(weeks=2)
+        response = self.client.post(reverse('checkout-book-librarian', args=[self.book.pk]),
+                                    {'borrower': 'borrower', 'due_back': due_back})
+        self.assertRedirects(response, self.book.get_absolute_url())
+        copy = BookInstance.objects.get()
+        self.assertEqual((copy.status, copy.borrower, copy.due_back), ('o', self.borrower, due_back))
+
+        response = self.client.post(reverse('return-book-librarian', args=[copy.pk]))
+        self.assertRedirects(response, reverse('all-borrowed'))
+        copy.refresh_from_db()
+        self.assertEqual(copy.status, 'a')
+
+    def test_checkout_shows_error_when_no_copy_available(self):
+        loans.checkout(self.book, self.librarian)
+        self.client.login(username='librarian', password='2HJ1vRV0Z&3iD')
+        response = self.client.post(reverse('checkout-book-librarian', args=[self.book.pk]),
+                                    {'borrower': 'borrower', 'due_back': datetime.date.today()})
+        self.assertEqual(response.status_code, 200)
+        self.assertFormError(response, 'form', None, 'No copy of "Book Title" is available.')
+
+    def test_checkout_unknown_borrower(self):
+        self.client.login(username='librarian', password='2HJ1vRV0Z&3iD')
+        response = self.client.post(reverse('checkout-book-librarian', args=[self.book.pk]),
+                                    {'borrower': 'nobody', 'due_back': datetime.date.today()})
+        self.assertFormError(response, 'form', 'borrower', 'Invalid borrower - no such user')
+
+    def test_reserve_lists_hold(self):
+        loans.checkout(self.book, self.librarian)
+        self.client.login(username='borrower', password='1X<ISRUkw+tuK')
+        response = self.client.post(reverse('reserve-book', args=[self.book.pk]))
+        self.assertRedirects(response, reverse('my-borrowed'))
+        response = self.client.get(reverse('my-borrowed'))
+        self.assertEqual([hold.book for hold in response.context['hold_list']], [self.book])
+        self.assertContains(response, 'waiting since')
+
+
+@contextmanager
+def database_in_file():
+    """Copies the test database (in memory) to a file, and runs the enclosed code against the file.
+
+    Threads each have their own connection, and can only write to SQLite at once (waiting for
+    one another) when the database is in a file: otherwise SQLite reports the tables as locked.
+    """
+    memory = connections['default']
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'loans.sqlite3')
+        memory.ensure_connection()
+        with sqlite3.connect(path) as copy:
+            memory.connection.backup(copy)
+        copy.close()
+        # New connections (in this thread and the others) open the file.
+        with mock.patch.dict(memory.settings_dict, {'NAME': path}):
+            connections['default'] = connections.create_connection('default')
+            try:
+                yield
+            finally:
+                connections['default'].close()
+                connections['default'] = memory
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Copies a SQLite test database to a file.')
+# Several threads can only write at once with the tuned connections (see catalog.sqlite), even if
+# SQLITE_TUNING is turned off.
+@override_settings(SQLITE_PRAGMAS={'journal_mode': 'wal', 'busy_timeout': 5000}, SQLITE_TRANSACTION_MODE='IMMEDIATE')
+class ConcurrentLoansTest(TransactionTestCase):
+    """Many desks lending and taking back copies of the same book at once."""
+    threads = 8
+
+    def run_threads(self, function, args):
+        """Calls `function` with each of `args` in its own thread, all at once, and returns the results."""
+        barrier = threading.Barrier(len(args))
+        results = [None] * len(args)
+
+        def run(index, arg):
+            barrier.wait()
+            try:
+                results[index] = function(arg)
+            except loans.LoanError as error:
+                results[index] = error
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run, args=(index, arg)) for index, arg in enumerate(args)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_each_copy_lent_once_and_holds_served_in_order(self):
+        with database_in_file():
+            self.check_loans()
+
+    def check_loans(self):
+        book = create_book(copies=3)
+        borrowers = [User.objects.create_user(username='borrower{0}'.format(number))
+                     for number in range(self.threads)]
+
+        results = self.run_threads(lambda borrower: loans.checkout(book, borrower), borrowers)
+        copies = [result for result in results if isinstance(result, BookInstance)]
+        self.assertEqual(len(copies), 3)
+        self.assertEqual(len({copy.pk for copy in copies}), 3)
+        self.assertEqual(sum(isinstance(result, loans.LoanError) for result in results), self.threads - 3)
+        lent = BookInstance.objects.on_loan()
+        self.assertEqual(sorted(lent.values_list('borrower_id', flat=True)),
+                         sorted(copy.borrower_id for copy in copies))
+
+        # The borrowers who missed out queue up, and get the copies in turn as they come back.
+        queue = [borrower for borrower, result in zip(borrowers, results) if isinstance(result, loans.LoanError)]
+        for borrower in queue:
+            loans.place_hold(book, borrower)
+        self.run_threads(loans.return_copy, copies)
+        reserved = BookInstance.objects.filter(status__exact='r')
+        self.assertEqual(sorted(reserved.values_list('borrower_id', flat=True)),
+                         sorted(borrower.pk for borrower in queue[:3]))
+        self.assertEqual([hold.borrower for hold in Hold.objects.waiting()], queue[3:])
+        book.refresh_from_db()
+        self.assertEqual((book.copies_available, book.copies_on_loan), (0, 0))
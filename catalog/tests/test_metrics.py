@@ -0,0 +1,94 @@
+import time
+
+from django.contrib.auth.models import User
+from django.template import engines
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from catalog.metrics import Histogram, RequestTiming, current_timing, registry
+from catalog.models import Author, Book
+
+
+class HistogramTest(TestCase):
+
+    def test_cumulative_counts(self):
+        histogram = Histogram((1, 5, 10))
+        for value in (0.5, 1, 3, 7, 20):
+            histogram.observe(value)
+        self.assertEqual(histogram.cumulative_counts(), [(1, 2), (5, 3), (10, 4), ('+Inf', 5)])
+        self.assertEqual(histogram.sum, 31.5)
+        self.assertEqual(histogram.count, 5)
+
+
+class RequestMetricsTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(first_name='John', last_name='Smith')
+        Book.objects.create(title='Book Title', summary='My book summary', isbn='ABCDEFG', author=author)
+        User.objects.create_user(username='staff', password='1X<ISRUkw+tuK', is_staff=True)
+        User.objects.create_user(username='testuser1', password='2HJ1vRV0Z&3iD')
+
+    def setUp(self):
+        registry.reset()
+
+    def test_server_timing_header(self):
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('books'))
+        self.assertRegex(response['Server-Timing'],
+                         r'^db;dur=[\d.]+;desc="5 queries", tpl;dur=[\d.]+, view;dur=[\d.]+, total;dur=[\d.]+$')
+
+    @override_settings(CATALOG_SERVER_TIMING=False)
+    def test_server_timing_header_disabled(self):
+        response = self.client.get(reverse('books'))
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    def test_histograms_by_url_name(self):
+        self.client.get(reverse('books'))
+        self.client.get(reverse('books'))
+        self.client.get(reverse('authors'))
+        self.client.get('/catalog/no-such-page/')
+        histograms = registry.histograms
+        self.assertEqual(sorted(histograms), ['(unmatched)', 'authors', 'books'])
+        total, db, template, view, queries = histograms['books']
+        self.assertEqual(total.count, 2)
+        self.assertEqual(queries.sum, 10)
+        self.assertGreater(template.sum, 0)
+        self.assertLessEqual(db.sum + template.sum, total.sum)
+
+    def test_queries_while_rendering_not_template_time(self):
+        timing = RequestTiming()
+
+        def query():
+            # A query taking 50ms, made from the template.
+            return timing(lambda *args: time.sleep(0.05), 'SELECT 1', None, False, {})
+
+        token = current_timing.set(timing)
+        try:
+            engines.all()[0].from_string('{{ query }}').render({'query': query})
+        finally:
+            current_timing.reset(token)
+        self.assertGreaterEqual(timing.db_time, 0.05)
+        self.assertLess(timing.template_time, 0.05)
+        timing.finish()
+        self.assertAlmostEqual(timing.db_time + timing.template_time + timing.view_time, timing.total)
+
+    def test_metrics_staff_only(self):
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 302)
+        self.client.login(username='testuser1', password='2HJ1vRV0Z&3iD')
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 302)
+
+    def test_metrics(self):
+        self.client.get(reverse('books'))
+        self.client.login(username='staff', password='1X<ISRUkw+tuK')
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        content = response.content.decode()
+        self.assertIn('# TYPE catalog_request_duration_seconds histogram', content)
+        self.assertIn('catalog_request_duration_seconds_count{view="books"} 1', content)
+        self.assertIn('catalog_request_queries_bucket{view="books",le="5"} 1', content)
+        self.assertIn('catalog_request_queries_bucket{view="books",le="+Inf"} 1', content)
+        self.assertIn('catalog_page_cache_hits_total', content)
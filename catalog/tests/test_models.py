@@ -52,3 +52,270 @@ class AuthorModelTest(TestCase):
         author = Author.objects.get(id=1)
         # This will also fail if the urlconf is not defined.
         self.assertEqual(author.get_absolute_url(), '/catalog/author/1')
+
+
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from catalog import cache
+from catalog.models import Book, BookInstance, LibraryStats
+
+
+class LibraryStatsTest(TestCase):
+
+    def setUp(self):
+        self.author = Author.objects.create(first_name='John', last_name='Smith')
+        self.book = Book.objects.create(title='Book Title', summary='My book summary',
+                                        isbn='ABCDEFG', author=self.author)
+
+    def assertStatsMatchTables(self):
+        """Check the maintained counts agree with a fresh count of each table."""
+        stats = LibraryStats.load()
+        self.assertEqual(stats.num_books, Book.objects.count())
+        self.assertEqual(stats.num_authors, Author.objects.count())
+        self.assertEqual(stats.num_instances, BookInstance.objects.count())
+        self.assertEqual(stats.num_instances_available, BookInstance.objects.filter(status='a').count())
+
+    def test_counts_created_and_deleted_objects(self):
+        copy = BookInstance.objects.create(book=self.book, imprint='Imprint', status='a')
+        BookInstance.objects.create(book=self.book, imprint='Imprint', status='o')
+        self.assertEqual(LibraryStats.load().num_instances_available, 1)
+        self.assertStatsMatchTables()
+
+        copy.delete()
+        Author.objects.create(first_name='Jane', last_name='Doe').delete()
+        self.assertStatsMatchTables()
+
+    def test_status_change_updates_available_count(self):
+        copy = BookInstance.objects.create(book=self.book, imprint='Imprint', status='o')
+        copy.status = 'a'
+        copy.save()
+        self.assertEqual(LibraryStats.load().num_instances_available, 1)
+
+        copy = BookInstance.objects.get(pk=copy.pk)
+        copy.status = 'o'
+        copy.save()
+        self.assertEqual(LibraryStats.load().num_instances_available, 0)
+
+    def test_failing_receiver_rolls_back_change(self):
+        copy = BookInstance.objects.create(book=self.book, imprint='Imprint', status='a')
+        copy.status = 'o'
+        with mock.patch('catalog.stats.adjust', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                copy.save()
+        self.assertEqual(BookInstance.objects.get(pk=copy.pk).status, 'a')
+        self.assertStatsMatchTables()
+
+    def test_save_of_other_fields_keeps_status_change(self):
+        BookInstance.objects.create(book=self.book, imprint='Imprint', status='a')
+        copy = BookInstance.objects.get()
+        copy.status = 'o'
+        copy.save(update_fields=['imprint'])
+        # The status saved is still 'a', so this save doesn't change it.
+        copy.status = 'a'
+        copy.save()
+        self.assertStatsMatchTables()
+        self.assertEqual(Book.objects.get(pk=self.book.pk).copies_available, 1)
+
+    def test_bulk_create_and_update(self):
+        BookInstance.objects.bulk_create(
+            [BookInstance(book=self.book, imprint='Imprint', status=status) for status in 'aaod'])
+        self.assertStatsMatchTables()
+
+        BookInstance.objects.filter(status='o').update(status='a')
+        self.assertStatsMatchTables()
+        BookInstance.objects.update(status='r')
+        self.assertStatsMatchTables()
+
+    def test_rebuild_fixes_drift(self):
+        LibraryStats.objects.filter(pk=1).update(num_books=100, num_instances_available=7)
+        LibraryStats.rebuild()
+        self.assertStatsMatchTables()
+
+    def test_missing_record_is_rebuilt(self):
+        LibraryStats.objects.all().delete()
+        BookInstance.objects.create(book=self.book, imprint='Imprint', status='a')
+        self.assertStatsMatchTables()
+
+
+class BookCopyCountsTest(TestCase):
+
+    def setUp(self):
+        self.author = Author.objects.create(first_name='John', last_name='Smith')
+        self.book = Book.objects.create(title='Book Title', summary='My book summary',
+                                        isbn='ABCDEFG', author=self.author)
+        self.other_book = Book.objects.create(title='Other Title', summary='My book summary',
+                                              isbn='HIJKLMN', author=self.author)
+
+    def assertCopyCounts(self, book, total, available, on_loan):
+        book = Book.objects.get(pk=book.pk)
+        self.assertEqual((book.copies_total, book.copies_available, book.copies_on_loan), (total, available, on_loan))
+
+    def assertCountsMatchCopies(self):
+        """Check the maintained counts of every book agree with a fresh count of its copies."""
+        for book in Book.objects.all():
+            copies = BookInstance.objects.filter(book=book)
+            self.assertCopyCounts(book, copies.count(), copies.filter(status='a').count(),
+                                  copies.filter(status='o').count())
+
+    def test_created_and_deleted_copies(self):
+        copy = BookInstance.objects.create(book=self.book, imprint='Imprint', status='a')
+        BookInstance.objects.create(book=self.book, imprint='Imprint', status='o')
+        BookInstance.objects.create(book=self.book, imprint='Imprint', status='d')
+        self.assertCopyCounts(self.book, 3, 1, 1)
+        copy.delete()
+        self.assertCopyCounts(self.book, 2, 0, 1)
+
+    def test_status_change(self):
+        copy = BookInstance.objects.create(book=self.book, imprint='Imprint', status='a')
+        copy.status = 'o'
+        copy.save()
+        self.assertCopyCounts(self.book, 1, 0, 1)
+
+        copy = BookInstance.objects.get(pk=copy.pk)
+        copy.status = 'a'
+        copy.save()
+        self.assertCopyCounts(self.book, 1, 1, 0)
+
+    def test_status_change_in_one_update(self):
+        copy = BookInstance.objects.create(book=self.book, imprint='Imprint', status='a')
+        copy.status = 'o'
+        with CaptureQueriesContext(connection) as queries:
+            copy.save()
+        updates = [query['sql'] for query in queries if query['sql'].startswith('UPDATE "catalog_book" SET "copies')]
+        self.assertEqual(len(updates), 1)
+        self.assertCopyCounts(self.book, 1, 0, 1)
+
+    def test_copy_moved_to_other_book(self):
+        copy = BookInstance.objects.create(book=self.book, imprint='Imprint', status='o')
+        copy = BookInstance.objects.get(pk=copy.pk)
+        copy.book = self.other_book
+        copy.save()
+        self.assertCopyCounts(self.book, 0, 0, 0)
+        self.assertCopyCounts(self.other_book, 1, 0, 1)
+
+    def test_bulk_create_and_update(self):
+        BookInstance.objects.bulk_create(
+            [BookInstance(book=self.book, imprint='Imprint', status=status) for status in 'aaod'])
+        self.assertCopyCounts(self.book, 4, 2, 1)
+
+        BookInstance.objects.filter(status='a').update(status='o')
+        self.assertCopyCounts(self.book, 4, 0, 3)
+        BookInstance.objects.filter(status='o').update(book=self.other_book)
+        self.assertCountsMatchCopies()
+
+    def test_saving_book_keeps_counts(self):
+        stale_book = Book.objects.get(pk=self.book.pk)
+        BookInstance.objects.create(book=self.book, imprint='Imprint', status='a')
+        stale_book.title = 'New Title'
+        stale_book.save()
+        self.assertCopyCounts(self.book, 1, 1, 0)
+        self.assertEqual(Book.objects.get(pk=self.book.pk).title, 'New Title')
+
+    def test_rebuild_fixes_drift(self):
+        BookInstance.objects.create(book=self.book, imprint='Imprint', status='a')
+        Book.objects.update(copies_total=10, copies_available=5)
+        Book.rebuild_copy_counts()
+        self.assertCountsMatchCopies()
+
+    def test_rebuild_updates_only_wrong_books(self):
+        Book.objects.filter(pk=self.book.pk).update(copies_total=10)
+        books = {book.pk: book.updated_at for book in Book.objects.all()}
+        versions = {pk: cache.get_version(Book, pk) for pk in books}
+        self.assertEqual(Book.rebuild_copy_counts(), 1)
+        self.assertCountsMatchCopies()
+        for book in Book.objects.all():
+            changed = book.pk == self.book.pk
+            self.assertEqual(book.updated_at != books[book.pk], changed)
+            self.assertEqual(cache.get_version(Book, book.pk) != versions[book.pk], changed)
+
+
+import datetime
+from unittest import mock
+
+from catalog.models import DailyVisits
+from catalog.visits import VisitCounter
+
+
+class VisitCounterTest(TestCase):
+
+    def test_visits_buffered_until_threshold(self):
+        counter = VisitCounter(threshold=3, interval=3600)
+        day = datetime.date(2022, 2, 22)
+        counter.record(day)
+        counter.record(day)
+        self.assertFalse(DailyVisits.objects.filter(date=day).exists())
+        self.assertEqual(counter.total(day), 2)
+
+        counter.record(day)
+        self.assertEqual(DailyVisits.objects.get(date=day).count, 3)
+        self.assertEqual(counter.pending(day), 0)
+
+    def test_visits_flushed_after_interval(self):
+        counter = VisitCounter(threshold=1000, interval=60)
+        day = datetime.date(2022, 2, 22)
+        with mock.patch('catalog.visits.time.monotonic', return_value=counter._last_flush + 61):
+            counter.record(day)
+        self.assertEqual(DailyVisits.objects.get(date=day).count, 1)
+
+    def test_flush_adds_to_stored_total(self):
+        counter = VisitCounter(threshold=1000, interval=3600)
+        day = datetime.date(2022, 2, 22)
+        DailyVisits.objects.create(date=day, count=10)
+        counter.record(day)
+        counter.flush()
+        self.assertEqual(DailyVisits.objects.get(date=day).count, 11)
+
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+class BookInstanceIndexesTest(TestCase):
+
+    def test_loan_indexes_exist(self):
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, BookInstance._meta.db_table)
+        self.assertEqual(constraints['bookinstance_status_due_idx']['columns'], ['status', 'due_back'])
+        self.assertEqual(constraints['bookinstance_borrowed_idx']['columns'], ['borrower_id', 'due_back'])
+
+    def test_loaned_books_query_uses_index(self):
+        user = User.objects.create_user(username='testuser1', password='1X<ISRUkw+tuK')
+        plan = BookInstance.objects.filter(borrower=user, status__exact='o').order_by('due_back').explain()
+        if connection.vendor == 'sqlite':
+            self.assertIn('bookinstance_borrowed_idx', plan)
+
+
+class BookInstanceQuerySetTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        book = Book.objects.create(title='Book Title', summary='My book summary', isbn='ABCDEFG')
+        today = datetime.date.today()
+        for days, status in ((-3, 'o'), (-1, 'o'), (0, 'o'), (2, 'o'), (5, 'o'), (-3, 'r'), (2, 'a')):
+            BookInstance.objects.create(book=book, imprint='Imprint', status=status,
+                                        due_back=today + datetime.timedelta(days=days))
+
+    def test_overdue(self):
+        overdue = BookInstance.objects.overdue()
+        self.assertEqual(overdue.count(), 2)
+        self.assertTrue(all(copy.is_overdue and copy.status == 'o' for copy in overdue))
+
+    def test_due_within(self):
+        self.assertEqual(BookInstance.objects.due_within(0).count(), 1)
+        self.assertEqual(BookInstance.objects.due_within(2).count(), 2)
+        self.assertEqual(BookInstance.objects.due_within(7).count(), 3)
+
+    def test_renew(self):
+        renewal_date = datetime.date.today() + datetime.timedelta(weeks=2)
+        ids = list(BookInstance.objects.values_list('pk', flat=True)) + ['not-a-copy']
+        with CaptureQueriesContext(connection) as queries:
+            renewed, rejected = BookInstance.objects.renew(ids, renewal_date)
+        self.assertEqual((renewed, rejected), (5, 3))
+        self.assertEqual(BookInstance.objects.filter(due_back=renewal_date).count(), 5)
+        updates = [query['sql'] for query in queries
+                   if query['sql'].startswith('UPDATE "{0}"'.format(BookInstance._meta.db_table))]
+        self.assertEqual(len(updates), 1)
@@ -0,0 +1,42 @@
+import threading
+
+from asgiref.sync import async_to_sync
+from django.test import TestCase, TransactionTestCase
+
+from catalog.models import Author
+from catalog import queries
+from catalog.queries import gather_queries
+
+
+def current_thread():
+    return threading.get_ident()
+
+
+def current_thread_name():
+    return threading.current_thread().name
+
+
+class GatherQueriesTest(TransactionTestCase):
+
+    def test_functions_run_in_own_threads(self):
+        Author.objects.create(first_name='John', last_name='Smith')
+        count, thread = async_to_sync(gather_queries)(Author.objects.count, current_thread)
+        self.assertEqual(count, 1)
+        self.assertNotEqual(thread, threading.get_ident())
+
+    def test_threads_kept_between_requests(self):
+        # Each async_to_sync() call has an event loop of its own, as each request has under WSGI.
+        threads = {thread for number in range(5)
+                   for thread in async_to_sync(gather_queries)(current_thread_name, current_thread_name)}
+        self.assertTrue(all(name.startswith('gather_queries') for name in threads))
+        self.assertLessEqual(len(threads), queries.executor._max_workers)
+
+
+class GatherQueriesInTransactionTest(TestCase):
+
+    def test_functions_run_in_request_thread(self):
+        # The author is only visible in this test's transaction.
+        Author.objects.create(first_name='John', last_name='Smith')
+        count, thread = async_to_sync(gather_queries)(Author.objects.count, current_thread)
+        self.assertEqual(count, 1)
+        self.assertEqual(thread, threading.get_ident())
@@ -0,0 +1,37 @@
+from django.test import TestCase
+
+from catalog.bench import ROLES, check_results, load_budgets, measure_requests, seed_library
+
+
+class ViewQueryBudgetTest(TestCase):
+    """Every catalog URL, requested by each kind of user, stays within its query budget
+    (catalog/tests/query_budgets.json), and its queries don't grow with the data.
+
+    After deliberately changing the queries of a view, update the budgets with
+    `python manage.py bench_views --save-budgets`.
+    """
+
+    def test_views_within_budget(self):
+        users = seed_library(10)
+        results = measure_requests(users)
+        seed_library(40, first=10)
+        larger_results = measure_requests(users)
+        self.assertEqual(check_results(results, load_budgets(), larger_results), [])
+
+    def test_check_results(self):
+        budgets = {'anonymous': {'books': 5, 'export:books.csv': 1}}
+        results = {'anonymous': {'books': {'status': 200, 'queries': 6, 'seconds': 0.01},
+                                 'authors': {'status': 500, 'queries': 1, 'seconds': 0.01},
+                                 'export:books.csv': {'status': 200, 'queries': 1, 'seconds': 0.01}}}
+        larger_results = {'anonymous': {'books': {'status': 200, 'queries': 7, 'seconds': 0.01},
+                                        'authors': {'status': 200, 'queries': 1, 'seconds': 0.01},
+                                        'export:books.csv': {'status': 200, 'queries': 3, 'seconds': 0.01}}}
+        self.assertEqual(check_results(results, budgets, larger_results), [
+            'anonymous books: 6 queries (budget 5)',
+            'anonymous books: 6 queries, but 7 with more data',
+            'anonymous authors: status 500',
+            'anonymous authors: no query budget',
+        ])
+
+    def test_budgets_cover_all_roles(self):
+        self.assertEqual(sorted(load_budgets()), sorted(ROLES))
@@ -0,0 +1,95 @@
+import os
+import sqlite3
+import tempfile
+
+from django.contrib.auth.models import Permission, User
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from catalog.models import Author, Book
+from catalog.routers import PIN_COOKIE, ReplicaRouter
+
+
+@override_settings(REPLICA_DATABASES=['replica'], REPLICA_PIN_SECONDS=30, CATALOG_PAGE_CACHE=True)
+class ReplicaRouterTest(TestCase):
+    """Uses a SQLite file copied from the (primary) test database as a replica.
+
+    The copy is taken when each test starts, so later changes to the primary are missing
+    from it, as if replication were behind.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(first_name='John', last_name='Smith')
+        cls.book = Book.objects.create(title='Old Title', summary='My book summary', isbn='ABCDEFG',
+                                       author=cls.author)
+        librarian = User.objects.create_user(username='librarian', password='1X<ISRUkw+tuK')
+        librarian.user_permissions.add(Permission.objects.get(name='Set book as returned'))
+
+    def setUp(self):
+        cache.clear()
+        handle, self.replica_path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(handle)
+        connection.ensure_connection()
+        # Copy through the test's own connection, which sees the test's (uncommitted) data. The
+        # full-text search tables can't be copied like this, and aren't read by the replica views.
+        replica = sqlite3.connect(self.replica_path)
+        replica.executescript('\n'.join(statement for statement in connection.connection.iterdump()
+                                        if 'catalog_book_fts' not in statement))
+        replica.close()
+        connections.settings['replica'] = {**connections.settings[DEFAULT_DB_ALIAS], 'NAME': self.replica_path}
+
+    def tearDown(self):
+        connections['replica'].close()
+        del connections['replica']
+        del connections.settings['replica']
+        os.remove(self.replica_path)
+
+    def change_title(self):
+        Book.objects.filter(pk=self.book.pk).update(title='New Title')
+
+    def test_pages_read_from_replica(self):
+        self.change_title()
+        self.assertContains(self.client.get(reverse('books')), 'Old Title')
+        self.assertContains(self.client.get(reverse('book-detail', args=[self.book.pk])), 'Old Title')
+        self.assertContains(self.client.get(reverse('author-detail', args=[self.author.pk])), 'Old Title')
+
+    def test_other_pages_read_from_primary(self):
+        self.change_title()
+        self.assertContains(self.client.get(reverse('search') + '?q=Title'), 'New Title')
+
+    def test_write_pins_user_to_primary(self):
+        self.client.login(username='librarian', password='1X<ISRUkw+tuK')
+        response = self.client.post(reverse('author-create'), {'first_name': 'Jane', 'last_name': 'Doe'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], 30)
+        self.assertTrue(Author.objects.using(DEFAULT_DB_ALIAS).filter(last_name='Doe').exists())
+
+        # The new author isn't on the replica, but the user who added it reads from the primary.
+        self.assertContains(self.client.get(reverse('authors')), 'Doe, Jane')
+        self.client.cookies.pop(PIN_COOKIE)
+        self.assertNotContains(self.client.get(reverse('authors')), 'Doe, Jane')
+
+    def test_reads_do_not_pin(self):
+        response = self.client.get(reverse('books'))
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_stale_page_not_cached(self):
+        self.change_title()
+        url = reverse('book-detail', args=[self.book.pk])
+        self.assertContains(self.client.get(url), 'Old Title')
+        self.client.cookies[PIN_COOKIE] = '1'
+        self.assertContains(self.client.get(url), 'New Title')
+
+    @override_settings(REPLICA_DATABASES=[])
+    def test_no_replicas(self):
+        self.change_title()
+        self.assertContains(self.client.get(reverse('books')), 'New Title')
+
+    def test_migrations_only_on_primary(self):
+        router = ReplicaRouter()
+        self.assertTrue(router.allow_migrate(DEFAULT_DB_ALIAS, 'catalog'))
+        self.assertFalse(router.allow_migrate('replica', 'catalog'))
+        self.assertEqual(router.db_for_write(Book), DEFAULT_DB_ALIAS)
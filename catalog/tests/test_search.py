@@ -0,0 +1,99 @@
+from unittest import mock
+
+from django.test import TestCase
+from django.urls import reverse
+
+from catalog import search
+from catalog.models import Author, Book, Genre
+from catalog.search import index_books, search_books
+
+
+class SearchTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(first_name='Ursula', last_name='Le Guin')
+        cls.genre = Genre.objects.create(name='Fantasy')
+        cls.book = Book.objects.create(title='A Wizard of Earthsea', summary='A young wizard goes to school.',
+                                       isbn='9780547773742', author=cls.author)
+        cls.book.genre.add(cls.genre)
+        cls.other_book = Book.objects.create(title='The Dispossessed', summary='An anarchist physicist.',
+                                             isbn='9780061054884', author=cls.author)
+
+    def titles(self, query):
+        results = search_books(query)
+        return [book.title for book in results[:results.count()]]
+
+    def test_finds_books_by_each_indexed_field(self):
+        self.assertEqual(self.titles('earthsea'), ['A Wizard of Earthsea'])
+        self.assertEqual(self.titles('physicist'), ['The Dispossessed'])
+        self.assertEqual(self.titles('9780061054884'), ['The Dispossessed'])
+        self.assertEqual(self.titles('fantasy'), ['A Wizard of Earthsea'])
+        self.assertEqual(sorted(self.titles('ursula guin')), ['A Wizard of Earthsea', 'The Dispossessed'])
+
+    def test_matches_prefixes_and_requires_all_words(self):
+        self.assertEqual(self.titles('wiz earth'), ['A Wizard of Earthsea'])
+        self.assertEqual(self.titles('wizard physicist'), [])
+
+    def test_title_matches_rank_above_summary_matches(self):
+        Book.objects.create(title='Wizard', summary='A book.', isbn='1')
+        self.assertEqual(self.titles('wizard'), ['Wizard', 'A Wizard of Earthsea'])
+
+    def test_empty_query_finds_nothing(self):
+        self.assertEqual(search_books('').count(), 0)
+        self.assertEqual(self.titles('  "*'), [])
+
+    def test_index_follows_changes(self):
+        self.author.last_name = 'Tolkien'
+        self.author.save()
+        self.assertEqual(len(self.titles('tolkien')), 2)
+
+        self.other_book.genre.add(Genre.objects.create(name='Science Fiction'))
+        self.assertEqual(self.titles('science'), ['The Dispossessed'])
+
+        self.genre.delete()
+        self.assertEqual(self.titles('fantasy'), [])
+
+        self.other_book.delete()
+        self.assertEqual(self.titles('dispossessed'), [])
+
+    def test_clearing_genre_reindexes_its_books(self):
+        with mock.patch.object(search, 'index_books', wraps=search.index_books) as index:
+            self.genre.book_set.clear()
+        index.assert_called_once_with([self.book.pk])
+        self.assertEqual(self.titles('fantasy'), [])
+
+    def test_bulk_created_books_are_indexed(self):
+        Book.objects.bulk_create([Book(title='Bulk {0}'.format(number), summary='Summary', isbn='B{0}'.format(number))
+                                  for number in range(3)])
+        self.assertEqual(search_books('bulk').count(), 3)
+
+    def test_rebuild_index(self):
+        index_books()
+        self.assertEqual(self.titles('earthsea'), ['A Wizard of Earthsea'])
+
+
+class BookSearchViewTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        for number in range(13):
+            Book.objects.create(title='Dragon {0}'.format(number), summary='Summary', isbn=str(number))
+
+    def test_view_uses_correct_template(self):
+        response = self.client.get(reverse('search'), {'q': 'dragon'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'catalog/book_search.html')
+
+    def test_results_paginated(self):
+        response = self.client.get(reverse('search'), {'q': 'dragon'})
+        self.assertTrue(response.context['is_paginated'])
+        self.assertEqual(len(response.context['book_list']), 10)
+        self.assertContains(response, '13 books found.')
+        self.assertContains(response, '?q=dragon&amp;page=2')
+        response = self.client.get(reverse('search'), {'q': 'dragon', 'page': 2})
+        self.assertEqual(len(response.context['book_list']), 3)
+
+    def test_no_results(self):
+        response = self.client.get(reverse('search'), {'q': 'unicorn'})
+        self.assertContains(response, 'No books match your search.')
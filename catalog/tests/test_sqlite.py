@@ -0,0 +1,44 @@
+import os
+import tempfile
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.test import SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from catalog.sqlite import get_pragmas
+
+
+class SQLiteTuningTest(SimpleTestCase):
+    """Opens a new connection to an empty SQLite file, to check how new connections are set up."""
+
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(handle)
+        connections.settings['tuned'] = {**connections.settings[DEFAULT_DB_ALIAS], 'NAME': self.path}
+
+    def tearDown(self):
+        connections['tuned'].close()
+        del connections['tuned']
+        del connections.settings['tuned']
+        os.remove(self.path)
+
+    @override_settings(SQLITE_PRAGMAS={'journal_mode': 'wal', 'synchronous': 'normal', 'busy_timeout': 1234,
+                                       'cache_size': -1000},
+                       SQLITE_TRANSACTION_MODE='IMMEDIATE')
+    def test_tuned_connection(self):
+        self.assertEqual(get_pragmas(connections['tuned']),
+                         {'journal_mode': 'wal', 'synchronous': 1, 'busy_timeout': 1234, 'cache_size': -1000})
+        with CaptureQueriesContext(connections['tuned']) as queries:
+            with transaction.atomic(using='tuned'):
+                connections['tuned'].cursor().execute('CREATE TABLE example (id integer)')
+        self.assertEqual(queries.captured_queries[0]['sql'], 'BEGIN IMMEDIATE')
+
+    @override_settings(SQLITE_PRAGMAS={}, SQLITE_TRANSACTION_MODE=None)
+    def test_untuned_connection(self):
+        connection = connections['tuned']
+        connection.ensure_connection()
+        self.assertEqual(connection.connection.execute('PRAGMA journal_mode').fetchone()[0], 'delete')
+        with CaptureQueriesContext(connection) as queries:
+            with transaction.atomic(using='tuned'):
+                connection.cursor().execute('CREATE TABLE example (id integer)')
+        self.assertEqual(queries.captured_queries[0]['sql'], 'BEGIN')
@@ -0,0 +1,27 @@
+from django.db.migrations.recorder import MigrationRecorder
+from django.test import TestCase
+
+from catalog import startup
+
+
+class StartupTest(TestCase):
+
+    def test_migration_files(self):
+        files = startup.migration_files()
+        self.assertIn(('catalog', '0001_initial'), files)
+        self.assertIn(('sessions', '0001_initial'), files)
+        self.assertNotIn(('catalog', '__init__'), files)
+
+    def test_no_unapplied_migrations(self):
+        with self.assertNumQueries(2):
+            self.assertEqual(startup.unapplied_migrations(), [])
+
+    def test_unapplied_migration(self):
+        latest = max(name for app, name in startup.migration_files() if app == 'catalog')
+        MigrationRecorder.Migration.objects.filter(app='catalog', name=latest).delete()
+        self.assertEqual(startup.unapplied_migrations(), [('catalog', latest)])
+        with self.assertRaisesMessage(RuntimeError, 'catalog.' + latest):
+            startup.prepare()
+
+    def test_warm_up(self):
+        startup.warm_up()
@@ -3,10 +3,59 @@ from django.test import TestCase
 # Create your tests here.
 
 
+from catalog import visits
+from django.core.cache import cache
 from catalog.models import Author
+from django.db.models import F
+from django.conf import settings
 from django.urls import reverse
 
 
+class IndexViewTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Author.objects.create(first_name='Christian', last_name='Surname')
+
+    def tearDown(self):
+        # Write out buffered visits now, rather than to the real database when the tests exit.
+        visits.counter.flush()
+
+    def test_view_uses_correct_template(self):
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'index.html')
+
+    def test_counts_read_from_library_stats(self):
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response.context['num_authors'], 1)
+        self.assertEqual(response.context['num_books'], 0)
+        self.assertEqual(response.context['num_instances'], 0)
+
+    def test_counts_visits_per_user_without_session(self):
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response.context['num_visits'], 1)
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response.context['num_visits'], 2)
+        # The count is kept in a signed cookie, so no session is created.
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+
+    def test_tampered_visit_cookie_is_ignored(self):
+        self.client.cookies['num_visits'] = '1000'
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response.context['num_visits'], 1)
+
+    def test_counts_visits_today(self):
+        before = self.client.get(reverse('index')).context['num_visits_today']
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response.context['num_visits_today'], before + 1)
+
+    async def test_view_under_asgi(self):
+        response = await self.async_client.get(reverse('index'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['num_authors'], 1)
+
+
 class AuthorListViewTest(TestCase):
 
     @classmethod
@@ -45,6 +94,25 @@ class AuthorListViewTest(TestCase):
         self.assertTrue(response.context['is_paginated'] is True)
         self.assertEqual(len(response.context['author_list']), 3)
 
+    def test_keyset_pagination(self):
+        response = self.client.get(reverse('authors') + '?cursor=')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['is_paginated'])
+        first_page = list(response.context['author_list'])
+        self.assertEqual(first_page, list(Author.objects.all()[:10]))
+        self.assertFalse(response.context['page_obj'].has_previous())
+
+        # Follow the next cursor to the remaining 3 authors, then go back again.
+        response = self.client.get(reverse('authors'), {'cursor': response.context['page_obj'].next_cursor})
+        self.assertEqual(list(response.context['author_list']), list(Author.objects.all()[10:]))
+        self.assertFalse(response.context['page_obj'].has_next())
+        response = self.client.get(reverse('authors'), {'cursor': response.context['page_obj'].previous_cursor})
+        self.assertEqual(list(response.context['author_list']), first_page)
+
+    def test_invalid_cursor_is_404(self):
+        response = self.client.get(reverse('authors') + '?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 404)
+
 
 import datetime
 from django.utils import timezone
@@ -355,3 +423,386 @@ class AuthorCreateViewTest(TestCase):
         # Manually check redirect because we don't know what author was created
         self.assertEqual(response.status_code, 302)
         self.assertTrue(response.url.startswith('/catalog/author/'))
+
+
+class BookDetailViewTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        test_author = Author.objects.create(first_name='John', last_name='Smith')
+        test_language = Language.objects.create(name='English')
+        cls.test_book = Book.objects.create(title='Book Title', summary='My book summary',
+                                            isbn='ABCDEFG', author=test_author, language=test_language)
+        cls.test_book.genre.set([Genre.objects.create(name='Fantasy')])
+        for status in 'aaaoo':
+            BookInstance.objects.create(book=cls.test_book, imprint='Unlikely Imprint, 2016', status=status)
+
+    def setUp(self):
+        # Detail pages are cached, and the cache isn't rolled back between tests.
+        cache.clear()
+
+    def test_view_url_exists_at_desired_location(self):
+        response = self.client.get('/catalog/book/{0}'.format(self.test_book.pk))
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'catalog/book_detail.html')
+
+    def test_copy_status_counts(self):
+        response = self.client.get(reverse('book-detail', args=[self.test_book.pk]))
+        self.assertEqual(response.context['copy_status_counts'], [('Available', 3), ('On loan', 2)])
+        self.assertContains(response, '3 available, 2 on loan')
+
+    def test_copies_paginated(self):
+        for copy in range(10):
+            BookInstance.objects.create(book=self.test_book, imprint='Unlikely Imprint, 2016', status='d')
+        response = self.client.get(reverse('book-detail', args=[self.test_book.pk]))
+        self.assertTrue(response.context['is_paginated'])
+        self.assertEqual(len(response.context['copy_list']), 10)
+        response = self.client.get(reverse('book-detail', args=[self.test_book.pk]) + '?page=2')
+        self.assertEqual(len(response.context['copy_list']), 5)
+
+    def test_query_count_independent_of_genres_and_copies(self):
+        url = reverse('book-detail', args=[self.test_book.pk])
+        with self.assertNumQueries(5):
+            self.client.get(url)
+
+        for number in range(5):
+            self.test_book.genre.add(Genre.objects.create(name='Genre {0}'.format(number)))
+        for copy in range(20):
+            BookInstance.objects.create(book=self.test_book, imprint='Unlikely Imprint, 2016', status='r')
+        with self.assertNumQueries(5):
+            self.client.get(url)
+
+
+class AuthorDetailViewTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_author = Author.objects.create(first_name='John', last_name='Smith')
+        cls.add_books(cls.test_author, 12)
+
+    @staticmethod
+    def add_books(author, number_of_books):
+        for number in range(number_of_books):
+            book = Book.objects.create(title='Book {0:03}'.format(number), summary='My book summary',
+                                       isbn='{0}-{1}'.format(author.pk, Book.objects.count()), author=author)
+            for status in 'aod':
+                BookInstance.objects.create(book=book, imprint='Unlikely Imprint, 2016', status=status)
+
+    def setUp(self):
+        # Detail pages are cached, and the cache isn't rolled back between tests.
+        cache.clear()
+
+    def test_books_show_copy_counts(self):
+        response = self.client.get(reverse('author-detail', args=[self.test_author.pk]))
+        self.assertEqual(response.status_code, 200)
+        book = response.context['book_list'][0]
+        self.assertEqual(book.copies_total, 3)
+        self.assertEqual(book.copies_available, 1)
+        self.assertContains(response, '(3 copies, 1 available)')
+
+    def test_books_paginated(self):
+        response = self.client.get(reverse('author-detail', args=[self.test_author.pk]))
+        self.assertTrue(response.context['is_paginated'])
+        self.assertEqual(len(response.context['book_list']), 10)
+        response = self.client.get(reverse('author-detail', args=[self.test_author.pk]) + '?page=2')
+        self.assertEqual(len(response.context['book_list']), 2)
+
+    def test_query_count_independent_of_number_of_books(self):
+        url = reverse('author-detail', args=[self.test_author.pk])
+        with self.assertNumQueries(4):
+            self.client.get(url)
+        self.add_books(self.test_author, 20)
+        with self.assertNumQueries(4):
+            self.client.get(url)
+
+
+from django.db import connection
+
+from catalog.pagination import KeysetPaginator
+from catalog.views import AuthorListView, BookListView
+
+
+class BookListViewTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        test_author = Author.objects.create(first_name='John', last_name='Smith')
+        # Books with the same title (and some without an author) to check ties and nulls are handled.
+        for number in range(25):
+            Book.objects.create(title='Book {0}'.format(number // 3), summary='My book summary',
+                                isbn='ISBN{0}'.format(number), author=test_author if number % 2 else None)
+
+    def test_keyset_pages_cover_all_books_in_order(self):
+        books = []
+        cursor = ''
+        while cursor is not None:
+            response = self.client.get(reverse('books'), {'cursor': cursor})
+            self.assertEqual(response.status_code, 200)
+            books.extend(response.context['book_list'])
+            cursor = response.context['page_obj'].next_cursor
+        self.assertEqual(len(books), 25)
+        self.assertEqual(len(set(books)), 25)
+        self.assertEqual([book.title for book in books], sorted(book.title for book in books))
+
+    def test_page_and_keyset_orders_match(self):
+        # Same-titled books are ordered by author id, then id (with the books without an author first).
+        pages = [self.client.get(reverse('books'), {'page': page}).context['book_list'] for page in (1, 2, 3)]
+        books = [book for page in pages for book in page]
+        self.assertEqual(books, list(Book.objects.order_by('title', F('author_id').asc(nulls_first=True), 'id')))
+        response = self.client.get(reverse('books'), {'cursor': ''})
+        self.assertEqual(list(response.context['book_list']), books[:10])
+
+    def test_ordering_uses_index(self):
+        # The pages are read from the keyset index in its order, without sorting the books
+        # (on PostgreSQL too, where the index orders the author NULLS FIRST: see migration 0034).
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                # The tables are too small for the planner to choose an index otherwise.
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        for view, index in ((BookListView, 'book_title_author_idx'), (AuthorListView, 'author_name_idx')):
+            for forwards in (True, False):
+                with self.subTest(view=view.__name__, forwards=forwards):
+                    plan = view.model.objects.order_by(
+                        *KeysetPaginator.order_by(view.model, view.keyset_ordering, forwards))[:10].explain()
+                    self.assertIn(index, plan)
+                    self.assertNotIn('TEMP B-TREE', plan)
+                    self.assertNotRegex(plan, r'\bSort\b')
+
+    def test_page_urls_still_work(self):
+        response = self.client.get(reverse('books') + '?page=3')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['book_list']), 5)
+
+    def test_shows_copy_counts(self):
+        book = Book.objects.order_by('title', 'author', 'id').first()
+        for status in 'aod':
+            BookInstance.objects.create(book=book, imprint='Unlikely Imprint, 2016', status=status)
+        # The counts are read with the books: no query for each book.
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('books'))
+        self.assertContains(response, '1 of 3 copies available')
+
+
+class OverdueBooksListViewTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.librarian = User.objects.create_user(username='librarian', password='2HJ1vRV0Z&3iD')
+        cls.librarian.user_permissions.add(Permission.objects.get(name='Set book as returned'))
+        cls.borrower1 = User.objects.create_user(username='borrower1', password='1X<ISRUkw+tuK')
+        cls.borrower2 = User.objects.create_user(username='borrower2', password='1X<ISRUkw+tuK')
+        book = Book.objects.create(title='Book Title', summary='My book summary', isbn='ABCDEFG')
+        last_week = datetime.date.today() - datetime.timedelta(weeks=1)
+        for number in range(12):
+            BookInstance.objects.create(book=book, imprint='Unlikely Imprint, 2016', status='o', due_back=last_week,
+                                        borrower=cls.borrower1 if number % 3 else cls.borrower2)
+        # Not overdue: due next week.
+        BookInstance.objects.create(book=book, imprint='Unlikely Imprint, 2016', status='o',
+                                    due_back=last_week + datetime.timedelta(weeks=2), borrower=cls.borrower2)
+
+    def test_forbidden_without_permission(self):
+        self.client.login(username='borrower1', password='1X<ISRUkw+tuK')
+        response = self.client.get(reverse('overdue'))
+        self.assertEqual(response.status_code, 403)
+
+    def test_lists_overdue_books_paginated(self):
+        self.client.login(username='librarian', password='2HJ1vRV0Z&3iD')
+        response = self.client.get(reverse('overdue'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'catalog/bookinstance_list_overdue.html')
+        self.assertEqual(response.context['paginator'].count, 12)
+        self.assertEqual(len(response.context['bookinstance_list']), 10)
+
+    def test_counts_per_borrower(self):
+        self.client.login(username='librarian', password='2HJ1vRV0Z&3iD')
+        response = self.client.get(reverse('overdue'))
+        self.assertEqual(list(response.context['overdue_by_borrower']), [
+            {'borrower__username': 'borrower1', 'num_overdue': 8},
+            {'borrower__username': 'borrower2', 'num_overdue': 4},
+        ])
+
+
+import csv
+import json
+
+
+class ExportCatalogViewTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.librarian = User.objects.create_user(username='librarian', password='2HJ1vRV0Z&3iD')
+        cls.librarian.user_permissions.add(Permission.objects.get(name='Set book as returned'))
+        User.objects.create_user(username='borrower', password='1X<ISRUkw+tuK')
+        test_author = Author.objects.create(first_name='John', last_name='Smith')
+        cls.test_book = Book.objects.create(title='Book, "Title"', summary='My book summary', isbn='ABCDEFG',
+                                            author=test_author)
+        BookInstance.objects.create(book=cls.test_book, imprint='Imprint', status='o', borrower=cls.librarian,
+                                    due_back=datetime.date(2022, 2, 22))
+        BookInstance.objects.create(book=cls.test_book, imprint='Imprint', status='a')
+
+    def test_forbidden_without_permission(self):
+        self.client.login(username='borrower', password='1X<ISRUkw+tuK')
+        response = self.client.get(reverse('export', args=['loans', 'csv']))
+        self.assertEqual(response.status_code, 403)
+
+    def test_unknown_export_is_404(self):
+        self.client.login(username='librarian', password='2HJ1vRV0Z&3iD')
+        response = self.client.get(reverse('export', args=['users', 'csv']))
+        self.assertEqual(response.status_code, 404)
+
+    def test_books_csv(self):
+        self.client.login(username='librarian', password='2HJ1vRV0Z&3iD')
+        response = self.client.get(reverse('export', args=['books', 'csv']))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.DictReader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['title'], 'Book, "Title"')
+        self.assertEqual(rows[0]['author__last_name'], 'Smith')
+
+    def test_loans_jsonl_only_includes_books_on_loan(self):
+        self.client.login(username='librarian', password='2HJ1vRV0Z&3iD')
+        response = self.client.get(reverse('export', args=['loans', 'jsonl']))
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['due_back'], '2022-02-22')
+        self.assertEqual(rows[0]['borrower__username'], 'librarian')
+
+
+class RenewBookInstancesBulkViewTest(TestCase):
+
+    def setUp(self):
+        test_user1 = User.objects.create_user(username='testuser1', password='1X<ISRUkw+tuK')
+        test_user2 = User.objects.create_user(username='testuser2', password='2HJ1vRV0Z&3iD')
+        test_user2.user_permissions.add(Permission.objects.get(name='Set book as returned'))
+
+        test_author = Author.objects.create(first_name='John', last_name='Smith')
+        test_book = Book.objects.create(title='Book Title', summary='My book summary', isbn='ABCDEFG',
+                                        author=test_author)
+        return_date = datetime.date.today() + datetime.timedelta(days=5)
+        self.loans = [BookInstance.objects.create(book=test_book, imprint='Unlikely Imprint, 2016',
+                                                  due_back=return_date, borrower=test_user1, status='o')
+                      for copy in range(3)]
+        self.available = BookInstance.objects.create(book=test_book, imprint='Unlikely Imprint, 2016', status='a')
+        self.url = reverse('renew-books-librarian')
+
+    def test_forbidden_if_logged_in_but_not_correct_permission(self):
+        self.client.login(username='testuser1', password='1X<ISRUkw+tuK')
+        response = self.client.post(self.url, {'copies': [self.loans[0].pk]})
+        self.assertEqual(response.status_code, 403)
+
+    def test_renews_selected_loans_in_one_update(self):
+        self.client.login(username='testuser2', password='2HJ1vRV0Z&3iD')
+        renewal_date = datetime.date.today() + datetime.timedelta(weeks=2)
+        selected = [self.loans[0].pk, self.loans[1].pk, self.available.pk, 'not-a-copy']
+        response = self.client.post(self.url, {'copies': selected, 'renewal_date': renewal_date}, follow=True)
+        self.assertRedirects(response, reverse('all-borrowed'))
+        self.assertContains(response, 'Renewed 2 loans.')
+        self.assertContains(response, '2 selected copies were not on loan, so not renewed.')
+        self.assertEqual(BookInstance.objects.filter(due_back=renewal_date).count(), 2)
+        self.assertNotEqual(BookInstance.objects.get(pk=self.loans[2].pk).due_back, renewal_date)
+        self.assertIsNone(BookInstance.objects.get(pk=self.available.pk).due_back)
+
+    def test_invalid_date_renews_nothing(self):
+        self.client.login(username='testuser2', password='2HJ1vRV0Z&3iD')
+        date_in_past = datetime.date.today() - datetime.timedelta(weeks=1)
+        response = self.client.post(self.url, {'copies': [self.loans[0].pk], 'renewal_date': date_in_past})
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'catalog/book_renew_bulk_librarian.html')
+        self.assertFormError(response, 'form', 'renewal_date', 'Invalid date - renewal in past')
+        self.assertContains(response, 'value="{0}"'.format(self.loans[0].pk))
+        self.assertFalse(BookInstance.objects.filter(due_back=date_in_past).exists())
+
+    def test_all_borrowed_page_has_checkboxes(self):
+        self.client.login(username='testuser2', password='2HJ1vRV0Z&3iD')
+        response = self.client.get(reverse('all-borrowed'))
+        self.assertContains(response, 'name="copies" value="{0}"'.format(self.loans[0].pk))
+        self.assertContains(response, 'action="{0}"'.format(self.url))
+
+
+from unittest import mock
+
+from django.core.paginator import EmptyPage
+from django.db import connection
+from django.test import override_settings
+
+from catalog.pagination import EstimatedCountPaginator
+
+
+@override_settings(CATALOG_ESTIMATED_COUNT_THRESHOLD=20)
+class EstimatedCountPaginatorTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(first_name='John', last_name='Smith')
+        Book.objects.bulk_create([Book(title='Book {0:03}'.format(number), summary='My book summary',
+                                       isbn='ISBN{0}'.format(number), author=author) for number in range(25)])
+
+    def analyze(self):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def test_exact_count_without_statistics(self):
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'")
+                if cursor.fetchone():
+                    cursor.execute('DELETE FROM sqlite_stat1')
+        paginator = EstimatedCountPaginator(Book.objects.order_by('title'), 10)
+        self.assertEqual(paginator.count, 25)
+        self.assertFalse(paginator.estimated)
+
+    def test_estimated_count(self):
+        self.analyze()
+        paginator = EstimatedCountPaginator(Book.objects.order_by('title'), 10)
+        with self.assertNumQueries(2):
+            paginator.count
+        self.assertTrue(paginator.estimated)
+
+    def test_exact_count_below_threshold(self):
+        self.analyze()
+        paginator = EstimatedCountPaginator(Book.objects.order_by('title'), 10, threshold=100)
+        self.assertEqual(paginator.count, 25)
+        self.assertFalse(paginator.estimated)
+
+    def test_last_page_corrects_count(self):
+        self.analyze()
+        paginator = EstimatedCountPaginator(Book.objects.order_by('title'), 10)
+        page = paginator.page(3)
+        self.assertEqual(len(page), 5)
+        self.assertEqual(paginator.count, 25)
+        self.assertEqual(paginator.num_pages, 3)
+        self.assertFalse(page.has_next())
+
+    def test_pages_past_low_estimate(self):
+        self.analyze()
+        paginator = EstimatedCountPaginator(Book.objects.order_by('title'), 2)
+        with mock.patch('catalog.pagination.estimate_count', return_value=20):
+            self.assertEqual(paginator.num_pages, 10)
+            self.assertTrue(paginator.page(10).has_next())
+            page = paginator.page(13)
+        self.assertEqual([book.title for book in page], ['Book 024'])
+        self.assertFalse(page.has_next())
+        self.assertEqual(paginator.count, 25)
+        self.assertFalse(paginator.estimated)
+
+    def test_page_past_last_with_estimate(self):
+        self.analyze()
+        paginator = EstimatedCountPaginator(Book.objects.order_by('title'), 10)
+        with self.assertRaises(EmptyPage):
+            paginator.page(4)
+
+    def test_book_list_shows_approximate_pages(self):
+        self.analyze()
+        response = self.client.get(reverse('books'))
+        self.assertTrue(response.context['paginator'].estimated)
+        self.assertContains(response, 'Page 1 of about')
+
+    def test_admin_changelist_shows_approximate_count(self):
+        self.analyze()
+        User.objects.create_superuser(username='admin', password='1X<ISRUkw+tuK')
+        self.client.login(username='admin', password='1X<ISRUkw+tuK')
+        response = self.client.get(reverse('admin:catalog_book_changelist'))
+        self.assertTrue(response.context['cl'].paginator.estimated)
+        self.assertContains(response, 'about {0} books'.format(response.context['cl'].result_count))
@@ -7,6 +7,7 @@ urlpatterns = [
     path('', views.index, name='index'),
     path('books/', views.BookListView.as_view(), name='books'),
     path('book/<int:pk>', views.BookDetailView.as_view(), name='book-detail'),
+    path('search/', views.BookSearchView.as_view(), name='search'),
     path('authors/', views.AuthorListView.as_view(), name='authors'),
     path('author/<int:pk>',
          views.AuthorDetailView.as_view(), name='author-detail'),
@@ -16,12 +17,22 @@ urlpatterns = [
 urlpatterns += [
     path('mybooks/', views.LoanedBooksByUserListView.as_view(), name='my-borrowed'),
     path(r'borrowed/', views.LoanedBooksAllListView.as_view(), name='all-borrowed'),  # Added for challenge
+    path('overdue/', views.OverdueBooksListView.as_view(), name='overdue'),
 ]
 
 
 # Add URLConf for librarian to renew a book.
 urlpatterns += [
     path('book/<uuid:pk>/renew/', views.renew_book_librarian, name='renew-book-librarian'),
+    path('borrowed/renew/', views.renew_books_librarian, name='renew-books-librarian'),
+]
+
+
+# Add URLConf for librarians to lend and take back copies, and for users to place holds.
+urlpatterns += [
+    path('book/<int:pk>/checkout/', views.checkout_book_librarian, name='checkout-book-librarian'),
+    path('book/<uuid:pk>/return/', views.return_book_librarian, name='return-book-librarian'),
+    path('book/<int:pk>/reserve/', views.reserve_book, name='reserve-book'),
 ]
 
 
@@ -38,3 +49,23 @@ urlpatterns += [
     path('book/<int:pk>/update/', views.BookUpdate.as_view(), name='book-update'),
     path('book/<int:pk>/delete/', views.BookDelete.as_view(), name='book-delete'),
 ]
+
+# Add URLConf for librarians to download exports of the catalog and loans.
+urlpatterns += [
+    path('export/<slug:name>.<slug:format>', views.export_catalog, name='export'),
+]
+
+# Add URLConf for staff (and Prometheus) to read the request metrics.
+urlpatterns += [
+    path('metrics/', views.request_metrics, name='metrics'),
+]
+
+# Add URLConf for the read-only JSON API.
+urlpatterns += [
+    path('api/books/', views.BookApiListView.as_view(), name='api-books'),
+    path('api/books/<int:pk>', views.BookApiDetailView.as_view(), name='api-book-detail'),
+    path('api/books/<int:pk>/copies/', views.BookCopiesApiView.as_view(), name='api-book-copies'),
+    path('api/authors/', views.AuthorApiListView.as_view(), name='api-authors'),
+    path('api/authors/<int:pk>', views.AuthorApiDetailView.as_view(), name='api-author-detail'),
+    path('api/genres/', views.GenreApiListView.as_view(), name='api-genres'),
+]
@@ -1,56 +1,189 @@
+from asgiref.sync import sync_to_async
 from django.shortcuts import render
 
 # Create your views here.
 
-from .models import Book, Author, BookInstance, Genre
+from .models import Book, Author, BookInstance, Genre, Hold, LibraryStats
+from . import visits
+from .queries import gather_queries
 
 
-def index(request):
-    """View function for home page of site."""
-    # Generate counts of some of the main objects
-    num_books = Book.objects.all().count()
-    num_instances = BookInstance.objects.all().count()
-    # Available copies of books
-    num_instances_available = BookInstance.objects.filter(status__exact='a').count()
-    num_authors = Author.objects.count()  # The 'all()' is implied by default.
+def record_visit():
+    """Counts a visit to the home page and returns today's total (see catalog.visits)."""
+    visits.counter.record()
+    return visits.counter.total()
 
-    # Number of visits to this view, as counted in the session variable.
-    num_visits = request.session.get('num_visits', 1)
-    request.session['num_visits'] = num_visits+1
 
-    # Render the HTML template index.html with the data in the context variable.
-    return render(
+async def index(request):
+    """View function for home page of site.
+
+    This is an async view: the database is read in threads, so that under ASGI the server
+    can handle other requests meanwhile.
+    """
+    # Get the counts of some of the main objects (these are maintained by catalog.stats,
+    # so this is a single lookup rather than a count of each table), and count the visit
+    # towards today's total (buffered in memory, see catalog.visits). The two are
+    # independent, so they are read at once.
+    stats, num_visits_today = await gather_queries(LibraryStats.load, record_visit)
+
+    # Number of visits to this view by this user, as counted in a signed cookie
+    # (so that counting does not need a session write on every request).
+    num_visits = request.get_signed_cookie('num_visits', default='0', salt='catalog.visits')
+    num_visits = int(num_visits) + 1 if num_visits.isdigit() else 1
+
+    # Render the HTML template index.html with the data in the context variable (in a
+    # thread, as the template reads the logged-in user from the database).
+    response = await sync_to_async(render)(
         request,
         'index.html',
-        context={'num_books': num_books, 'num_instances': num_instances,
-                 'num_instances_available': num_instances_available, 'num_authors': num_authors,
-                 'num_visits': num_visits},
+        context={'num_books': stats.num_books, 'num_instances': stats.num_instances,
+                 'num_instances_available': stats.num_instances_available, 'num_authors': stats.num_authors,
+                 'num_visits': num_visits, 'num_visits_today': num_visits_today},
     )
+    response.set_signed_cookie('num_visits', str(num_visits), salt='catalog.visits',
+                               max_age=365 * 24 * 60 * 60, httponly=True, samesite='Lax')
+    return response
 
 
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Count
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
 from django.views import generic
 
+from . import cache
+from .conditional import (author_detail_values, author_list_values, book_detail_values, book_list_values,
+                          conditional_page, genre_list_values)
+from .pagination import EstimatedCountPaginator, KeysetPaginationMixin
+from .routers import ReplicaReadMixin
+from .search import search_books
+
 
-class BookListView(generic.ListView):
-    """Generic class-based view for a list of books."""
+@conditional_page(book_list_values)
+class BookListView(ReplicaReadMixin, KeysetPaginationMixin, generic.ListView):
+    """Generic class-based view for a list of books (add ?cursor= for keyset pagination)."""
     model = Book
     paginate_by = 10
+    paginator_class = EstimatedCountPaginator
+    keyset_ordering = ('title', 'author', 'id')
+    queryset = Book.objects.select_related('author')
+
+
+class CachedDetailMixin:
+    """Caches the rendered content of a DetailView page under the object's cache version (when
+    the CATALOG_PAGE_CACHE setting is on).
+
+    The page content (`content_template_name`, rendered with the usual detail view context) is
+    looked up in the cache by object id, version and page number; the database is only queried
+    on a miss. The full page (`template_name`) is then rendered around it, so that per-user
+    parts of the page, such as the sidebar, are never cached.
+    """
+    content_template_name = None
+
+    def get(self, request, *args, **kwargs):
+        key = content = self.object = None
+        # Only cached when the cache is shared by all processes (see the CATALOG_PAGE_CACHE setting).
+        if settings.CATALOG_PAGE_CACHE:
+            page = request.GET.get('page', '1')
+            key = cache.page_key(self.model, self.kwargs[self.pk_url_kwarg], page if page.isdigit() else 1)
+            content = cache.get_page(key)
+        if content is None:
+            self.object = self.get_object()
+            content = render_to_string(self.content_template_name, self.get_context_data(object=self.object),
+                                       request)
+            if key is not None and self.is_current(self.object):
+                cache.set_page(key, content)
+        return self.render_to_response({'content': mark_safe(content), 'pk': self.kwargs[self.pk_url_kwarg]})
+
+    @staticmethod
+    def is_current(obj):
+        """Returns whether `obj` is up to date (if it was read from a replica, it may be behind).
+
+        Pages made from out-of-date data aren't cached, as they could be cached under a version
+        that has already been bumped for the newer data. Every change shown on a page updates its
+        object's `updated_at` (see catalog.conditional), so only that needs checking.
+        """
+        if obj._state.db == DEFAULT_DB_ALIAS:
+            return True
+        return type(obj).objects.using(DEFAULT_DB_ALIAS).filter(pk=obj.pk, updated_at=obj.updated_at).exists()
+
+
+@conditional_page(book_detail_values)
+class BookDetailView(ReplicaReadMixin, CachedDetailMixin, generic.DetailView):
+    """Generic class-based detail view for a book.
+
+    The book is fetched with its author, language and genres in two queries. The copies are
+    summarised by status using a database aggregate, and listed a page at a time.
+    """
+    model = Book
+    content_template_name = 'catalog/book_detail_content.html'
+    copies_paginate_by = 10
+    queryset = Book.objects.select_related('author', 'language').prefetch_related('genre')
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        copies = self.object.bookinstance_set.all()
+
+        # Count the copies in each status (e.g. "3 available, 2 on loan").
+        status_names = dict(BookInstance.LOAN_STATUS)
+        status_counts = copies.order_by('status').values_list('status').annotate(count=Count('id'))
+        context['copy_status_counts'] = [(status_names.get(status, 'Unknown'), count)
+                                         for status, count in status_counts]
+
+        paginator = Paginator(copies.order_by('due_back', 'id'), self.copies_paginate_by)
+        # The total is already known from the status counts, so don't count the copies again.
+        paginator.count = sum(count for status, count in context['copy_status_counts'])
+        page = paginator.get_page(self.request.GET.get('page'))
+        context.update({'paginator': paginator, 'page_obj': page, 'is_paginated': page.has_other_pages(),
+                        'copy_list': page.object_list})
+        return context
+
+
+class BookSearchView(generic.ListView):
+    """Generic class-based list view of the books matching a search query (?q=), best matches first."""
+    template_name = 'catalog/book_search.html'
+    context_object_name = 'book_list'
+    paginate_by = 10
 
+    def get_queryset(self):
+        return search_books(self.request.GET.get('q', ''))
 
-class BookDetailView(generic.DetailView):
-    """Generic class-based detail view for a book."""
-    model = Book
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['query'] = self.request.GET.get('q', '')
+        return context
 
 
-class AuthorListView(generic.ListView):
-    """Generic class-based list view for a list of authors."""
+@conditional_page(author_list_values)
+class AuthorListView(ReplicaReadMixin, KeysetPaginationMixin, generic.ListView):
+    """Generic class-based list view for a list of authors (add ?cursor= for keyset pagination)."""
     model = Author
     paginate_by = 10
+    paginator_class = EstimatedCountPaginator
+    keyset_ordering = ('last_name', 'first_name', 'id')
+
 
+@conditional_page(author_detail_values)
+class AuthorDetailView(ReplicaReadMixin, CachedDetailMixin, generic.DetailView):
+    """Generic class-based detail view for an author.
 
-class AuthorDetailView(generic.DetailView):
-    """Generic class-based detail view for an author."""
+    The author's books are listed a page at a time, with their (stored) numbers of copies.
+    """
     model = Author
+    content_template_name = 'catalog/author_detail_content.html'
+    books_paginate_by = 10
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        books = self.object.book_set.order_by('title', 'id')
+
+        paginator = Paginator(books, self.books_paginate_by)
+        page = paginator.get_page(self.request.GET.get('page'))
+        context.update({'paginator': paginator, 'page_obj': page, 'is_paginated': page.has_other_pages(),
+                        'book_list': page.object_list})
+        return context
 
 
 from django.contrib.auth.mixins import LoginRequiredMixin
@@ -61,13 +194,24 @@ class LoanedBooksByUserListView(LoginRequiredMixin, generic.ListView):
     model = BookInstance
     template_name = 'catalog/bookinstance_list_borrowed_user.html'
     paginate_by = 10
+    paginator_class = EstimatedCountPaginator
 
     def get_queryset(self):
-        return BookInstance.objects.filter(borrower=self.request.user).filter(status__exact='o').order_by('due_back')
+        return (BookInstance.objects.filter(borrower=self.request.user).filter(status__exact='o')
+                .select_related('book').order_by('due_back'))
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # The user's holds, with the copies reserved for them.
+        context['hold_list'] = Hold.objects.filter(borrower=self.request.user).select_related('book', 'copy')
+        return context
 
 
 # Added as part of challenge!
 from django.contrib.auth.mixins import PermissionRequiredMixin
+import datetime
+
+from .forms import RenewBookForm
 
 
 class LoanedBooksAllListView(PermissionRequiredMixin, generic.ListView):
@@ -76,9 +220,38 @@ class LoanedBooksAllListView(PermissionRequiredMixin, generic.ListView):
     permission_required = 'catalog.can_mark_returned'
     template_name = 'catalog/bookinstance_list_borrowed_all.html'
     paginate_by = 10
+    paginator_class = EstimatedCountPaginator
 
     def get_queryset(self):
-        return BookInstance.objects.filter(status__exact='o').order_by('due_back')
+        return BookInstance.objects.filter(status__exact='o').select_related('book', 'borrower').order_by('due_back')
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # Form for renewing the loans selected on the page (see renew_books_librarian).
+        context['renew_form'] = RenewBookForm(
+            initial={'renewal_date': datetime.date.today() + datetime.timedelta(weeks=3)})
+        return context
+
+
+class OverdueBooksListView(PermissionRequiredMixin, generic.ListView):
+    """Generic class-based view listing overdue loans, with the number overdue per borrower.
+    Only visible to users with can_mark_returned permission."""
+    model = BookInstance
+    permission_required = 'catalog.can_mark_returned'
+    template_name = 'catalog/bookinstance_list_overdue.html'
+    paginate_by = 10
+    # Number of borrowers to show in the per-borrower summary (those with most overdue books first).
+    borrowers_shown = 20
+
+    def get_queryset(self):
+        return BookInstance.objects.overdue().select_related('book', 'borrower').order_by('due_back', 'id')
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['overdue_by_borrower'] = (
+            BookInstance.objects.overdue().values('borrower__username')
+            .annotate(num_overdue=Count('id')).order_by('-num_overdue', 'borrower__username')[:self.borrowers_shown])
+        return context
 
 
 from django.shortcuts import get_object_or_404
@@ -125,6 +298,119 @@ def renew_book_librarian(request, pk):
     return render(request, 'catalog/book_renew_librarian.html', context)
 
 
+from django.contrib import messages
+
+
+@login_required
+@permission_required('catalog.can_mark_returned', raise_exception=True)
+def renew_books_librarian(request):
+    """View function for renewing many loans at once (the copies selected on the all borrowed page)."""
+    copy_ids = request.POST.getlist('copies') if request.method == 'POST' else request.GET.getlist('copies')
+
+    if request.method == 'POST':
+        form = RenewBookForm(request.POST)
+
+        # The date is validated once, and then applied to all the selected copies in one UPDATE.
+        if form.is_valid():
+            renewed, rejected = BookInstance.objects.renew(copy_ids, form.cleaned_data['renewal_date'])
+            messages.success(request, 'Renewed {0} loan{1}.'.format(renewed, '' if renewed == 1 else 's'))
+            if rejected:
+                messages.warning(request, '{0} selected cop{1} not on loan, so not renewed.'.format(
+                    rejected, 'y was' if rejected == 1 else 'ies were'))
+            return HttpResponseRedirect(reverse('all-borrowed'))
+
+    else:
+        proposed_renewal_date = datetime.date.today() + datetime.timedelta(weeks=3)
+        form = RenewBookForm(initial={'renewal_date': proposed_renewal_date})
+
+    context = {
+        'form': form,
+        'copy_ids': copy_ids,
+    }
+
+    return render(request, 'catalog/book_renew_bulk_librarian.html', context)
+
+
+from . import loans
+from .forms import CheckoutForm
+
+
+@login_required
+@permission_required('catalog.can_mark_returned', raise_exception=True)
+def checkout_book_librarian(request, pk):
+    """View function for a librarian to lend a copy of a book (the one reserved for the borrower, if any)."""
+    book = get_object_or_404(Book, pk=pk)
+
+    if request.method == 'POST':
+        form = CheckoutForm(request.POST)
+        if form.is_valid():
+            try:
+                copy = loans.checkout(book, form.cleaned_data['borrower'], form.cleaned_data['due_back'])
+            except loans.LoanError as error:
+                form.add_error(None, str(error))
+            else:
+                messages.success(request, 'Lent copy {0} to {1}, due back {2}.'.format(
+                    copy.pk, form.cleaned_data['borrower'], copy.due_back))
+                return HttpResponseRedirect(book.get_absolute_url())
+
+    else:
+        form = CheckoutForm(initial={'due_back': datetime.date.today() + loans.LOAN_PERIOD})
+
+    context = {
+        'form': form,
+        'book': book,
+    }
+
+    return render(request, 'catalog/book_checkout_librarian.html', context)
+
+
+@login_required
+@permission_required('catalog.can_mark_returned', raise_exception=True)
+def return_book_librarian(request, pk):
+    """View function for a librarian to mark a copy as returned (reserving it for the next hold, if any)."""
+    book_instance = get_object_or_404(BookInstance.objects.select_related('book', 'borrower'), pk=pk)
+
+    if request.method == 'POST':
+        try:
+            hold = loans.return_copy(book_instance)
+        except loans.LoanError as error:
+            messages.error(request, str(error))
+        else:
+            if hold is None:
+                messages.success(request, 'Returned copy {0}, which is now available.'.format(book_instance.pk))
+            else:
+                messages.success(request, 'Returned copy {0}, which is now reserved for {1}.'.format(
+                    book_instance.pk, hold.borrower))
+        return HttpResponseRedirect(reverse('all-borrowed'))
+
+    return render(request, 'catalog/book_return_librarian.html', {'book_instance': book_instance})
+
+
+@login_required
+def reserve_book(request, pk):
+    """View function for a user to place a hold on a book."""
+    book = get_object_or_404(Book, pk=pk)
+
+    if request.method == 'POST':
+        try:
+            hold = loans.place_hold(book, request.user)
+        except loans.LoanError as error:
+            messages.error(request, str(error))
+        else:
+            if hold.copy_id is None:
+                messages.success(request, 'You are in the queue for "{0}".'.format(book))
+            else:
+                messages.success(request, 'A copy of "{0}" is reserved for you.'.format(book))
+        return HttpResponseRedirect(reverse('my-borrowed'))
+
+    context = {
+        'book': book,
+        'waiting': Hold.objects.waiting().filter(book=book).count(),
+    }
+
+    return render(request, 'catalog/book_reserve.html', context)
+
+
 from django.views.generic.edit import CreateView, UpdateView, DeleteView
 from django.urls import reverse_lazy
 from .models import Author
@@ -166,3 +452,93 @@ class BookDelete(PermissionRequiredMixin, DeleteView):
     model = Book
     success_url = reverse_lazy('books')
     permission_required = 'catalog.can_mark_returned'
+
+
+from django.http import Http404, StreamingHttpResponse
+
+from . import exports
+
+
+@login_required
+@permission_required('catalog.can_mark_returned', raise_exception=True)
+def export_catalog(request, name, format):
+    """View function streaming an export of the books or loans (as CSV or JSON Lines) to a librarian."""
+    if name not in exports.EXPORTS or format not in exports.FORMATS:
+        raise Http404('No such export.')
+    response = StreamingHttpResponse(exports.export_lines(name, format), content_type=exports.FORMATS[format])
+    response['Content-Disposition'] = 'attachment; filename="{0}.{1}"'.format(name, format)
+    return response
+
+
+from . import api
+
+
+class ApiView(generic.View):
+    """Base view of the JSON API (see catalog/api.py), showing a list or (with a pk) one object of `resource`."""
+    resource = None
+
+    def get_queryset(self):
+        return self.resource.get_queryset()
+
+    def get(self, request, pk=None):
+        if pk is None:
+            return api.list_response(request, self.resource, self.get_queryset())
+        return api.detail_response(request, self.resource, self.get_queryset(), pk)
+
+
+@conditional_page(book_list_values)
+class BookApiListView(ReplicaReadMixin, ApiView):
+    resource = api.BOOKS
+
+
+@conditional_page(book_detail_values)
+class BookApiDetailView(ReplicaReadMixin, ApiView):
+    resource = api.BOOKS
+
+
+@conditional_page(book_detail_values)
+class BookCopiesApiView(ReplicaReadMixin, ApiView):
+    """The copies of a book (which the book itself only embeds the first of)."""
+    resource = api.COPIES
+
+    def get(self, request, pk):
+        if not Book.objects.filter(pk=pk).exists():
+            return api.json_response({'error': 'Not found.'}, status=404)
+        return api.list_response(request, self.resource, self.get_queryset().filter(book_id=pk))
+
+
+@conditional_page(author_list_values)
+class AuthorApiListView(ReplicaReadMixin, ApiView):
+    resource = api.AUTHORS
+
+
+@conditional_page(author_detail_values)
+class AuthorApiDetailView(ReplicaReadMixin, ApiView):
+    resource = api.AUTHORS
+
+
+@conditional_page(genre_list_values)
+class GenreApiListView(ReplicaReadMixin, ApiView):
+    resource = api.GENRES
+
+
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import HttpResponse
+
+from . import metrics
+
+
+@staff_member_required
+def request_metrics(request):
+    """View function showing the request latency histograms and page cache counts to staff, for Prometheus."""
+    stats = cache.cache_stats()
+    lines = [
+        metrics.registry.render(),
+        '# HELP catalog_page_cache_hits_total Book and author pages served from the cache.',
+        '# TYPE catalog_page_cache_hits_total counter',
+        'catalog_page_cache_hits_total {0}'.format(stats['hits']),
+        '# HELP catalog_page_cache_misses_total Book and author pages rendered because they were not cached.',
+        '# TYPE catalog_page_cache_misses_total counter',
+        'catalog_page_cache_misses_total {0}'.format(stats['misses']),
+    ]
+    return HttpResponse('\n'.join(lines) + '\n', content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,77 @@
+"""Count home page visits without writing to the database on every request.
+
+Visits are added up in process memory and written to DailyVisits in one
+UPDATE per day once VISIT_FLUSH_THRESHOLD visits are pending, or once
+VISIT_FLUSH_INTERVAL seconds have passed since the last write. Each process
+(e.g. each gunicorn worker) keeps its own buffer, so the totals read back
+include only this process's pending visits; the rest show up after the next
+flush. Anything still pending when the process exits is flushed then.
+"""
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.models import F
+from django.utils import timezone
+
+from .models import DailyVisits
+
+
+class VisitCounter:
+    """Buffers visit counts per day and flushes them to DailyVisits in bulk."""
+
+    def __init__(self, threshold=None, interval=None):
+        self.threshold = threshold or getattr(settings, 'VISIT_FLUSH_THRESHOLD', 100)
+        self.interval = interval or getattr(settings, 'VISIT_FLUSH_INTERVAL', 60)
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._last_flush = time.monotonic()
+
+    def record(self, day=None):
+        """Counts one visit on `day` (default today), flushing the buffer if it is due."""
+        day = day or timezone.localdate()
+        with self._lock:
+            self._pending[day] = self._pending.get(day, 0) + 1
+            due = (sum(self._pending.values()) >= self.threshold
+                   or time.monotonic() - self._last_flush >= self.interval)
+        if due:
+            self.flush()
+
+    def pending(self, day=None):
+        """Returns the number of visits on `day` (default today) not yet written to the database."""
+        with self._lock:
+            return self._pending.get(day or timezone.localdate(), 0)
+
+    def flush(self):
+        """Writes all pending visits to the database."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+        for day, count in pending.items():
+            if not DailyVisits.objects.filter(date=day).update(count=F('count') + count):
+                visits, created = DailyVisits.objects.get_or_create(date=day, defaults={'count': count})
+                if not created:
+                    # Another process created the row since our update.
+                    DailyVisits.objects.filter(date=day).update(count=F('count') + count)
+
+    def total(self, day=None):
+        """Returns the total visits on `day` (default today), including this process's pending visits."""
+        day = day or timezone.localdate()
+        stored = DailyVisits.objects.filter(date=day).values_list('count', flat=True).first() or 0
+        return stored + self.pending(day)
+
+
+logger = logging.getLogger(__name__)
+
+counter = VisitCounter()
+
+
+@atexit.register
+def flush_at_exit():
+    try:
+        counter.flush()
+    except DatabaseError:
+        logger.warning('Could not save pending visit counts at exit', exc_info=True)
@@ -0,0 +1,35 @@
+"""Gunicorn settings (gunicorn reads this file from the directory it's started in).
+
+Set SERVER_INTERFACE=asgi to serve the site through locallibrary/asgi.py with uvicorn's
+workers, so that a worker can handle other requests while async views (such as the home
+page) wait for the database. By default the site is served through locallibrary/wsgi.py.
+The number of workers is set by $WEB_CONCURRENCY (or gunicorn's --workers option).
+
+The application is loaded once, in the master process, which checks that the database
+is migrated and warms the application up (see catalog/startup.py) before forking the
+workers. Set GUNICORN_PRELOAD=False to have each worker load the application itself
+(for example to reload code with --reload).
+"""
+import os
+import sys
+
+if os.environ.get('SERVER_INTERFACE', 'wsgi') == 'asgi':
+    wsgi_app = 'locallibrary.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    wsgi_app = 'locallibrary.wsgi:application'
+
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'True') == 'True'
+
+
+def on_starting(server):
+    """Prepares the preloaded application before any worker is forked."""
+    if not preload_app:
+        return
+    from catalog import startup
+
+    try:
+        startup.prepare()
+    except RuntimeError as error:
+        server.log.error(str(error))
+        sys.exit(1)
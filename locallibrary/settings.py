@@ -49,6 +49,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Times requests (first, so it includes the other middleware), for the Server-Timing header
+    # and the metrics page (see catalog/metrics.py).
+    'catalog.middleware.RequestMetricsMiddleware',
+    # Reads from the primary database for a while after a user writes (see catalog/routers.py).
+    'catalog.middleware.ReplicaPinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -63,7 +68,8 @@ ROOT_URLCONF = 'locallibrary.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # Django's template backend, also timing templates for the request metrics.
+        'BACKEND': 'catalog.metrics.DjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -90,6 +96,18 @@ DATABASES = {
     }
 }
 
+# When the database is SQLite, each connection is tuned for several processes reading and
+# writing at once (see catalog/sqlite.py). Set SQLITE_TUNING=False to use SQLite's defaults.
+SQLITE_TUNING = os.environ.get('SQLITE_TUNING', 'True') == 'True'
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000)),  # milliseconds
+    'mmap_size': 256 * 1024 * 1024,  # bytes
+    'cache_size': -32 * 1024,  # negative: in KiB
+} if SQLITE_TUNING else {}
+SQLITE_TRANSACTION_MODE = 'IMMEDIATE' if SQLITE_TUNING else None
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
@@ -126,6 +144,40 @@ USE_TZ = True
 # Redirect to home URL after login (Default redirects to /accounts/profile/)
 LOGIN_REDIRECT_URL = '/'
 
+# Cache (used for the book and author detail pages, see catalog/cache.py).
+# Set REDIS_URL when running more than one process (e.g. several gunicorn workers), so that
+# all processes share one cache (this needs the "redis" package). Otherwise a local memory
+# cache is used.
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+
+# Cache the rendered book and author detail pages. This is only on by default with REDIS_URL:
+# with the local memory cache each process has its own copy of a page, and keeps serving it
+# after a change made in another process (set CATALOG_PAGE_CACHE=True anyway for a single
+# process, or another cache shared by all processes, such as the database cache).
+CATALOG_PAGE_CACHE = os.environ.get('CATALOG_PAGE_CACHE', str(bool(os.environ.get('REDIS_URL')))) == 'True'
+
+# How long (in seconds) rendered detail pages are kept in the cache.
+CATALOG_CACHE_TIMEOUT = int(os.environ.get('CATALOG_CACHE_TIMEOUT', 3600))
+
+# Home page visits are buffered in memory and written to the database in bulk
+# once this many are pending, or after this many seconds (see catalog/visits.py).
+VISIT_FLUSH_THRESHOLD = int(os.environ.get('VISIT_FLUSH_THRESHOLD', 100))
+VISIT_FLUSH_INTERVAL = int(os.environ.get('VISIT_FLUSH_INTERVAL', 60))
+
+# Paginated lists whose row count the database estimates at this or more use the estimate
+# rather than counting the rows exactly (see catalog/pagination.py).
+CATALOG_ESTIMATED_COUNT_THRESHOLD = int(os.environ.get('CATALOG_ESTIMATED_COUNT_THRESHOLD', 10000))
+
+# Send the time each request spent on SQL queries, templates and other code in a Server-Timing
+# header (shown in the browser's developer tools).
+CATALOG_SERVER_TIMING = os.environ.get('CATALOG_SERVER_TIMING', 'True') == 'True'
+
 # Add to test email:
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
@@ -136,6 +188,22 @@ import dj_database_url
 db_from_env = dj_database_url.config(conn_max_age=500)
 DATABASES['default'].update(db_from_env)
 
+# Read replicas of the database, from the comma-separated URLs in $REPLICA_DATABASE_URLS (if
+# defined). The catalog's book and author pages read from them (see catalog/routers.py).
+REPLICA_DATABASES = []
+for number, url in enumerate(filter(None, os.environ.get('REPLICA_DATABASE_URLS', '').split(',')), start=1):
+    alias = 'replica{0}'.format(number)
+    DATABASES[alias] = dj_database_url.parse(url, conn_max_age=500)
+    # Tests use the test database for the replicas too.
+    DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+    REPLICA_DATABASES.append(alias)
+
+DATABASE_ROUTERS = ['catalog.routers.ReplicaRouter']
+
+# After writing to the database, a user reads only from the primary database for this many
+# seconds, so they see their changes even if the replicas are behind.
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', 10))
+
 
 
 # Static files (CSS, JavaScript, Images)